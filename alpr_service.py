@@ -0,0 +1,230 @@
+# alpr_service.py
+"""
+ALPR Service - 1 luồng suy luận ALPR dùng chung, gom batch động
+================================================================
+
+Trước đây plate_detector_post bị gọi ĐỒNG THỜI từ nhiều thread (proactive,
+realtime, violation, alpr_worker_thread), mỗi lần 1 ảnh ALPR.predict,
+không phối hợp → tranh nhau model, không batch được.
+
+NGUYÊN TẮC:
+✅ 1 thread duy nhất sở hữu model, caller submit ảnh và nhận Future
+✅ Gom các ảnh đang chờ thành batch (tối đa max_batch, chờ tối đa max_wait_ms)
+   → detect_batch(): OCR 1 lượt cho mọi plate crop của batch
+✅ Hàng đợi ưu tiên: xác nhận vi phạm chen trước quét proactive
+✅ Job ocr_only (crop biển số plate_tracker đã định vị) → recognize_batch(),
+   bỏ qua plate detector
+✅ stop() trả lỗi cho mọi job còn chờ, detect() luôn có timeout → caller không treo
+✅ Thống kê số batch / ảnh / batch size trung bình theo từng mức ưu tiên
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Số nhỏ = ưu tiên cao
+PRIORITY_VIOLATION = 0   # violation_worker: xác nhận biển số trước khi lưu
+PRIORITY_REALTIME = 1    # alpr_realtime_worker: xe vừa vi phạm
+PRIORITY_PROACTIVE = 2   # plate_cache: đọc trước khi vi phạm
+PRIORITY_BACKGROUND = 3  # alpr_worker_thread: xử lý lại ảnh đã lưu
+
+PRIORITY_NAMES = {
+    PRIORITY_VIOLATION: 'violation',
+    PRIORITY_REALTIME: 'realtime',
+    PRIORITY_PROACTIVE: 'proactive',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+
+class AlprServiceStopped(RuntimeError):
+    """Service đã dừng - job không được xử lý"""
+
+
+class AlprService:
+    """
+    Service ALPR in-process: submit(image, priority) → Future[list biển số]
+    """
+
+    def __init__(self, plate_detector, max_batch=8, max_wait_ms=5, max_pending=256, timeout=10.0):
+        """
+        Args:
+            plate_detector: PlateDetector / EnhancedPlateDetector (detect, detect_batch nếu có)
+            max_batch: Số ảnh tối đa / batch
+            max_wait_ms: Thời gian chờ tối đa để gom thêm ảnh vào batch
+            max_pending: Số job chờ tối đa (vượt → submit non-blocking raise queue.Full)
+            timeout: Thời gian chờ mặc định của detect() (giây)
+        """
+        self.plate_detector = plate_detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self._queue = queue.PriorityQueue(maxsize=max_pending)
+        self._seq = itertools.count()  # FIFO trong cùng mức ưu tiên
+        self._thread = None
+        self._running = False
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.images = 0
+        self.ocr_only = 0
+        self.submitted = {priority: 0 for priority in PRIORITY_NAMES}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name='alpr-service')
+        self._thread.start()
+        print(f"[ALPR SERVICE] ✅ Started (max_batch={self.max_batch}, max_wait={self.max_wait * 1000:.0f}ms)")
+
+    def stop(self, timeout=2.0):
+        """Dừng thread, mọi job còn trong hàng đợi nhận AlprServiceStopped"""
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._drain()
+
+    def _drain(self):
+        """Trả lỗi cho các job còn chờ (không để caller chờ Future mãi)"""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            future = job[3]
+            if future.set_running_or_notify_cancel():
+                future.set_exception(AlprServiceStopped("ALPR service stopped"))
+
+    def submit(self, image, priority=PRIORITY_PROACTIVE, block=False, timeout=None,
+               ocr_only=False, score=1.0):
+        """
+        Đưa 1 ảnh vào hàng đợi
+
+        Args:
+            image: ndarray BGR (view read-only cũng được, service không ghi)
+            priority: PRIORITY_*
+            block, timeout: Chờ chỗ trống khi hàng đợi đầy
+            ocr_only: image là crop biển số đã định vị → chỉ chạy OCR
+            score: Độ tin cậy vị trí crop biển số (ocr_only)
+
+        Returns:
+            Future - result() là list dict biển số như plate_detector.detect()
+
+        Raises:
+            queue.Full nếu hàng đợi đầy (block=False)
+            AlprServiceStopped nếu service đã dừng
+        """
+        if not self._running:
+            raise AlprServiceStopped("ALPR service is not running")
+        future = Future()
+        self._queue.put((priority, next(self._seq), image, future, ocr_only, score),
+                        block=block, timeout=timeout)
+        if not self._running:
+            # stop() chạy trong lúc put → job có thể lọt sau lần drain của stop()
+            self._drain()
+        with self._stats_lock:
+            self.submitted[priority] = self.submitted.get(priority, 0) + 1
+        return future
+
+    def detect(self, image, priority=PRIORITY_REALTIME, timeout=None):
+        """
+        Submit + chờ kết quả (cho caller đồng bộ)
+
+        Args:
+            timeout: Chờ tối đa (giây) cho cả chỗ trống trong hàng đợi lẫn kết quả
+                (None = self.timeout)
+
+        Raises:
+            TimeoutError nếu quá timeout (job bị huỷ nếu chưa chạy)
+            AlprServiceStopped nếu service dừng trước khi xử lý job
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        try:
+            future = self.submit(image, priority, block=True, timeout=timeout)
+        except queue.Full:
+            raise TimeoutError(f"ALPR queue full for {timeout:.1f}s")
+        try:
+            return future.result(timeout=max(0.0, deadline - time.time()))
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"ALPR result not ready after {timeout:.1f}s")
+
+    def _collect_batch(self):
+        """Job ưu tiên cao nhất + các job đang chờ (trong max_wait) tới max_batch"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect_batch()
+            # Bỏ job đã bị caller huỷ
+            batch = [job for job in batch if job[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            full = [job for job in batch if not job[4]]
+            plates = [job for job in batch if job[4]]
+            try:
+                results = self._detect(full) + self._recognize(plates)
+            except Exception as e:
+                print(f"[ALPR SERVICE] ❌ Batch of {len(batch)} failed: {e}")
+                for job in batch:
+                    job[3].set_exception(e)
+                continue
+
+            for job, result in zip(full + plates, results):
+                job[3].set_result(result)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.images += len(batch)
+                self.ocr_only += len(plates)
+
+        self._drain()
+        print(f"[ALPR SERVICE] 🛑 Stopped - {self.get_stats()}")
+
+    def _detect(self, jobs):
+        """Plate detector + OCR cho ảnh xe"""
+        if not jobs:
+            return []
+        images = [job[2] for job in jobs]
+        if hasattr(self.plate_detector, 'detect_batch'):
+            return self.plate_detector.detect_batch(images)
+        return [self.plate_detector.detect(image) for image in images]
+
+    def _recognize(self, jobs):
+        """Chỉ OCR cho crop biển số đã định vị (detector không hỗ trợ → detect đầy đủ)"""
+        if not jobs:
+            return []
+        if not hasattr(self.plate_detector, 'recognize_batch'):
+            return self._detect(jobs)
+        return self.plate_detector.recognize_batch([job[2] for job in jobs], [job[5] for job in jobs])
+
+    def get_stats(self):
+        """Số batch / ảnh / batch size trung bình, số ảnh chỉ OCR, số job theo mức ưu tiên, số job đang chờ"""
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'images': self.images,
+                'avg_batch_size': self.images / self.batches if self.batches else 0.0,
+                'ocr_only': self.ocr_only,
+                'pending': self._queue.qsize(),
+                'submitted': {PRIORITY_NAMES.get(p, p): n for p, n in self.submitted.items()},
+            }
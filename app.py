@@ -8,7 +8,7 @@ import os
 import re
 import requests
 import threading
-from collections import deque, Counter
+from collections import deque
 import queue
 from datetime import datetime, timezone, timedelta
 
@@ -16,6 +16,22 @@ from combined_detector import CombinedDetector
 from speed_tracker import SpeedTracker
 from detector import PlateDetector
 from video_reader import OfflineVideoReader
+from motion_gate import MotionGate
+from roi import load_roi_config, get_source_roi
+from calibration import load_calibration_config, get_source_calibration
+from speed_trap import load_speed_trap_config, get_source_speed_trap
+from violation_decider import ViolationDecider
+from track_events import TRACK_LOST, TRACK_REMOVED
+from track_table import TrackTable
+from ttl_store import TTLStore
+from plate_cache import PlateCache
+from plate_quality import PlateQualityGate, KIND_VEHICLE
+from plate_tracker import PlateTracker
+from alpr_service import (AlprService, AlprServiceStopped, PRIORITY_VIOLATION, PRIORITY_REALTIME,
+                          PRIORITY_PROACTIVE, PRIORITY_BACKGROUND)
+from frame_ring import FrameRing
+from model_registry import registry as model_registry
+from frame_store import FrameStore, as_array
 from violation_saver import save_violation_evidence
 
 # Thử import Enhanced Plate Detector (có fallback)
@@ -105,13 +121,13 @@ video_fps = 30
 is_video_upload_mode = False
 cap_lock = threading.Lock()
 
-last_violation_time = {}
 VIOLATION_COOLDOWN = 5  # Tăng lên 15 giây để tránh trùng vi phạm
+# cooldown_key -> thời điểm vi phạm gần nhất, tự hết hạn sau VIOLATION_COOLDOWN (RAM không tăng mãi)
+last_violation_time = TTLStore(ttl=VIOLATION_COOLDOWN, capacity=4096)
 
-# Track active vehicles to buffer frames
-active_tracks = {}  # track_id -> last_seen_time
-active_tracks_lock = threading.Lock()
+# Track active vehicles to buffer frames (state theo track: xem track_table)
 TRACK_TIMEOUT = 10.0  # Remove tracks không thấy sau 10s
+VIOLATION_BUFFER_TIMEOUT = 5.0  # Bỏ clip vi phạm không được update sau 5s
 
 def can_save_violation(track_id, plate=None):
     """
@@ -130,15 +146,13 @@ def can_save_violation(track_id, plate=None):
     else:
         cooldown_key = f"track_{track_id}"
 
-    if cooldown_key not in last_violation_time:
-        last_violation_time[cooldown_key] = current_time
-        return True
-
-    time_since_last = current_time - last_violation_time[cooldown_key]
-    if time_since_last >= VIOLATION_COOLDOWN:
-        last_violation_time[cooldown_key] = current_time
+    # Key hết hạn sau VIOLATION_COOLDOWN → còn trong store = đang cooldown
+    last_time = last_violation_time.get(cooldown_key)
+    if last_time is None:
+        last_violation_time.set(cooldown_key, current_time)
         return True
     else:
+        time_since_last = current_time - last_time
         print(f"[ANTI-DUPLICATE] ⏳ {'Biển số ' + plate if plate else 'Track ' + str(track_id)} đã vi phạm {time_since_last:.1f}s trước, bỏ qua (cooldown: {VIOLATION_COOLDOWN}s)")
         return False
 def calculate_blur_score(image):
@@ -188,7 +202,8 @@ def select_best_frame(frames, bbox, weights={'blur': 0.4, 'size': 0.3, 'position
 
     for frame in frames:
         try:
-            crop = frame[int(y1):int(y2), int(x1):int(x2)]
+            frame_arr = as_array(frame)
+            crop = frame_arr[int(y1):int(y2), int(x1):int(x2)]
             if crop.size == 0:
                 continue
 
@@ -197,8 +212,8 @@ def select_best_frame(frames, bbox, weights={'blur': 0.4, 'size': 0.3, 'position
 
             center_x = (x1 + x2) / 2
             center_y = (y1 + y2) / 2
-            frame_center_x = frame.shape[1] / 2
-            frame_center_y = frame.shape[0] / 2
+            frame_center_x = frame_arr.shape[1] / 2
+            frame_center_y = frame_arr.shape[0] / 2
             dist = ((center_x - frame_center_x)**2 + (center_y - frame_center_y)**2)**0.5
             position_score = 1.0 / (1.0 + dist / 100)
 
@@ -216,46 +231,6 @@ def select_best_frame(frames, bbox, weights={'blur': 0.4, 'size': 0.3, 'position
 
     return max(scores, key=lambda x: x[0])[1]
 
-def ensemble_plate_results(results, min_confidence=0.7, min_votes=2):
-    """Voting mechanism cho ALPR results"""
-    if not results:
-        return None
-
-    votes = Counter()
-    confidence_map = {}
-
-    for r in results:
-        if not r or 'text' not in r:
-            continue
-
-        normalized = normalize_plate(r['text'])
-        if not normalized:
-            continue
-
-        votes[normalized] += 1
-
-        if normalized not in confidence_map:
-            confidence_map[normalized] = []
-        confidence_map[normalized].append(r.get('confidence', 0))
-
-    if not votes:
-        return None
-
-    best_plate, vote_count = votes.most_common(1)[0]
-
-    if vote_count < min_votes:
-        return None
-
-    avg_confidence = sum(confidence_map[best_plate]) / len(confidence_map[best_plate])
-    if avg_confidence < min_confidence:
-        return None
-
-    return {
-        'text': best_plate,
-        'confidence': avg_confidence,
-        'votes': vote_count
-    }
-
 # GPU Detection and Device Configuration
 try:
     import torch
@@ -301,8 +276,121 @@ except Exception as e:
 detector = None
 tracker = None
 plate_detector_post = None
+alpr_service = None  # Thread duy nhất gọi plate_detector_post (batch + ưu tiên), xem init_detector()
 speed_limit = 40
 
+# Tracker backend tách khỏi model: 'ocsort' (mặc định), 'bytetrack', 'ultralytics'
+TRACKER_BACKEND = os.getenv('TRACKER_BACKEND', 'ocsort')
+
+# Batched YOLO inference cho video upload (throughput quan trọng hơn độ trễ)
+DETECTION_BATCH_SIZE = int(os.getenv('DETECTION_BATCH_SIZE', '8' if DEVICE == 'cpu' else '4'))
+DETECTION_BATCH_TIMEOUT_MS = float(os.getenv('DETECTION_BATCH_TIMEOUT_MS', '50'))
+
+# Mask trong detection: 'none' (model detection-only), 'local' (bbox-local), 'rle' (nén)
+DETECTION_MASK_MODE = os.getenv('DETECTION_MASK_MODE', 'rle')
+
+# Motion gate: bỏ qua detection khi khung hình đứng yên, ép detection mỗi K frame (mặc định TẮT - opt-in)
+MOTION_GATE_ENABLED = os.getenv('MOTION_GATE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+MOTION_GATE_MIN_RATIO = float(os.getenv('MOTION_GATE_MIN_RATIO', '0.002'))
+MOTION_GATE_FORCE_EVERY = int(os.getenv('MOTION_GATE_FORCE_EVERY', '10'))
+motion_gate = MotionGate(
+    min_motion_ratio=MOTION_GATE_MIN_RATIO,
+    force_every=MOTION_GATE_FORCE_EVERY
+) if MOTION_GATE_ENABLED else None
+
+# ROI polygon theo nguồn (tên file video / 'camera' / 'default') - giới hạn detection + ALPR
+ROI_CONFIG_PATH = os.getenv('ROI_CONFIG_PATH', 'roi_config.json')
+roi_config = load_roi_config(ROI_CONFIG_PATH)
+current_roi = None
+if roi_config:
+    print(f"✅ ROI config loaded: {ROI_CONFIG_PATH} ({len(roi_config)} sources)")
+
+# Homography calibration theo nguồn (4 cặp điểm ảnh <-> mặt đất) - thay pixel_to_meter
+CALIBRATION_CONFIG_PATH = os.getenv('CALIBRATION_CONFIG_PATH', 'calibration.json')
+calibration_config = load_calibration_config(CALIBRATION_CONFIG_PATH)
+if calibration_config:
+    print(f"✅ Calibration loaded: {CALIBRATION_CONFIG_PATH} ({len(calibration_config)} sources)")
+
+
+def create_speed_tracker(source, pixel_to_meter):
+    """SpeedTracker cho nguồn mới: homography nếu có calibration, ngược lại pixel_to_meter"""
+    calibration = get_source_calibration(calibration_config, source)
+    if calibration is not None:
+        print(f"[CALIBRATION] ✅ Using ground homography for source: {source}")
+    return SpeedTracker(pixel_to_meter=pixel_to_meter, calibration=calibration)
+
+
+# Speed mode: 'continuous' (tốc độ từng frame) hoặc 'trap' (2 vạch ảo cách nhau distance_m)
+SPEED_MODE = os.getenv('SPEED_MODE', 'continuous').lower()
+SPEED_TRAP_CONFIG_PATH = os.getenv('SPEED_TRAP_CONFIG_PATH', 'speed_trap.json')
+speed_trap_config = load_speed_trap_config(SPEED_TRAP_CONFIG_PATH) if SPEED_MODE == 'trap' else {}
+current_speed_trap = None
+if speed_trap_config:
+    print(f"✅ Speed trap loaded: {SPEED_TRAP_CONFIG_PATH} ({len(speed_trap_config)} sources)")
+
+
+# Quyết định vi phạm: 'immediate' (1 mẫu tốc độ > limit) hoặc 'deferred' (fit quỹ đạo, 1 lần / track)
+VIOLATION_DECISION = os.getenv('VIOLATION_DECISION', 'immediate').lower()
+VIOLATION_MIN_DISTANCE_M = float(os.getenv('VIOLATION_MIN_DISTANCE_M', '8.0'))
+violation_decider = ViolationDecider(
+    min_distance_m=VIOLATION_MIN_DISTANCE_M
+) if VIOLATION_DECISION == 'deferred' else None
+# Nguồn có speed trap: tốc độ trap (1 giá trị / xe khi qua vạch B) quyết định vi phạm,
+# 'deferred' chỉ áp dụng cho nguồn KHÔNG có trap
+if violation_decider is not None and speed_trap_config:
+    print("[VIOLATION] ⚠️  VIOLATION_DECISION=deferred + SPEED_MODE=trap: "
+          "sources with a speed trap use the trap speed, deferred applies to the others")
+
+# Plate cache theo track: chỉ chạy ALPR khi crop xe đủ lớn/nét, dừng khi đủ phiếu
+PLATE_MIN_VEHICLE_WIDTH = int(os.getenv('PLATE_MIN_VEHICLE_WIDTH', '96'))
+PLATE_MIN_VEHICLE_HEIGHT = int(os.getenv('PLATE_MIN_VEHICLE_HEIGHT', '64'))
+PLATE_MIN_SHARPNESS = float(os.getenv('PLATE_MIN_SHARPNESS', '50.0'))
+# Crop biển số (sau plate detector) nhỏ / nhoè hơn ngưỡng → không chạy OCR
+PLATE_MIN_PLATE_WIDTH = int(os.getenv('PLATE_MIN_PLATE_WIDTH', '40'))
+PLATE_MIN_PLATE_HEIGHT = int(os.getenv('PLATE_MIN_PLATE_HEIGHT', '12'))
+PLATE_MIN_PLATE_SHARPNESS = float(os.getenv('PLATE_MIN_PLATE_SHARPNESS', '20.0'))
+PLATE_MIN_VOTES = int(os.getenv('PLATE_MIN_VOTES', '2'))
+PLATE_MAX_ATTEMPTS = int(os.getenv('PLATE_MAX_ATTEMPTS', '10'))
+PLATE_RETRY_FRAMES = int(os.getenv('PLATE_RETRY_FRAMES', '5'))
+# Điểm matchTemplate tối thiểu để tin bbox biển số dự đoán từ track xe
+PLATE_TRACK_MIN_SCORE = float(os.getenv('PLATE_TRACK_MIN_SCORE', '0.6'))
+
+# ALPR service: gom tối đa N ảnh / batch, chờ tối đa T ms
+ALPR_BATCH_SIZE = int(os.getenv('ALPR_BATCH_SIZE', '8'))
+ALPR_BATCH_WAIT_MS = float(os.getenv('ALPR_BATCH_WAIT_MS', '5'))
+# Caller đồng bộ (realtime / violation / background) chờ kết quả ALPR tối đa N giây
+ALPR_TIMEOUT_S = float(os.getenv('ALPR_TIMEOUT_S', '5'))
+
+# Enhanced detector: budget fallback / lần gọi (đủ cho 1 phương pháp chậm), số thread cho preprocessing chậm + EasyOCR
+PLATE_PREPROCESS_BUDGET_MS = float(os.getenv('PLATE_PREPROCESS_BUDGET_MS', '400'))
+PLATE_SLOW_WORKERS = int(os.getenv('PLATE_SLOW_WORKERS', '2'))
+
+
+def set_source_speed_trap(source):
+    """Chọn speed trap cho nguồn mới (chỉ khi SPEED_MODE='trap')"""
+    global current_speed_trap
+    current_speed_trap = get_source_speed_trap(speed_trap_config, source)
+    if current_speed_trap is not None:
+        current_speed_trap.reset()
+        print(f"[SPEED TRAP] ✅ Using 2-line speed trap for source: {source}")
+        if violation_decider is not None:
+            print(f"[VIOLATION] ⚠️  Speed trap overrides VIOLATION_DECISION=deferred for source: {source}")
+    elif SPEED_MODE == 'trap':
+        print(f"[SPEED TRAP] ⚠️  No speed trap for source: {source}, using continuous speed")
+
+
+def set_source_roi(source):
+    """Chọn ROI cho nguồn mới và áp dụng cho detector"""
+    global current_roi
+    current_roi = get_source_roi(roi_config, source)
+    if current_roi is None and current_speed_trap is not None:
+        # Speed trap: chỉ cần detect trong dải quanh 2 vạch
+        current_roi = current_speed_trap.band_roi()
+    if detector is not None:
+        detector.set_roi(current_roi)
+    if current_roi is not None:
+        print(f"[ROI] ✅ Using ROI for source: {source}")
+
 # ============================================================================
 # FFMPEG VIDEO HELPER FUNCTIONS
 # ============================================================================
@@ -407,30 +495,39 @@ FFMPEG_AVAILABLE = check_ffmpeg_available()
 
 def init_detector():
     """Khởi tạo detector - lazy load"""
-    global detector, tracker, plate_detector_post
+    global detector, tracker, plate_detector_post, alpr_service
     if detector is None:
         print(">>> Loading CombinedDetector (YOLOv11n-seg SEGMENTATION)...")
         try:
-            detector = CombinedDetector(yolo_model='yolo11n-seg.pt', device=DEVICE)
+            detector = CombinedDetector(
+                yolo_model='yolo11n-seg.pt',
+                device=DEVICE,
+                tracker_backend=TRACKER_BACKEND,
+                mask_mode=DETECTION_MASK_MODE
+            )
+            detector.set_roi(current_roi)
+            detector.track_events.subscribe(on_track_event)
             print(">>> ✅ CombinedDetector with SEGMENTATION loaded!")
         except Exception as e:
             print(f">>> ❌ CombinedDetector failed: {e}")
             detector = None
 
     if tracker is None:
-        tracker = SpeedTracker(pixel_to_meter=0.13)
+        tracker = create_speed_tracker('camera', pixel_to_meter=0.13)
         print(">>> ✅ SpeedTracker initialized!")
 
     if plate_detector_post is None:
         if ENHANCED_DETECTOR_AVAILABLE:
             print(">>> Loading Enhanced Plate Detector for post-processing...")
             try:
-                plate_detector_post = EnhancedPlateDetector()
+                plate_detector_post = EnhancedPlateDetector(budget_ms=PLATE_PREPROCESS_BUDGET_MS,
+                                                            slow_workers=PLATE_SLOW_WORKERS,
+                                                            quality_gate=plate_quality_gate)
                 print(">>> ✅ Enhanced Plate Detector loaded! (Fast-ALPR + EasyOCR fallback)")
             except Exception as e:
                 print(f">>> ⚠️ Enhanced Plate Detector failed: {e}, using standard PlateDetector")
                 try:
-                    plate_detector_post = PlateDetector(device=DEVICE)
+                    plate_detector_post = PlateDetector(device=DEVICE, quality_gate=plate_quality_gate)
                     print(">>> ✅ Standard Fast-ALPR PlateDetector loaded!")
                 except Exception as e2:
                     print(f">>> ⚠️ Standard PlateDetector also failed: {e2}")
@@ -439,13 +536,24 @@ def init_detector():
         else:
             print(">>> Loading Fast-ALPR PlateDetector for post-processing...")
             try:
-                plate_detector_post = PlateDetector(device=DEVICE)
+                plate_detector_post = PlateDetector(device=DEVICE, quality_gate=plate_quality_gate)
                 print(">>> ✅ Fast-ALPR PlateDetector loaded!")
             except Exception as e:
                 print(f">>> ⚠️ PlateDetector failed: {e}")
                 plate_detector_post = None
                 print(">>> ⚠️ Plate detection will be disabled for post-processing")
 
+    if alpr_service is None and plate_detector_post is not None:
+        alpr_service = AlprService(plate_detector_post, max_batch=ALPR_BATCH_SIZE,
+                                   max_wait_ms=ALPR_BATCH_WAIT_MS, timeout=ALPR_TIMEOUT_S)
+        alpr_service.start()
+
+    for stats in model_registry.get_stats():
+        rss = f"{stats['rss_bytes'] / 1024 ** 2:.0f} MB" if stats['rss_bytes'] is not None else 'n/a'
+        cuda = f", CUDA +{stats['cuda_bytes'] / 1024 ** 2:.0f} MB" if stats['cuda_bytes'] else ''
+        print(f"[MODEL REGISTRY] {stats['name']} ({stats['device'] or 'auto'}): "
+              f"load {stats['load_time']:.2f}s, RSS +{rss}{cuda}, reused {stats['hits']}x")
+
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', '8306836477:AAEJSaTQg2Pu7tZQMEHjoDPUSIC3Mz0QtGY')
 TELEGRAM_CHAT_ID = int(os.getenv('TELEGRAM_CHAT_ID', '6680799636'))
 
@@ -865,14 +973,9 @@ def save_violation_data(detection, speed, frame):
 
         # Get clean frames from buffer
         clean_frames = []
-        if track_id in violation_frame_buffer:
-            buffer_data = violation_frame_buffer[track_id]
-            if isinstance(buffer_data, dict):
-                # New dict format
-                clean_frames = list(buffer_data.get('frames', []))
-            else:
-                # Old deque format (backward compatibility)
-                clean_frames = list(buffer_data)
+        track = track_table.lookup(track_id)
+        if track is not None:
+            clean_frames = [as_array(f) for f in track.frames]
 
         # Check if we have enough frames
         if len(clean_frames) < 30:
@@ -910,10 +1013,6 @@ def save_violation_data(detection, speed, frame):
             print(f"  - Vehicle: {vehicle_img_path}")
             print(f"  - Video: {video_path}")
 
-            # Mark track as sent
-            global sent_violation_tracks
-            sent_violation_tracks.add(track_id)
-
         except Exception as e:
             print(f"[VIOLATION SAVER ERROR] {e}")
             import traceback
@@ -1027,11 +1126,16 @@ def process_plate_from_saved_image(violation_id, violation_img_path, vehicle_img
         detected_plate_bbox = None
 
         try:
-            if plate_detector_post is None:
+            if alpr_service is None:
                 print(f"[FAST-ALPR] ⚠️ Plate detector not available, skipping plate detection")
                 plate_results_raw = []
             else:
-                plate_results_raw = plate_detector_post.detect(detection_frame)
+                try:
+                    plate_results_raw = alpr_service.detect(detection_frame, priority=PRIORITY_BACKGROUND,
+                                                            timeout=ALPR_TIMEOUT_S)
+                except (TimeoutError, AlprServiceStopped) as e:
+                    print(f"[FAST-ALPR] ⚠️ ALPR unavailable: {e}")
+                    plate_results_raw = []
 
             if not plate_results_raw:
                 print(f"[FAST-ALPR] ⚠️ Fast-ALPR không phát hiện biển số")
@@ -1453,80 +1557,310 @@ def get_detection_queue_size():
 detection_queue = deque(maxlen=get_detection_queue_size())
 stream_queue_clean = queue.Queue(maxsize=60)
 stream_queue = queue.Queue(maxsize=30)
-alpr_proactive_queue = queue.Queue(maxsize=50)
 alpr_realtime_queue = queue.Queue(maxsize=30)
 best_frame_queue = queue.Queue(maxsize=30)
 violation_queue = queue.Queue(maxsize=30)
 telegram_queue = queue.Queue(maxsize=100)
 
-alpr_proactive_cache = {}
-alpr_cache_lock = threading.Lock()
-
-original_frame_buffer = {}
+# Gate chất lượng dùng chung cho mọi entry point ALPR (crop xe + crop biển số trước OCR)
+plate_quality_gate = PlateQualityGate(
+    min_vehicle_width=PLATE_MIN_VEHICLE_WIDTH,
+    min_vehicle_height=PLATE_MIN_VEHICLE_HEIGHT,
+    min_vehicle_sharpness=PLATE_MIN_SHARPNESS,
+    min_plate_width=PLATE_MIN_PLATE_WIDTH,
+    min_plate_height=PLATE_MIN_PLATE_HEIGHT,
+    min_plate_sharpness=PLATE_MIN_PLATE_SHARPNESS
+)
+
+# Biển số theo track_id - schedule_plate_read (alpr_service) ghi, trigger / ALPR realtime / violation đọc
+plate_cache = PlateCache(
+    normalize=normalize_plate,
+    is_valid=is_valid_plate,
+    quality_gate=plate_quality_gate,
+    min_votes=PLATE_MIN_VOTES,
+    max_attempts=PLATE_MAX_ATTEMPTS,
+    retry_frames=PLATE_RETRY_FRAMES
+)
+# Vị trí biển số theo track - lần đọc sau chỉ OCR crop biển số dự đoán (bỏ qua plate detector)
+plate_tracker = PlateTracker(min_score=PLATE_TRACK_MIN_SCORE)
+
+frame_store = FrameStore()  # Frame gốc được truyền qua pipeline bằng FrameHandle
+original_frame_buffer = FrameRing(capacity=150)  # 150 frames @ 30fps = 5s, dùng chung cho mọi track
 admin_frame_buffer = {}
-violation_frame_buffer = {}
-current_detections = {}
-sent_violation_tracks = set()
-recording_tracks = {}
+# State theo track (bbox, tốc độ, biển số, clip vi phạm...) - detection stage ghi,
+# ALPR / best frame / violation saver / SSE đọc track_table.lookup() / visible()
+track_table = TrackTable(max_violation_frames=150)  # 150 frames @ 30fps = 5s (dư để chọn)
 
 def cleanup_old_buffers():
-    """Xóa buffer không được update trong 5 giây"""
-    now = time.time()
-    to_delete = []
-
-    for track_id, data in violation_frame_buffer.items():
-        if isinstance(data, dict) and 'last_update' in data:
-            if now - data['last_update'] > 5.0:
-                to_delete.append(track_id)
-
-    for track_id in to_delete:
-        if track_id in violation_frame_buffer:
-            del violation_frame_buffer[track_id]
-        if track_id in recording_tracks:
-            del recording_tracks[track_id]
-        print(f"🗑️ Cleaned up buffer for track {track_id}")
-    
-    # NEW: Cleanup expired active tracks (không thấy sau TRACK_TIMEOUT)
-    with active_tracks_lock:
-        expired = [tid for tid, t in active_tracks.items() if now - t > TRACK_TIMEOUT]
-        for tid in expired:
-            del active_tracks[tid]
-            if tid in original_frame_buffer:
-                del original_frame_buffer[tid]
-            print(f"🗑️ Cleaned up expired active track {tid}")
-
-def start_recording_violation(track_id):
-    """Bắt đầu recording frames cho vi phạm"""
-    if track_id not in recording_tracks:
-        recording_tracks[track_id] = {
-            'start_time': time.time(),
-            'frame_count': 0
-        }
-        if track_id not in violation_frame_buffer:
-            violation_frame_buffer[track_id] = {
-                'frames': deque(maxlen=150),  # 150 frames @ 30fps = 5s (dư để chọn)
-                'last_update': time.time()
-            }
+    """Fallback: xoá clip vi phạm không được update trong 5 giây + track quá TRACK_TIMEOUT"""
+    expired = track_table.expire(time.time(), TRACK_TIMEOUT, VIOLATION_BUFFER_TIMEOUT)
+    for tid in expired:
+        original_frame_buffer.remove_track(tid)
+        plate_cache.release(tid)
+        print(f"🗑️ Cleaned up expired track {tid}")
+
+# Track đã bị tracker xoá, chờ giải phóng ở cuối process_frame_detections()
+# (sau khi frame hiện tại đã xử lý xong: quyết định trễ vẫn đọc được FrameRing)
+removed_track_ids = deque()
+
+def on_track_event(event, track_id):
+    """
+    Subscriber của detector.track_events - giữ state theo track đúng vòng đời
+    thay vì chờ cleanup_old_buffers() (polling + TRACK_TIMEOUT)
+    """
+    # TRACK_STARTED: range FrameRing mở trong process_frame_detections() (cần seq của frame)
+    if event == TRACK_LOST:
+        original_frame_buffer.close_track(track_id)
+    elif event == TRACK_REMOVED:
+        removed_track_ids.append(track_id)
+
+def release_removed_tracks():
+    """Giải phóng state của các track đã bị tracker xoá"""
+    while removed_track_ids:
+        track_id = removed_track_ids.popleft()
+
+        # Quyết định trễ cho track vừa kết thúc (chưa tới end_gap)
+        if violation_decider is not None:
+            decision = violation_decider.finish(track_id, speed_limit)
+            if decision is not None and decision['violation']:
+                det, decision_frame, decision_frame_id = decision['payload']
+                print(f"[DETECTION] 📈 Deferred violation (track_removed): track_id={track_id}, "
+                      f"fit speed={decision['speed']:.1f} km/h, confidence={decision['confidence']:.2f}")
+                trigger_violation(track_id, det, decision['speed'], decision_frame,
+                                  decision_frame_id, speed_confidence=decision['confidence'])
+
+        tracker.release(track_id)
+        plate_tracker.release(track_id)
+        if current_speed_trap is not None:
+            current_speed_trap.release(track_id)
+        original_frame_buffer.remove_track(track_id)
+
+        # Vi phạm đang chờ lưu: violation saver / best frame worker còn đọc clip
+        # → record giữ lại, cleanup_old_buffers() xoá theo timeout (kể cả biển số trong plate_cache)
+        track_table.remove(track_id)
+        if track_table.get(track_id) is None:
+            plate_cache.release(track_id)
+
+alpr_queue = queue.Queue(maxsize=50)
+alpr_worker_running = False
 
-def update_recording(track_id, frame):
-    """Cập nhật frame vào buffer"""
-    if track_id in violation_frame_buffer:
-        if isinstance(violation_frame_buffer[track_id], dict):
-            violation_frame_buffer[track_id]['frames'].append(frame.copy())
-            violation_frame_buffer[track_id]['last_update'] = time.time()
+def pop_detection_batch(max_size, timeout):
+    """
+    Gom tối đa max_size frame từ detection_queue, chờ tối đa timeout giây
+    (luôn trả về ít nhất 1 frame - gọi khi queue không rỗng)
+    """
+    batch = [detection_queue.popleft()]
+    deadline = time.time() + timeout
+    while len(batch) < max_size:
+        if len(detection_queue) > 0:
+            batch.append(detection_queue.popleft())
+        elif time.time() < deadline and camera_running:
+            time.sleep(0.001)
         else:
-            # Backward compatibility
-            violation_frame_buffer[track_id].append(frame.copy())
+            break
+    return batch
 
-        if track_id in recording_tracks:
-            recording_tracks[track_id]['frame_count'] += 1
+pending_alpr_jobs = []  # Vi phạm của frame đang xử lý (chỉ detection thread)
 
-alpr_queue = queue.Queue(maxsize=50)
-alpr_worker_running = False
+def trigger_violation(track_id, detection, speed, original_frame, frame_id, speed_confidence=None):
+    """
+    Chuỗi xử lý vi phạm cho 1 track: ghi hình, pre-buffer frame từ FrameRing,
+    tra cache biển số proactive và đẩy vào ALPR queue
+
+    Args:
+        speed_confidence: Confidence của quyết định trễ (None = chế độ immediate)
+    """
+    vehicle_bbox = detection['vehicle_bbox']
+    vehicle_class = detection['vehicle_class']
+    plate = detection.get('plate')
+
+    # Bắt đầu recording + lưu violation frame number cho video extraction
+    now = time.time()
+    track_table.start_violation(track_id, frame_id, frame_id / video_fps if video_fps > 0 else 0,
+                                now, speed_confidence=speed_confidence)
+    track_table.add_violation_frames(track_id, [original_frame], now)
+
+    print(f"[DETECTION] 📍 Violation frame: {frame_id}, timestamp: {frame_id / video_fps:.2f}s")
+    print(f"[DETECTION] 🎯 This is ACTUAL frame {frame_id} in source video (not counter)")
+
+    # FIX: Sử dụng can_save_violation để kiểm tra cooldown (đồng bộ logic)
+    # DEBUG: Log để kiểm tra
+    print(f"[DETECTION] 🔍 Checking violation: track_id={track_id}, plate={plate}, speed={speed:.1f} km/h")
+    can_save = can_save_violation(track_id, plate)
+    print(f"[DETECTION] 🔍 can_save_violation(track_id={track_id}, plate={plate}) = {can_save}")
+    if not can_save:
+        print(f"[DETECTION] ⏳ Bỏ qua vi phạm trùng lặp: track_id={track_id}, plate={plate}")
+        return
+    print(f"[DETECTION] ✅ Cho phép lưu vi phạm: track_id={track_id}, plate={plate}")
+
+    # PRE-BUFFERING: Lấy frames trong [first_seq, last_seq] của track từ FrameRing
+    # Bao gồm CẢ frames TRƯỚC + SAU vi phạm
+    all_frames = original_frame_buffer.track_frames(track_id)
+    if all_frames:
+
+        # Extract chỉ frame data (bỏ dict wrapper)
+        frames_only = []
+        for frame_data in all_frames:
+            if isinstance(frame_data, dict) and 'frame' in frame_data:
+                frames_only.append(frame_data['frame'])
+            else:
+                frames_only.append(frame_data)
+
+        # Thêm tất cả frame handles vào clip vi phạm của track (KHÔNG copy ndarray)
+        track_table.add_violation_frames(track_id, frames_only, time.time())
+
+        print(f"[DETECTION] 📹 Copied {len(frames_only)} frames to violation buffer for track {track_id} (includes frames BEFORE violation)")
+
+    # Biển số đã đọc được cho CHÍNH track này (plate_cache), không đoán theo vị trí
+    plate_from_cache = plate_cache.get(track_id)
+    if plate_from_cache is not None:
+        print(f"[DETECTION] ✅ Using cached plate: {plate_from_cache['plate']} (confidence: {plate_from_cache['confidence']:.2f}, "
+              f"votes: {plate_from_cache['votes']}, confirmed: {plate_from_cache['confirmed']})")
+
+    alpr_data = {
+        'track_id': track_id,
+        'detection': detection,
+        'speed': speed,
+        'full_frame': original_frame,  # FrameHandle
+        'vehicle_bbox': vehicle_bbox,
+        'vehicle_class': vehicle_class,
+        'timestamp': time.time(),
+        'cached_plate': plate_from_cache,
+        'speed_confidence': speed_confidence
+    }
+
+    # Đẩy vào ALPR queue SAU khi track_table.publish() (flush_violation_jobs)
+    # → best frame / violation saver luôn thấy clip + violation frame của track
+    pending_alpr_jobs.append(alpr_data)
+
+def flush_violation_jobs(frame_id):
+    """Publish snapshot track_table của frame rồi đẩy các vi phạm của frame vào ALPR queue"""
+    track_table.publish(frame_id)
+    while pending_alpr_jobs:
+        alpr_data = pending_alpr_jobs.pop(0)
+        track_id = alpr_data['track_id']
+        try:
+            alpr_realtime_queue.put(alpr_data, block=False)
+            print(f"[DETECT THREAD] ✅ Đẩy vào ALPR queue: track_id={track_id}, speed={alpr_data['speed']:.1f}")
+        except queue.Full:
+            print(f"[DETECT THREAD] ⚠️ ALPR queue đầy, bỏ qua track_id={track_id}")
+
+def process_frame_detections(frame_data, detections):
+    """Tracking + Speed + Violation cho detections của 1 frame (giữ đúng thứ tự frame)"""
+    detect_frame = frame_data['frame']
+    original_frame = frame_data['original']
+    # USE frame_number (actual frame in source video) NOT frame_id (counter)
+    frame_id = frame_data.get('frame_number', frame_data.get('frame_id', frame_data.get('id', 0)))
+    # Media timestamp (frame_number / fps) - tốc độ không phụ thuộc tốc độ xử lý
+    frame_timestamp = frame_data.get('timestamp')
+
+    # original_frame là FrameHandle (read-only) - chỉ copy cho admin stream vì cần vẽ bbox
+    admin_frame = original_frame.frame.copy()
+
+    if DETECTION_SCALE < 1.0:
+        original_h, original_w = original_frame.shape[:2]
+        detect_h, detect_w = detect_frame.shape[:2]
+        scale_x = original_w / detect_w
+        scale_y = original_h / detect_h
+
+        for det in detections:
+            x1, y1, x2, y2 = det['vehicle_bbox']
+            new_x1 = max(0, min(int(x1 * scale_x + 0.5), original_w - 1))
+            new_y1 = max(0, min(int(y1 * scale_y + 0.5), original_h - 1))
+            new_x2 = max(new_x1 + 1, min(int(x2 * scale_x + 0.5), original_w))
+            new_y2 = max(new_y1 + 1, min(int(y2 * scale_y + 0.5), original_h))
+            det['vehicle_bbox'] = (new_x1, new_y1, new_x2, new_y2)
+
+    # Tốc độ của TẤT CẢ track trong frame: 1 lượt vectorized
+    frame_speeds = tracker.update_many(
+        [det['track_id'] for det in detections],
+        [det['vehicle_bbox'] for det in detections],
+        frame_timestamp
+    )
+
+    # Speed trap: tốc độ = distance_m / thời gian giữa 2 lần cắt vạch (thay tốc độ từng frame)
+    speed_trap = current_speed_trap
+    if speed_trap is not None:
+        frame_speeds = speed_trap.update_many(
+            [det['track_id'] for det in detections],
+            [det['vehicle_bbox'] for det in detections],
+            frame_timestamp,
+            original_frame.shape
+        )
+        speed_trap.cleanup(frame_timestamp)
+
+    # Deferred: gom quỹ đạo (mét) → chuỗi vi phạm chỉ chạy khi fit robust vượt limit
+    # (nguồn có speed trap: tốc độ trap quyết định, xem set_source_speed_trap)
+    if violation_decider is not None and speed_trap is None:
+        decisions = violation_decider.update(
+            [det['track_id'] for det in detections],
+            tracker.to_meters([det['vehicle_bbox'] for det in detections]),
+            frame_timestamp,
+            speed_limit,
+            payloads=[(det, original_frame, frame_id) for det in detections]
+        )
+        for decision in decisions:
+            if not decision['violation']:
+                continue
+            det, decision_frame, decision_frame_id = decision['payload']
+            print(f"[DETECTION] 📈 Deferred violation ({decision['reason']}): track_id={decision['track_id']}, "
+                  f"fit speed={decision['speed']:.1f} km/h, confidence={decision['confidence']:.2f}")
+            trigger_violation(decision['track_id'], det, decision['speed'], decision_frame,
+                              decision_frame_id, speed_confidence=decision['confidence'])
+
+    now = time.time()
+    for detection, speed in zip(detections, frame_speeds):
+        track_id = detection['track_id']
+
+        record = track_table.get(track_id)
+        if speed_trap is None and record is not None and record.speed is not None:
+            if speed is not None:
+                speed = 0.75 * speed + 0.25 * record.speed
+            else:
+                speed = record.speed
+
+        detection['speed'] = speed
+
+        # Biển số theo track: lấy từ plate_cache, chỉ lập lịch ALPR khi track cần đọc thêm
+        cached_plate = plate_cache.get(track_id)
+        if cached_plate is not None:
+            detection['plate'] = cached_plate['plate']
+        if plate_cache.should_read(track_id, original_frame.frame, detection['vehicle_bbox'], frame_id):
+            schedule_plate_read(track_id, original_frame, detection['vehicle_bbox'])
+
+        track_table.observe(detection, frame_id, now)
+
+        # Mở range trong FrameRing từ frame track xuất hiện (reader không copy frame theo track)
+        original_frame_buffer.open_track(track_id, frame_data.get('seq'))
+
+        try:
+            detector.draw_detections(admin_frame, detection, speed, speed_limit)
+        except Exception as e:
+            print(f"[DETECT THREAD] Error drawing detection: {e}")
+
+        if (violation_decider is None or speed_trap is not None) and speed and speed > speed_limit:
+            trigger_violation(track_id, detection, speed, original_frame, frame_id)
+
+    if 'global' not in admin_frame_buffer:
+        admin_frame_buffer['global'] = deque(maxlen=90)
+    admin_frame_buffer['global'].append({
+        'frame': admin_frame,
+        'frame_id': frame_id,
+        'timestamp': time.time()
+    })
+
+    try:
+        stream_queue.put(admin_frame, block=False)
+    except queue.Full:
+        pass
+    
+    # Track bị tracker xoá → giải phóng SpeedTracker slot, FrameRing range, ... ngay
+    release_removed_tracks()
+    flush_violation_jobs(frame_id)
 
 def detection_worker():
     """THREAD 2: Detection Worker - YOLO + Tracking + Speed"""
-    global current_detections, is_video_upload_mode, stream_queue, admin_frame_buffer, violation_frame_buffer, original_frame_buffer, violation_queue, detector, tracker, active_tracks, active_tracks_lock, video_fps
+    global is_video_upload_mode, stream_queue, admin_frame_buffer, original_frame_buffer, violation_queue, detector, tracker, video_fps
 
     # Khởi tạo detector nếu chưa có
     init_detector()
@@ -1560,12 +1894,6 @@ def detection_worker():
             continue
 
         try:
-            frame_data = detection_queue.popleft()
-            detect_frame = frame_data['frame']
-            original_frame = frame_data['original']
-            # USE frame_number (actual frame in source video) NOT frame_id (counter)
-            frame_id = frame_data.get('frame_number', frame_data.get('frame_id', frame_data.get('id', 0)))
-
             # Kiểm tra detector trước khi sử dụng
             if detector is None:
                 init_detector()
@@ -1573,232 +1901,120 @@ def detection_worker():
                     print("[ERROR] Detection worker: Detector is None, skipping frame")
                     continue
 
-            detections = detector.detect(detect_frame, enable_plate_detection=True)
-            admin_frame = original_frame.copy()
-
-            if DETECTION_SCALE < 1.0:
-                original_h, original_w = original_frame.shape[:2]
-                detect_h, detect_w = detect_frame.shape[:2]
-                scale_x = original_w / detect_w
-                scale_y = original_h / detect_h
-
-                for det in detections:
-                    x1, y1, x2, y2 = det['vehicle_bbox']
-                    new_x1 = max(0, min(int(x1 * scale_x + 0.5), original_w - 1))
-                    new_y1 = max(0, min(int(y1 * scale_y + 0.5), original_h - 1))
-                    new_x2 = max(new_x1 + 1, min(int(x2 * scale_x + 0.5), original_w))
-                    new_y2 = max(new_y1 + 1, min(int(y2 * scale_y + 0.5), original_h))
-                    det['vehicle_bbox'] = (new_x1, new_y1, new_x2, new_y2)
-
-            new_detections = {}
-            for detection in detections:
-                track_id = detection['track_id']
-                vehicle_bbox = detection['vehicle_bbox']
-                vehicle_class = detection['vehicle_class']
-                plate = detection.get('plate')
-                plate_bbox = detection.get('plate_bbox')
-
-                speed = tracker.update(track_id, vehicle_bbox)
-
-                if track_id in current_detections:
-                    old_det = current_detections[track_id]
-                    if old_det.get('speed') is not None:
-                        if speed is not None:
-                            speed = 0.75 * speed + 0.25 * old_det['speed']
-                        else:
-                            speed = old_det['speed']
-
-                detection['speed'] = speed
-                new_detections[track_id] = detection
-
-                # NEW: Update active_tracks (video_reader sẽ tự động buffer frames)
-                with active_tracks_lock:
-                    active_tracks[track_id] = time.time()
-
-                # REMOVED: Không còn cần populate original_frame_buffer ở đây
-                # video_reader đã handle việc buffer MỌI frame cho active tracks rồi
-
-                try:
-                    detector.draw_detections(admin_frame, detection, speed, speed_limit)
-                except Exception as e:
-                    print(f"[DETECT THREAD] Error drawing detection: {e}")
-
-                if speed and speed > speed_limit:
-                    start_recording_violation(track_id)
-                    update_recording(track_id, original_frame)
-
-                    # NEW: Track violation frame number for video extraction
-                    if track_id not in violation_frame_buffer:
-                        violation_frame_buffer[track_id] = {
-                            'frames': deque(maxlen=150),
-                            'last_update': time.time()
-                        }
-
-                    # Save violation frame number
-                    violation_frame_buffer[track_id]['violation_frame'] = frame_id
-                    violation_frame_buffer[track_id]['violation_timestamp'] = frame_id / video_fps if video_fps > 0 else 0
+            # Video upload: gom batch (tối đa N frame hoặc T ms) → 1 forward pass
+            # Camera realtime: 1 frame/lần (ưu tiên độ trễ thấp)
+            track_states = []
+            if is_video_upload_mode and DETECTION_BATCH_SIZE > 1:
+                batch = pop_detection_batch(DETECTION_BATCH_SIZE, DETECTION_BATCH_TIMEOUT_MS / 1000.0)
+                batch_detections = detector.detect_batch(
+                    [fd['frame'] for fd in batch], enable_plate_detection=False,
+                    track_states=track_states
+                )
+            else:
+                batch = [detection_queue.popleft()]
+                batch_detections = [detector.detect(batch[0]['frame'], enable_plate_detection=False,
+                                                    track_states=track_states)]
+
+            # enable_plate_detection=False: biển số đọc theo track qua plate_cache
+            # (schedule_plate_read), không chạy ALPR cho mọi xe ở mọi frame
+            # Tracking/speed/violation xử lý TUẦN TỰ theo đúng thứ tự frame
+            # Event lost/removed phát khi xử lý ĐÚNG frame của nó (không phải cả batch trước)
+            for frame_data, detections, track_state in zip(batch, batch_detections, track_states):
+                if track_state is not None:
+                    detector.track_events.observe(*track_state)
+                process_frame_detections(frame_data, detections)
 
-                    print(f"[DETECTION] 📍 Violation frame: {frame_id}, timestamp: {frame_id / video_fps:.2f}s")
-                    print(f"[DETECTION] 🎯 This is ACTUAL frame {frame_id} in source video (not counter)")
+        except Exception as e:
+            print(f"[ERROR] Detection worker error: {e}")
 
-                    # FIX: Sử dụng can_save_violation để kiểm tra cooldown (đồng bộ logic)
-                    # DEBUG: Log để kiểm tra
-                    print(f"[DETECTION] 🔍 Checking violation: track_id={track_id}, plate={plate}, speed={speed:.1f} km/h")
-                    can_save = can_save_violation(track_id, plate)
-                    print(f"[DETECTION] 🔍 can_save_violation(track_id={track_id}, plate={plate}) = {can_save}")
-                    if not can_save:
-                        print(f"[DETECTION] ⏳ Bỏ qua vi phạm trùng lặp: track_id={track_id}, plate={plate}")
-                        continue
-                    print(f"[DETECTION] ✅ Cho phép lưu vi phạm: track_id={track_id}, plate={plate}")
+def schedule_plate_read(track_id, frame, vehicle_bbox):
+    """
+    ALPR proactive theo track: submit crop xe (+ padding) vào alpr_service,
+    kết quả ghi vào plate_cache khi Future xong (không block detection stage)
 
-                    # PRE-BUFFERING: Copy TẤT CẢ frames từ original_frame_buffer vào violation_frame_buffer
-                    # Bao gồm CẢ frames TRƯỚC + SAU vi phạm
-                    if track_id in original_frame_buffer and len(original_frame_buffer[track_id]) > 0:
-                        all_frames = list(original_frame_buffer[track_id])
-                        
-                        # Extract chỉ frame data (bỏ dict wrapper)
-                        frames_only = []
-                        for frame_data in all_frames:
-                            if isinstance(frame_data, dict) and 'frame' in frame_data:
-                                frames_only.append(frame_data['frame'])
-                            else:
-                                frames_only.append(frame_data)
-                        
-                        # Lưu vào violation_frame_buffer
-                        if track_id not in violation_frame_buffer:
-                            violation_frame_buffer[track_id] = {
-                                'frames': deque(maxlen=150),
-                                'last_update': time.time()
-                            }
-                        
-                        # Thêm tất cả frames vào buffer
-                        for f in frames_only:
-                            violation_frame_buffer[track_id]['frames'].append(f.copy())
-                        
-                        print(f"[DETECTION] 📹 Copied {len(frames_only)} frames to violation buffer for track {track_id} (includes frames BEFORE violation)")
+    Biển số đã định vị ở lần đọc trước → plate_tracker dự đoán bbox biển số theo
+    track xe, chỉ submit crop biển số (ocr_only, bỏ qua plate detector)
 
-                    plate_from_cache = None
-                    with alpr_cache_lock:
-                        x1, y1, x2, y2 = vehicle_bbox
-                        vehicle_center_x = (x1 + x2) / 2
-                        vehicle_center_y = (y1 + y2) / 2
-
-                        min_distance = float('inf')
-                        best_cache_key = None
-                        for cache_key in alpr_proactive_cache:
-                            cx, cy = map(int, cache_key.split('_'))
-                            distance = ((vehicle_center_x - cx)**2 + (vehicle_center_y - cy)**2)**0.5
-                            if distance < min_distance and distance < 200:
-                                min_distance = distance
-                                best_cache_key = cache_key
-
-                        if best_cache_key:
-                            plate_from_cache = alpr_proactive_cache[best_cache_key]
-                            print(f"[DETECTION] ✅ Using cached plate: {plate_from_cache['plate']} (confidence: {plate_from_cache['confidence']:.2f})")
-
-                        alpr_data = {
-                            'track_id': track_id,
-                            'detection': detection,
-                            'speed': speed,
-                            'full_frame': original_frame.copy(),
-                            'vehicle_bbox': vehicle_bbox,
-                            'vehicle_class': vehicle_class,
-                        'timestamp': time.time(),
-                        'cached_plate': plate_from_cache
-                        }
+    Args:
+        frame: FrameHandle frame gốc
+        vehicle_bbox: (x1, y1, x2, y2) trên frame gốc
+    """
+    if alpr_service is None:
+        plate_cache.cancel(track_id)
+        return
+
+    predicted = plate_tracker.predict(track_id, frame.frame, vehicle_bbox)
+    if predicted is not None:
+        # Crop biển số dự đoán (view, không copy)
+        (crop_x1, crop_y1, crop_x2, crop_y2), match_score = predicted
+        region = frame.crop(crop_x1, crop_y1, crop_x2, crop_y2)
+    else:
+        # Crop vùng xe (+ padding) - biển số có thể sát mép bbox (view, không copy)
+        x1, y1, x2, y2 = vehicle_bbox
+        padding = 20
+        crop_x1 = max(0, int(x1) - padding)
+        crop_y1 = max(0, int(y1) - padding)
+        crop_x2 = min(frame.shape[1], int(x2) + padding)
+        crop_y2 = min(frame.shape[0], int(y2) + padding)
+        region = frame.crop(crop_x1, crop_y1, crop_x2, crop_y2)
 
-                    try:
-                        alpr_realtime_queue.put(alpr_data, block=False)
-                        print(f"[DETECT THREAD] ✅ Đẩy vào ALPR queue: track_id={track_id}, speed={speed:.1f}")
-                    except queue.Full:
-                        print(f"[DETECT THREAD] ⚠️ ALPR queue đầy, bỏ qua track_id={track_id}")
-
-            current_detections = new_detections
-
-            if 'global' not in admin_frame_buffer:
-                admin_frame_buffer['global'] = deque(maxlen=90)
-            admin_frame_buffer['global'].append({
-                'frame': admin_frame,
-                'frame_id': frame_id,
-                'timestamp': time.time()
-            })
+    try:
+        if predicted is not None:
+            future = alpr_service.submit(region, priority=PRIORITY_PROACTIVE, ocr_only=True, score=match_score)
+        else:
+            future = alpr_service.submit(region, priority=PRIORITY_PROACTIVE)
+    except (queue.Full, AlprServiceStopped):
+        plate_cache.cancel(track_id)
+        return
 
-            try:
-                stream_queue.put(admin_frame, block=False)
-            except queue.Full:
-                pass
-            
-            active_track_ids = set(det['track_id'] for det in detections)
-            tracker.cleanup_old_tracks(active_track_ids)
+    # Track mới chưa có trong snapshot (publish cuối frame) → không coi là đã bị xoá
+    was_published = track_table.lookup(track_id) is not None
 
+    def on_plates(done):
+        plate_text, confidence, plate_bbox, plate_crop = None, 0.0, None, None
+        try:
+            plates_detected = done.result()
         except Exception as e:
-            print(f"[ERROR] Detection worker error: {e}")
-
-def alpr_proactive_worker():
-    """THREAD MỚI: ALPR Proactive Worker - Detect plate TRƯỚC khi vi phạm"""
-    global alpr_proactive_queue, alpr_proactive_cache, alpr_cache_lock, detector, camera_running, plate_detector_post
+            print(f"[ALPR PROACTIVE] ❌ ALPR error for track {track_id}: {e}")
+            plates_detected = None
+
+        if plates_detected:
+            best_plate = max(plates_detected, key=lambda p: p.get('confidence', 0))
+            plate_text = best_plate.get('plate', '')
+            confidence = best_plate.get('confidence', 0.0)
+            local_bbox = best_plate.get('bbox')
+            if local_bbox and len(local_bbox) == 4:
+                px1, py1, px2, py2 = [int(v) for v in local_bbox]
+                plate_bbox = (crop_x1 + px1, crop_y1 + py1, crop_x1 + px2, crop_y1 + py2)
+                if px2 > px1 and py2 > py1:
+                    padding_x = max(10, int((px2 - px1) * 0.2))
+                    padding_y = max(5, int((py2 - py1) * 0.2))
+                    # Copy crop nhỏ để không giữ cả frame gốc sống theo cache
+                    plate_crop = frame.crop(max(0, plate_bbox[0] - padding_x), max(0, plate_bbox[1] - padding_y),
+                                            plate_bbox[2] + padding_x, plate_bbox[3] + padding_y).copy()
+
+        # Callback chạy trên thread ALPR service: track có thể đã bị release trong lúc chờ
+        # → không tạo lại state plate_tracker / plate_cache cho track đã giải phóng
+        track = track_table.lookup(track_id)
+        if track is None and was_published:
+            return
+        released = track is not None and track.removed
 
-    print("[ALPR PROACTIVE] ✅ Worker started")
+        # Đọc được biển số hợp lệ → nhớ vị trí cho lần sau; dự đoán sai → lần sau detect đầy đủ
+        if not released:
+            if plate_bbox is not None and is_valid_plate(normalize_plate(plate_text)):
+                plate_tracker.update(track_id, frame.frame, vehicle_bbox, plate_bbox)
+            elif predicted is not None:
+                plate_tracker.miss(track_id)
 
-    if detector is None:
-        init_detector()
-
-    while camera_running:
-        try:
-            frame_data = alpr_proactive_queue.get(timeout=1.0)
-            frame = frame_data['frame']
-            frame_id = frame_data['frame_id']
-            timestamp = frame_data['timestamp']
-
-            if plate_detector_post is not None:
-                plates_detected = plate_detector_post.detect(frame)
-
-                if plates_detected:
-                    with alpr_cache_lock:
-                        for plate_data in plates_detected:
-                            plate_text = plate_data.get('plate', '')
-                            bbox = plate_data.get('bbox', [])
-                            confidence = plate_data.get('confidence', 0.0)
-
-                            if not plate_text or len(bbox) != 4:
-                                continue
-
-                            x1, y1, x2, y2 = bbox
-                            center_x = (x1 + x2) / 2
-                            center_y = (y1 + y2) / 2
-
-                            cache_key = f"{int(center_x//50)*50}_{int(center_y//50)*50}"
-
-                            if cache_key not in alpr_proactive_cache or \
-                               confidence > alpr_proactive_cache[cache_key].get('confidence', 0):
-                                alpr_proactive_cache[cache_key] = {
-                                    'plate': plate_text,
-                                    'bbox': bbox,
-                                    'confidence': confidence,
-                                    'timestamp': timestamp,
-                                    'frame_id': frame_id
-                                }
-
-                    with alpr_cache_lock:
-                        current_time = timestamp
-                        keys_to_remove = []
-                        for key, value in alpr_proactive_cache.items():
-                            if current_time - value['timestamp'] > 5.0:
-                                keys_to_remove.append(key)
-                        for key in keys_to_remove:
-                            del alpr_proactive_cache[key]
-
-        except queue.Empty:
-            continue
-        except Exception as e:
-            print(f"[ALPR PROACTIVE] ❌ Error: {e}")
-            continue
+        # Track đã xoá nhưng vi phạm đang chờ lưu: plate_cache còn giữ → vẫn ghi phiếu
+        plate_cache.add_reading(track_id, plate_text, confidence, bbox=plate_bbox, crop=plate_crop)
 
-    print("[ALPR PROACTIVE] 🛑 Worker stopped")
+    future.add_done_callback(on_plates)
 
 def alpr_realtime_worker():
     """THREAD 3: ALPR Realtime Worker - FastALPR detect biển số"""
-    global alpr_realtime_queue, best_frame_queue, camera_running, plate_detector_post, alpr_proactive_cache, alpr_cache_lock
+    global alpr_realtime_queue, best_frame_queue, camera_running
 
     print("[ALPR WORKER] ✅ Thread 3 - ALPR Realtime Worker đã khởi động")
 
@@ -1819,10 +2035,14 @@ def alpr_realtime_worker():
             refined_plate_bbox = None
             plate_crop = None
 
-            if cached_plate and cached_plate.get('confidence', 0) > 0.7:
+            # Track đã có biển số (confirmed hoặc đủ tin cậy) → KHÔNG chạy ALPR lại
+            if cached_plate is None:
+                cached_plate = plate_cache.get(track_id)
+            if cached_plate and (cached_plate['confirmed'] or cached_plate.get('confidence', 0) > 0.7):
                 print(f"[ALPR REALTIME] 📋 Using cached plate: {cached_plate['plate']}")
                 refined_plate = cached_plate['plate']
                 refined_plate_bbox = cached_plate['bbox']
+                plate_crop = cached_plate['crop']
             else:
                 try:
                     x1, y1, x2, y2 = vehicle_bbox
@@ -1832,10 +2052,19 @@ def alpr_realtime_worker():
                     crop_x2 = min(full_frame.shape[1], x2 + padding)
                     crop_y2 = min(full_frame.shape[0], y2 + padding)
 
-                    vehicle_region = full_frame[crop_y1:crop_y2, crop_x1:crop_x2].copy()
+                    vehicle_region = full_frame.crop(crop_x1, crop_y1, crop_x2, crop_y2)
 
-                    if plate_detector_post is not None:
-                        plate_results = plate_detector_post.detect(vehicle_region)
+                    # Xe quá nhỏ / nhoè / tối → không đọc được, KHÔNG tốn ALPR
+                    reject_reason = plate_quality_gate.check(vehicle_region, KIND_VEHICLE)
+                    if reject_reason is not None:
+                        print(f"[ALPR REALTIME] ⏭️ Skip track {track_id}: vehicle crop {reject_reason}")
+                    elif alpr_service is not None:
+                        try:
+                            plate_results = alpr_service.detect(vehicle_region, priority=PRIORITY_REALTIME,
+                                                                timeout=ALPR_TIMEOUT_S)
+                        except (TimeoutError, AlprServiceStopped) as e:
+                            print(f"[ALPR REALTIME] ⚠️ ALPR unavailable for track {track_id}: {e}")
+                            plate_results = []
 
                         if plate_results and len(plate_results) > 0:
                             best_plate = max(plate_results, key=lambda p: p.get('confidence', 0))
@@ -1866,7 +2095,12 @@ def alpr_realtime_worker():
                                     py2_padded = min(full_frame.shape[0], py2 + padding_y)
 
                                     if px2_padded > px1_padded and py2_padded > py1_padded:
-                                        plate_crop = full_frame[py1_padded:py2_padded, px1_padded:px2_padded].copy()
+                                        # Copy crop nhỏ để không giữ cả frame gốc sống theo plate_crop
+                                        plate_crop = full_frame.crop(px1_padded, py1_padded, px2_padded, py2_padded).copy()
+
+                                # Thêm phiếu cho track → stage sau (violation) đọc từ cache
+                                plate_cache.add_reading(track_id, refined_plate, best_plate.get('confidence', 0),
+                                                        bbox=refined_plate_bbox, crop=plate_crop)
                 except Exception as e:
                     print(f"[ALPR WORKER] Lỗi FastALPR: {e}")
 
@@ -1897,7 +2131,7 @@ def alpr_realtime_worker():
 
 def best_frame_selector_worker():
     """THREAD 4: Best Frame Selector - Chọn frame tốt nhất"""
-    global best_frame_queue, violation_queue, violation_frame_buffer, camera_running
+    global best_frame_queue, violation_queue, camera_running
 
     print("[BEST FRAME] ✅ Thread 4 - Best Frame Selector đã khởi động")
 
@@ -1913,42 +2147,33 @@ def best_frame_selector_worker():
 
             # Chọn best frame từ buffer (nếu có)
             best_frame = full_frame
-            if track_id in violation_frame_buffer:
-                buffer_data = violation_frame_buffer[track_id]
-                if isinstance(buffer_data, dict) and 'frames' in buffer_data:
-                    frames_list = list(buffer_data['frames'])
-                    if frames_list:
-                        selected = select_best_frame(frames_list, vehicle_bbox)
-                        if selected is not None:
-                            best_frame = selected
-                            print(f"[BEST FRAME] ✅ Chọn best frame từ {len(frames_list)} frames")
+            track = track_table.lookup(track_id)
+            if track is not None and track.frames:
+                frames_list = list(track.frames)
+                selected = select_best_frame(frames_list, vehicle_bbox)
+                if selected is not None:
+                    best_frame = selected
+                    print(f"[BEST FRAME] ✅ Chọn best frame từ {len(frames_list)} frames")
 
             # Cập nhật full_frame với best_frame
             data['full_frame'] = best_frame
 
             # FIX: Thêm violation_timestamp và violation_frame vào data
-            # Lấy từ violation_frame_buffer (đã được set trong detection_worker)
-            print(f"[BEST FRAME DEBUG] track_id={track_id} in violation_frame_buffer? {track_id in violation_frame_buffer}")
-
-            if track_id in violation_frame_buffer:
-                buffer_data = violation_frame_buffer[track_id]
-                print(f"[BEST FRAME DEBUG] buffer_data type: {type(buffer_data)}")
-                print(f"[BEST FRAME DEBUG] buffer_data keys: {list(buffer_data.keys()) if isinstance(buffer_data, dict) else 'not dict'}")
-
-                if isinstance(buffer_data, dict):
-                    vts = buffer_data.get('violation_timestamp')
-                    vfr = buffer_data.get('violation_frame')
-                    print(f"[BEST FRAME DEBUG] violation_timestamp from buffer: {vts}")
-                    print(f"[BEST FRAME DEBUG] violation_frame from buffer: {vfr}")
-
-                    data['violation_timestamp'] = vts
-                    data['violation_frame'] = vfr
-                    print(f"[BEST FRAME] 📍 Added violation info: frame={data.get('violation_frame')}, timestamp={data.get('violation_timestamp')}")
-                else:
-                    print(f"[BEST FRAME DEBUG] ❌ buffer_data is not dict!")
+            # Lấy từ snapshot track_table (đã được set trong detection_worker)
+            print(f"[BEST FRAME DEBUG] track_id={track_id} in track_table? {track is not None}")
+
+            if track is not None:
+                vts = track.violation_timestamp
+                vfr = track.violation_frame
+                print(f"[BEST FRAME DEBUG] violation_timestamp from track_table: {vts}")
+                print(f"[BEST FRAME DEBUG] violation_frame from track_table: {vfr}")
+
+                data['violation_timestamp'] = vts
+                data['violation_frame'] = vfr
+                print(f"[BEST FRAME] 📍 Added violation info: frame={data.get('violation_frame')}, timestamp={data.get('violation_timestamp')}")
             else:
-                print(f"[BEST FRAME DEBUG] ❌ track_id {track_id} NOT in violation_frame_buffer!")
-                print(f"[BEST FRAME DEBUG] Available track_ids in buffer: {list(violation_frame_buffer.keys())}")
+                print(f"[BEST FRAME DEBUG] ❌ track_id {track_id} NOT in track_table!")
+                print(f"[BEST FRAME DEBUG] Available track_ids in track_table: {list(track_table.snapshot().keys())}")
 
             # Đẩy vào violation_queue
             try:
@@ -1965,7 +2190,7 @@ def best_frame_selector_worker():
 
 def violation_worker():
     """THREAD 5: Violation Worker - Lưu ảnh/video và database"""
-    global violation_queue, telegram_queue, original_frame_buffer, violation_frame_buffer, camera_running, video_fps, mysql, app, speed_limit, current_video_path
+    global violation_queue, telegram_queue, original_frame_buffer, camera_running, video_fps, mysql, app, speed_limit, current_video_path
 
     print("[VIOLATION THREAD] ✅ Đã khởi động")
 
@@ -1977,7 +2202,7 @@ def violation_worker():
             track_id = violation_data['track_id']
             detection = violation_data['detection']
             speed = violation_data['speed']
-            full_frame = violation_data.get('full_frame')  # ORIGINAL FRAME từ Detection Thread
+            full_frame = violation_data.get('full_frame')  # FrameHandle tới ORIGINAL FRAME từ Detection Thread
             plate = violation_data.get('plate')  # Biển số từ FastALPR (có thể None)
             plate_bbox = violation_data.get('plate_bbox')  # Bbox biển số (có thể None)
             plate_crop = violation_data.get('plate_crop')  # Plate đã crop từ Detection Thread (có thể None)
@@ -1994,27 +2219,29 @@ def violation_worker():
             # FIX: Luôn dùng full_frame để crop (đảm bảo bbox đúng với frame)
             # best_frame chỉ dùng để chọn frame tốt nhất, nhưng crop vẫn dùng full_frame
             best_frame = full_frame
-            if track_id in violation_frame_buffer:
-                buffer_data = violation_frame_buffer[track_id]
-                if isinstance(buffer_data, dict) and 'frames' in buffer_data:
-                    frames_list = list(buffer_data['frames'])
-                    if frames_list:
-                        selected_best = select_best_frame(frames_list, vehicle_bbox)
-                        if selected_best is not None:
-                            # Kiểm tra resolution của best_frame và full_frame
-                            best_h, best_w = selected_best.shape[:2]
-                            full_h, full_w = full_frame.shape[:2]
-                            
-                            if best_h == full_h and best_w == full_w:
-                                # Cùng resolution: dùng best_frame
-                                best_frame = selected_best
-                                print(f"[VIOLATION THREAD] ✅ Đã chọn best frame từ {len(frames_list)} frames (resolution match)")
-                            else:
-                                # Khác resolution: resize best_frame về full_frame resolution
-                                best_frame = cv2.resize(selected_best, (full_w, full_h), interpolation=cv2.INTER_LINEAR)
-                                print(f"[VIOLATION THREAD] ✅ Đã chọn best frame và resize về {full_w}x{full_h}")
-                        else:
-                            best_frame = full_frame
+            track = track_table.lookup(track_id)
+            if track is not None and track.frames:
+                frames_list = list(track.frames)
+                selected_best = select_best_frame(frames_list, vehicle_bbox)
+                if selected_best is not None:
+                    # Kiểm tra resolution của best_frame và full_frame
+                    best_h, best_w = selected_best.shape[:2]
+                    full_h, full_w = full_frame.shape[:2]
+                    
+                    if best_h == full_h and best_w == full_w:
+                        # Cùng resolution: dùng best_frame
+                        best_frame = selected_best
+                        print(f"[VIOLATION THREAD] ✅ Đã chọn best frame từ {len(frames_list)} frames (resolution match)")
+                    else:
+                        # Khác resolution: resize best_frame về full_frame resolution
+                        best_frame = cv2.resize(as_array(selected_best), (full_w, full_h), interpolation=cv2.INTER_LINEAR)
+                        print(f"[VIOLATION THREAD] ✅ Đã chọn best frame và resize về {full_w}x{full_h}")
+                else:
+                    best_frame = full_frame
+
+            # Từ đây làm việc trên ndarray (read-only view, không copy)
+            full_frame = as_array(full_frame)
+            best_frame = as_array(best_frame)
 
             # FIX: Đảm bảo vehicle_bbox hợp lệ và crop đúng
             x1, y1, x2, y2 = [int(v) for v in vehicle_bbox]
@@ -2039,25 +2266,45 @@ def violation_worker():
 
             # FIX: Đảm bảo crop hợp lệ
             if crop_x2 > crop_x1 and crop_y2 > crop_y1:
+                # Copy crop nhỏ: view sẽ giữ cả frame gốc sống theo các stage sau
                 vehicle_crop = best_frame[crop_y1:crop_y2, crop_x1:crop_x2].copy()
                 print(f"[VIOLATION THREAD] ✅ Crop vehicle: ({crop_x1}, {crop_y1}, {crop_x2}, {crop_y2}) from frame {best_frame.shape}, vehicle_crop size: {vehicle_crop.shape}")
             else:
                 print(f"[VIOLATION THREAD] ⚠️ Invalid crop coordinates, using full frame")
-                vehicle_crop = best_frame.copy()
+                vehicle_crop = best_frame
                 crop_x1, crop_y1 = 0, 0
             
             # FIX: Detect lại plate TRỰC TIẾP trên vehicle_crop để đảm bảo chính xác 100%
             # Không dùng plate_bbox từ full_frame vì có thể bị sai do resolution mismatch
             plate_crop = None
+
+            # Track đã confirmed biển số (plate_cache, đủ phiếu) → dùng luôn, KHÔNG chạy ALPR lần nữa
+            cached_plate = plate_cache.get(track_id)
+            if cached_plate and cached_plate['confirmed'] and cached_plate['crop'] is not None:
+                plate = cached_plate['plate']
+                plate_crop = cached_plate['crop']
+                print(f"[VIOLATION THREAD] 📋 Using confirmed plate from cache: {plate} ({cached_plate['votes']} votes)")
             
-            # Đảm bảo plate_detector_post được khởi tạo
-            if plate_detector_post is None:
+            # Đảm bảo alpr_service được khởi tạo
+            if plate_crop is None and alpr_service is None:
                 init_detector()
             
-            if plate_detector_post is not None:
+            # Xe quá nhỏ / nhoè / tối → không đọc được, KHÔNG tốn ALPR (dùng biển số có sẵn)
+            reject_reason = None
+            if plate_crop is None:
+                reject_reason = plate_quality_gate.check(vehicle_crop, KIND_VEHICLE)
+                if reject_reason is not None:
+                    print(f"[VIOLATION THREAD] ⏭️ Skip ALPR: vehicle crop {reject_reason}")
+
+            if plate_crop is None and reject_reason is None and alpr_service is not None:
                 try:
                     print(f"[VIOLATION THREAD] 🔍 Detecting plate trực tiếp trên vehicle_crop (size: {vehicle_crop.shape})")
-                    plate_results = plate_detector_post.detect(vehicle_crop)
+                    try:
+                        plate_results = alpr_service.detect(vehicle_crop, priority=PRIORITY_VIOLATION,
+                                                            timeout=ALPR_TIMEOUT_S)
+                    except (TimeoutError, AlprServiceStopped) as e:
+                        print(f"[VIOLATION THREAD] ⚠️ ALPR unavailable: {e}")
+                        plate_results = []
                     
                     if plate_results and len(plate_results) > 0:
                         # Chọn plate có confidence cao nhất
@@ -2155,13 +2402,14 @@ def violation_worker():
                     print(f"[VIDEO DEBUG] violation_timestamp from queue data = {violation_timestamp}")
                     print(f"[VIDEO DEBUG] violation_frame_num from queue data = {violation_frame_num}")
 
-                    # Fallback: lấy từ violation_frame_buffer nếu chưa có
+                    # Fallback: lấy từ snapshot track_table nếu chưa có
                     if violation_timestamp is None and violation_frame_num is None:
                         print(f"[VIDEO DEBUG] ⚠️ Data from queue is None, trying buffer fallback...")
-                        violation_info = violation_frame_buffer.get(track_id, {})
-                        print(f"[VIDEO DEBUG] violation_info from buffer = {violation_info}")
-                        violation_timestamp = violation_info.get('violation_timestamp')
-                        violation_frame_num = violation_info.get('violation_frame')
+                        violation_info = track_table.lookup(track_id)
+                        print(f"[VIDEO DEBUG] violation_info from track_table = {violation_info is not None}")
+                        if violation_info is not None:
+                            violation_timestamp = violation_info.violation_timestamp
+                            violation_frame_num = violation_info.violation_frame
                         print(f"[VIDEO DEBUG] violation_timestamp from buffer = {violation_timestamp}")
                         print(f"[VIDEO DEBUG] violation_frame_num from buffer = {violation_frame_num}")
                         print(f"[VIDEO DEBUG] Using violation info from buffer")
@@ -2545,7 +2793,7 @@ def video_thread():
     ✅ KHÔNG time.sleep() delay
     ✅ Video mượt, không giật
     """
-    global cap, camera_running, original_frame_buffer, detection_queue, video_fps, cap_lock, DETECTION_FREQUENCY, DETECTION_SCALE, current_video_path, stream_queue_clean, alpr_proactive_queue, active_tracks, active_tracks_lock
+    global cap, camera_running, original_frame_buffer, detection_queue, video_fps, cap_lock, DETECTION_FREQUENCY, DETECTION_SCALE, current_video_path, stream_queue_clean
 
     # Kiểm tra có video path không
     if current_video_path is None:
@@ -2573,15 +2821,17 @@ def video_thread():
             original_frame_buffer=original_frame_buffer,
             detection_frequency=DETECTION_FREQUENCY,
             detection_scale=DETECTION_SCALE,
-            cap_lock=cap_lock
+            cap_lock=cap_lock,
+            frame_store=frame_store,
+            motion_gate=motion_gate
         )
 
+        if motion_gate is not None:
+            motion_gate.reset()
+
         reader.start(
             stream_queue_clean=stream_queue_clean,
-            alpr_proactive_queue=alpr_proactive_queue,
-            alpr_frequency=3,
-            active_tracks=active_tracks,
-            active_tracks_lock=active_tracks_lock
+            alpr_proactive_queue=None  # ALPR proactive theo track (plate_cache), không quét toàn frame
         )
         
         time.sleep(0.5)
@@ -2731,7 +2981,7 @@ def start_video_thread():
         else:
             video_stream_thread = threading.Thread(target=video_thread, daemon=True)
             video_stream_thread.start()
-            print("[THREAD 1] ✅ Video Thread → detection_queue + stream_queue_clean + alpr_proactive_queue")
+            print("[THREAD 1] ✅ Video Thread → detection_queue + stream_queue_clean")
     except Exception as e:
         print(f"[THREAD 1] ❌ Error: {e}")
         import traceback
@@ -2745,12 +2995,10 @@ def start_video_thread():
     except Exception as e:
         print(f"[THREAD 2] ❌ Error: {e}")
 
-    try:
-        alpr_proactive_thread = threading.Thread(target=alpr_proactive_worker, daemon=True)
-        alpr_proactive_thread.start()
-        print("[THREAD 3] ✅ ALPR Proactive Worker → alpr_proactive_cache")
-    except Exception as e:
-        print(f"[THREAD 3] ❌ Error: {e}")
+    # THREAD 3: ALPR Service (sở hữu model ALPR, batch + ưu tiên) - khởi động trong init_detector()
+    init_detector()
+    if alpr_service is not None:
+        print("[THREAD 3] ✅ ALPR Service → plate_cache (proactive theo track) + realtime/violation")
 
     try:
         alpr_realtime_thread = threading.Thread(target=alpr_realtime_worker, daemon=True)
@@ -2930,7 +3178,7 @@ def video_generator():
 def video_generator_clean():
     """
     Stream User (Vi phạm) - Clean stream: Frame gốc, không có bounding box, không có overlay
-    Dùng để test/debug (video clean thực tế được gửi qua Telegram từ violation_frame_buffer)
+    Dùng để test/debug (video clean thực tế được gửi qua Telegram từ clip vi phạm trong track_table)
     """
     global cap, camera_running, original_frame_buffer, video_fps
 
@@ -2944,7 +3192,7 @@ def video_generator_clean():
         if cap is None:
             time.sleep(0.1)
             continue
-        if 'global' not in original_frame_buffer or len(original_frame_buffer['global']) == 0:
+        if len(original_frame_buffer) == 0:
             # Nếu không có frame, tạo frame đen để stream không bị lỗi
             black_frame = np.zeros((480, 640, 3), dtype=np.uint8)
             cv2.putText(black_frame, "Waiting for video...", (50, 240),
@@ -2966,9 +3214,9 @@ def video_generator_clean():
 
         # Lấy frame từ buffer - an toàn với try-except
         try:
-            if 'global' in original_frame_buffer and len(original_frame_buffer['global']) > 0:
-                frame_data = original_frame_buffer['global'][-1]  # Frame gốc (KHÔNG CÓ BOUNDING BOX)
-                frame = frame_data['frame'] if isinstance(frame_data, dict) else frame_data
+            frame_data = original_frame_buffer.latest()  # Frame gốc (KHÔNG CÓ BOUNDING BOX)
+            if frame_data is not None:
+                frame = as_array(frame_data['frame'])
             else:
                 raise IndexError("No frame in buffer")
         except (IndexError, TypeError, KeyError):
@@ -3086,7 +3334,7 @@ def detection_stream():
     }
     """
     def generate():
-        global current_detections, speed_limit, current_video_path
+        global speed_limit, current_video_path
         
         # Lấy video resolution từ video reader
         video_resolution = [1920, 1080]  # Default
@@ -3104,18 +3352,18 @@ def detection_stream():
         
         while True:
             try:
-                # Format detections từ current_detections dict
+                # Format detections từ snapshot track_table (track của frame mới nhất)
                 detections_list = []
-                for track_id, det in current_detections.items():
-                    vehicle_bbox = det.get('vehicle_bbox', [])
+                for track in track_table.visible():
+                    vehicle_bbox = track.bbox or []
                     if len(vehicle_bbox) == 4:
                         x1, y1, x2, y2 = vehicle_bbox
-                        speed = det.get('speed')
-                        vehicle_class = det.get('vehicle_class', 'vehicle')
-                        plate = det.get('plate', '')
+                        speed = track.speed
+                        vehicle_class = track.vehicle_class or 'vehicle'
+                        plate = track.plate or ''
                         
                         det_data = {
-                            'track_id': track_id,
+                            'track_id': track.track_id,
                             'bbox': [int(x1), int(y1), int(x2), int(y2)],
                             'speed': float(speed) if speed is not None else None,
                             'class': vehicle_class,
@@ -3298,7 +3546,7 @@ def upload_video():
 
                 # TỐI ƯU: Clear buffers để tránh frame cũ
                 admin_frame_buffer.clear()  # Clear dict
-                original_frame_buffer.clear()  # Clear dict
+                original_frame_buffer.clear()  # Clear ring + track ranges
                 # Clear stream_queue và violation_queue
                 while not stream_queue.empty():
                     try:
@@ -3341,7 +3589,17 @@ def upload_video():
                 # video_fps đã được set ở trên và đã khai báo global ở đầu function
 
                 # Khởi tạo tracker với pixel_to_meter phù hợp cho video upload
-                tracker = SpeedTracker(pixel_to_meter=0.2)
+                tracker = create_speed_tracker(save_path, pixel_to_meter=0.2)
+                if detector is not None:
+                    detector.reset_tracking()
+                removed_track_ids.clear()  # Event removed của nguồn cũ không áp lên track mới cùng ID
+                set_source_speed_trap(save_path)
+                if violation_decider is not None:
+                    violation_decider.reset()
+                plate_cache.clear()  # Track ID bắt đầu lại → biển số cũ không còn đúng
+                track_table.clear()  # Record cũ (tốc độ, biển số, clip vi phạm) không thuộc nguồn mới
+                plate_tracker.clear()
+                set_source_roi(save_path)
 
                 # QUAN TRỌNG: Set camera_running = True TRƯỚC khi start thread
                 # Đảm bảo video_thread() không bị block
@@ -3402,7 +3660,18 @@ def open_camera():
         cap = cv2.VideoCapture(0)
     # Camera thường chạy ở 30fps
     video_fps = 30
-    tracker = SpeedTracker(pixel_to_meter=0.13)
+    tracker = create_speed_tracker('camera', pixel_to_meter=0.13)
+    if detector is not None:
+        detector.reset_tracking()
+    removed_track_ids.clear()  # Event removed của nguồn cũ không áp lên track mới cùng ID
+    original_frame_buffer.clear()  # Track range của nguồn cũ
+    set_source_speed_trap('camera')
+    if violation_decider is not None:
+        violation_decider.reset()
+    plate_cache.clear()  # Track ID bắt đầu lại → biển số cũ không còn đúng
+    track_table.clear()  # Record cũ (tốc độ, biển số, clip vi phạm) không thuộc nguồn mới
+    plate_tracker.clear()
+    set_source_roi('camera')
     camera_running = True
     start_video_thread()
     return {"status": "ok"}
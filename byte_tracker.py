@@ -5,6 +5,7 @@ Optimized for vehicle tracking - NO MORE JITTERING!
 """
 import numpy as np
 from filterpy.kalman import KalmanFilter
+from oc_sort import iou_batch
 
 class TrackState:
     New = 0
@@ -15,6 +16,7 @@ class TrackState:
 class Track:
     def __init__(self, tlbr, score, cls, track_id, frame_id):
         self.tlbr = tlbr  # [x1, y1, x2, y2]
+        self.predicted = tlbr  # Vị trí predict của frame hiện tại (1 predict/frame)
         self.score = score
         self.cls = cls
         self.track_id = track_id
@@ -22,6 +24,7 @@ class Track:
         self.state = TrackState.New
         self.is_activated = False
         self.tracklet_len = 0
+        self.det_idx = -1  # Index của detection khớp ở frame gần nhất
         
         # KALMAN FILTER - FIX TRACKING BỊ LỆCH
         self.kf = KalmanFilter(dim_x=8, dim_z=4)
@@ -61,25 +64,25 @@ class Track:
         self.kf.P[-4:, -4:] *= 500.0  # Giảm từ 1000 xuống 500 để velocity ổn định nhanh hơn
     
     def predict(self):
-        """Predict next position using Kalman Filter - Cải thiện để tracking mượt hơn"""
+        """Predict next position using Kalman Filter - gọi ĐÚNG 1 lần mỗi frame"""
         self.kf.predict()
         predicted_tlbr = self.kf.x[:4].flatten()
         # Đảm bảo tọa độ hợp lệ
         if predicted_tlbr[2] > predicted_tlbr[0] and predicted_tlbr[3] > predicted_tlbr[1]:
-            return predicted_tlbr
+            self.predicted = predicted_tlbr
         else:
             # Fallback về tlbr hiện tại nếu prediction không hợp lệ
-            return self.tlbr
+            self.predicted = self.tlbr
+        return self.predicted
     
     def update(self, new_tlbr):
         """Update track with new detection - ưu tiên detection để theo kịp xe"""
-        # Update Kalman filter
+        # Update Kalman filter (đã predict ở đầu frame, KHÔNG predict lại)
         self.kf.update(new_tlbr.reshape((4, 1)))
         kalman_result = self.kf.x[:4].reshape((4,))
         
-        # Nếu detection mới khác nhiều với prediction, dùng detection trực tiếp (theo kịp xe)
-        predicted = self.predict()
-        if np.linalg.norm(new_tlbr - predicted) > 30:  # Giảm từ 50 xuống 30 để phản ứng nhanh hơn
+        # Nếu detection mới khác nhiều với prediction của frame này, dùng detection trực tiếp (theo kịp xe)
+        if np.linalg.norm(new_tlbr - self.predicted) > 30:  # Giảm từ 50 xuống 30 để phản ứng nhanh hơn
             # Dùng detection trực tiếp để theo kịp xe
             self.tlbr = new_tlbr
             # Cập nhật Kalman state để đồng bộ
@@ -88,6 +91,33 @@ class Track:
             # Dùng kết quả Kalman (mượt hơn)
             self.tlbr = kalman_result
 
+
+def greedy_match(iou_matrix, thresh):
+    """
+    Gated-greedy matching trên IoU matrix (vectorized)
+
+    Chỉ xét các cặp IoU >= thresh, theo thứ tự IoU giảm dần (giống hệt
+    greedy matching cũ), dùng mask boolean thay cho list.remove()
+
+    Returns:
+        matches [[row, col], ...], unmatched rows, unmatched cols
+    """
+    n_rows, n_cols = iou_matrix.shape
+    order = np.argsort(iou_matrix, axis=None)[::-1]
+    order = order[iou_matrix.ravel()[order] >= thresh]
+    rows, cols = np.unravel_index(order, iou_matrix.shape)
+
+    row_used = np.zeros(n_rows, dtype=bool)
+    col_used = np.zeros(n_cols, dtype=bool)
+    matches = []
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        if not row_used[i] and not col_used[j]:
+            matches.append([i, j])
+            row_used[i] = True
+            col_used[j] = True
+
+    return matches, np.flatnonzero(~row_used).tolist(), np.flatnonzero(~col_used).tolist()
+
 class BYTETracker:
     def __init__(self, frame_rate=30, track_thresh=0.2, track_buffer=30, match_thresh=0.4):
         self.frame_rate = frame_rate
@@ -111,114 +141,68 @@ class BYTETracker:
             list of Track objects
         """
         self.frame_id += 1
-        activated_tracks = []
-        refined_tracks = []
-        lost_tracks = []
-        removed_tracks = []
-        
-        # Separate high and low confidence detections
-        dets_high = detections[detections[:, 4] > self.track_thresh]
-        dets_low = detections[detections[:, 4] <= self.track_thresh]
-        
-        # Update existing tracks
-        unconfirmed = []
-        tracked_tracks = []
+        
+        # Separate high and low confidence detections (giữ index gốc để map track → detection)
+        high_idx = np.where(detections[:, 4] > self.track_thresh)[0]
+        dets_high = detections[high_idx]
+        
+        # 1 predict/frame cho mọi track (tracked + lost)
         for track in self.tracks:
-            if not track.is_activated:
-                unconfirmed.append(track)
-            else:
-                tracked_tracks.append(track)
-        
-        # Initialize unmatched indices - FIX: Phải khởi tạo TRƯỚC
-        u_track = []
-        u_det = list(range(len(dets_high)))
-        
-        # Simple matching based on IoU
-        if len(tracked_tracks) > 0 and len(dets_high) > 0:
-            matches, u_track, u_det = self.associate(tracked_tracks, dets_high)
-            
-            for itracked, idet in matches:
-                track = tracked_tracks[itracked]
-                det = dets_high[idet]
-                # Update với Kalman Filter - KHÔNG BỊ LỆCH
-                track.update(det[:4])
-                track.score = det[4]
-                track.cls = int(det[5])
-                track.tracklet_len += 1
-                track.frame_id = self.frame_id  # Update frame_id
-                activated_tracks.append(track)
-            
-            # Lost tracks - predict position để tracking mượt hơn
-            for it in u_track:
-                track = tracked_tracks[it]
-                if track.state != TrackState.Lost:
-                    track.state = TrackState.Lost
-                    # Predict vị trí tiếp theo dựa trên velocity
-                    track.tlbr = track.predict()
-                    lost_tracks.append(track)
-        else:
-            # No existing tracks or no detections
-            u_track = list(range(len(tracked_tracks)))
-            u_det = list(range(len(dets_high)))
-            # All existing tracks become lost
-            for track in tracked_tracks:
-                if track.state != TrackState.Lost:
-                    track.state = TrackState.Lost
-                    lost_tracks.append(track)
+            track.predict()
+        
+        # IoU matching trên vị trí predict (vectorized)
+        matches, u_track, u_det = self.associate(self.tracks, dets_high)
+        
+        for itracked, idet in matches:
+            track = self.tracks[itracked]
+            det = dets_high[idet]
+            # Update với Kalman Filter - KHÔNG BỊ LỆCH
+            track.update(det[:4])
+            track.score = det[4]
+            track.cls = int(det[5])
+            track.tracklet_len += 1
+            track.frame_id = self.frame_id  # Update frame_id
+            track.det_idx = int(high_idx[idet])
+            track.state = TrackState.Tracked
+        
+        # Lost tracks - đi theo vị trí predict để tracking mượt hơn
+        for it in u_track:
+            track = self.tracks[it]
+            track.state = TrackState.Lost
+            track.tlbr = track.predicted
+            if self.frame_id - track.frame_id > self.track_buffer:
+                track.state = TrackState.Removed
         
         # Create new tracks from unmatched detections
+        new_tracks = []
         for idet in u_det:
             det = dets_high[idet]
             self.track_id += 1
             track = Track(det[:4], det[4], int(det[5]), self.track_id, self.frame_id)
+            track.det_idx = int(high_idx[idet])
             track.is_activated = True
             track.state = TrackState.Tracked
-            activated_tracks.append(track)
-        
-        # Update lost tracks
-        for track in self.lost_tracks:
-            if self.frame_id - track.frame_id > self.track_buffer:
-                track.state = TrackState.Removed
-                removed_tracks.append(track)
-            else:
-                lost_tracks.append(track)
+            new_tracks.append(track)
         
-        # Update tracks
-        self.tracks = [t for t in self.tracks if t.state != TrackState.Removed]
-        self.tracks.extend(activated_tracks)
-        self.tracks.extend(lost_tracks)
-        self.lost_tracks = [t for t in lost_tracks if t.state != TrackState.Removed]
+        # Update tracks (mỗi track chỉ xuất hiện 1 lần)
+        self.tracks = [t for t in self.tracks if t.state != TrackState.Removed] + new_tracks
+        self.lost_tracks = [t for t in self.tracks if t.state == TrackState.Lost]
         
         # Return active tracks
         output_tracks = [t for t in self.tracks if t.is_activated and t.state == TrackState.Tracked]
         return output_tracks
     
     def associate(self, tracks, detections):
-        """Simple IoU-based association"""
+        """IoU-based association: IoU matrix vectorized + gated-greedy matching"""
         if len(tracks) == 0 or len(detections) == 0:
             return [], list(range(len(tracks))), list(range(len(detections)))
         
-        # Calculate IoU matrix
-        iou_matrix = np.zeros((len(tracks), len(detections)))
-        for i, track in enumerate(tracks):
-            for j, det in enumerate(detections):
-                iou_matrix[i, j] = self.iou(track.tlbr, det[:4])
-        
-        # Greedy matching
-        matches = []
-        u_track = list(range(len(tracks)))
-        u_det = list(range(len(detections)))
-        
-        # Sort by IoU descending
-        indices = np.unravel_index(np.argsort(iou_matrix, axis=None)[::-1], iou_matrix.shape)
+        track_boxes = np.array([track.predicted for track in tracks], dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iou_matrix = iou_batch(track_boxes, detections[:, :4].astype(np.float64))
+        iou_matrix = np.nan_to_num(iou_matrix, nan=0.0, posinf=0.0, neginf=0.0)
         
-        for i, j in zip(indices[0], indices[1]):
-            if iou_matrix[i, j] >= self.match_thresh and i in u_track and j in u_det:
-                matches.append([i, j])
-                u_track.remove(i)
-                u_det.remove(j)
-        
-        return matches, u_track, u_det
+        return greedy_match(iou_matrix, self.match_thresh)
     
     @staticmethod
     def iou(box1, box2):
@@ -241,3 +225,79 @@ class BYTETracker:
         
         return inter / union
 
+
+
+# =============================================================================
+# REGRESSION + BENCHMARK: python byte_tracker.py
+# =============================================================================
+
+def _reference_associate(track_boxes, detections, match_thresh):
+    """Association cũ (nested loop + greedy trên list) - chỉ dùng để so sánh"""
+    iou_matrix = np.zeros((len(track_boxes), len(detections)))
+    for i, box in enumerate(track_boxes):
+        for j, det in enumerate(detections):
+            iou_matrix[i, j] = BYTETracker.iou(box, det[:4])
+
+    matches = []
+    u_track = list(range(len(track_boxes)))
+    u_det = list(range(len(detections)))
+    indices = np.unravel_index(np.argsort(iou_matrix, axis=None)[::-1], iou_matrix.shape)
+    for i, j in zip(indices[0], indices[1]):
+        if iou_matrix[i, j] >= match_thresh and i in u_track and j in u_det:
+            matches.append([int(i), int(j)])
+            u_track.remove(i)
+            u_det.remove(j)
+    return matches, [int(i) for i in u_track], [int(j) for j in u_det]
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(42)
+
+    def random_boxes(n):
+        xy = rng.uniform(0, 1800, (n, 2))
+        wh = rng.uniform(40, 160, (n, 2))
+        boxes = np.concatenate([xy, xy + wh], axis=1)
+        return boxes
+
+    # 1. Regression fixture: association mới phải cho KẾT QUẢ GIỐNG HỆT association cũ
+    tracker = BYTETracker()
+    for n in (0, 1, 5, 20, 60, 150):
+        track_boxes = random_boxes(n)
+        dets = np.concatenate([
+            track_boxes + rng.normal(0, 6, track_boxes.shape),
+            rng.uniform(0.3, 1.0, (n, 1)),
+            np.full((n, 1), 2.0)
+        ], axis=1)
+        dets = np.concatenate([dets, np.concatenate([random_boxes(n // 4), np.ones((n // 4, 2))], axis=1)])
+        rng.shuffle(dets)
+
+        tracks = [Track(b, 1.0, 2, i, 0) for i, b in enumerate(track_boxes)]
+        expected = _reference_associate(track_boxes, dets, tracker.match_thresh)
+        actual = tracker.associate(tracks, dets)
+        assert actual == expected, f"Association mismatch with {n} tracks"
+    print("[REGRESSION] ✅ Vectorized association == reference association")
+
+    # 2. Benchmark association
+    for n in (20, 100, 300):
+        track_boxes = random_boxes(n)
+        dets = np.concatenate([
+            track_boxes + rng.normal(0, 6, track_boxes.shape),
+            np.ones((n, 1)), np.full((n, 1), 2.0)
+        ], axis=1)
+        tracks = [Track(b, 1.0, 2, i, 0) for i, b in enumerate(track_boxes)]
+        repeats = 20 if n <= 100 else 3
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            _reference_associate(track_boxes, dets, tracker.match_thresh)
+        t_old = (time.perf_counter() - t0) / repeats
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            tracker.associate(tracks, dets)
+        t_new = (time.perf_counter() - t0) / repeats
+
+        print(f"[BENCHMARK] {n:4d} tracks x {n:4d} dets | old: {t_old * 1000:8.2f} ms | "
+              f"new: {t_new * 1000:6.2f} ms | speed-up: {t_old / t_new:6.1f}x")
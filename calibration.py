@@ -0,0 +1,97 @@
+# calibration.py
+"""
+Ground Calibration - Quy đổi pixel -> mét trên mặt đường bằng HOMOGRAPHY
+=========================================================================
+
+1 hệ số pixel_to_meter cho cả khung hình sai hoàn toàn khi có phối cảnh
+(xe ở xa: 1 pixel = nhiều mét, xe ở gần: 1 pixel = vài cm).
+
+NGUYÊN TẮC:
+✅ Mỗi camera/video có 4 cặp điểm ảnh <-> mặt đất (mét)
+✅ Homography 3x3 tính 1 lần khi load, cache lại
+✅ Quy đổi TẤT CẢ điểm của 1 frame trong 1 phép nhân ma trận
+✅ Dùng điểm tiếp đất của xe (đáy giữa bbox) - điểm nằm trên mặt đường
+
+File cấu hình (JSON), key = tên file video hoặc 'camera', 'default' là fallback.
+image_points là pixel của frame GỐC (độ phân giải video nguồn):
+    {
+        "camera": {
+            "image_points": [[420, 310], [860, 310], [1180, 700], [90, 700]],
+            "ground_points": [[0.0, 30.0], [7.0, 30.0], [7.0, 0.0], [0.0, 0.0]]
+        }
+    }
+"""
+import cv2
+import numpy as np
+
+from source_config import load_source_config, get_source_entry
+
+
+class GroundCalibration:
+    """
+    Homography ảnh -> mặt đất (mét) từ 4 cặp điểm
+    """
+
+    def __init__(self, image_points, ground_points):
+        """
+        Args:
+            image_points: 4 điểm [x, y] pixel trên frame gốc
+            ground_points: 4 điểm [X, Y] tương ứng trên mặt đất (mét)
+        """
+        image_points = np.asarray(image_points, dtype=np.float32)
+        ground_points = np.asarray(ground_points, dtype=np.float32)
+        if image_points.shape != (4, 2) or ground_points.shape != (4, 2):
+            raise ValueError(
+                f"Calibration needs exactly 4 image/ground point pairs, "
+                f"got {image_points.shape} and {ground_points.shape}"
+            )
+
+        self.image_points = image_points
+        self.ground_points = ground_points
+        self.homography = cv2.getPerspectiveTransform(image_points, ground_points).astype(np.float64)
+        if not np.all(np.isfinite(self.homography)):
+            raise ValueError("Degenerate calibration points (3 points are collinear?)")
+
+    def to_ground(self, points):
+        """
+        Quy đổi nhiều điểm ảnh -> toạ độ mặt đất (mét) trong 1 lượt
+
+        Args:
+            points: (N, 2) pixel (x, y)
+
+        Returns:
+            (N, 2) mét (X, Y)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        projected = points @ self.homography[:, :2].T + self.homography[:, 2]
+        return projected[:, :2] / projected[:, 2:3]
+
+    def ground_anchors(self, bboxes):
+        """Điểm tiếp đất (đáy giữa bbox) của (N, 4) bbox -> (N, 2) mét"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        anchors = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2.0, bboxes[:, 3]], axis=1)
+        return self.to_ground(anchors)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['image_points'], data['ground_points'])
+
+
+def load_calibration_config(path):
+    """
+    Đọc file calibration
+
+    Returns:
+        Dict {source_key: GroundCalibration}, rỗng nếu không có file
+    """
+    return load_source_config(path, GroundCalibration.from_dict, 'CALIBRATION')
+
+
+def get_source_calibration(config, source):
+    """
+    Calibration cho 1 nguồn: khớp tên file video (basename) / 'camera', fallback 'default'
+
+    Returns:
+        GroundCalibration hoặc None (dùng pixel_to_meter)
+    """
+    return get_source_entry(config, source)
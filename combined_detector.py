@@ -23,30 +23,145 @@ except Exception as e:
     PLATE_DETECTOR_AVAILABLE = False
     print(f"⚠️  PlateDetector import failed: {e}")
 
-# OC-SORT tracking - TỐI ƯU CHO WEB
-try:
-    from oc_sort import OCSort
-    OCSORT_AVAILABLE = True
-except Exception as e:
-    OCSORT_AVAILABLE = False
-    try:
-        from byte_tracker import BYTETracker
-        BYTETRACK_AVAILABLE = True
-    except:
-        BYTETRACK_AVAILABLE = False
+# Tracking tách khỏi detection - backend chọn theo config (OC-SORT / ByteTrack / YOLO built-in)
+from tracker_backends import create_tracker_backend, empty_detections
+from model_registry import get_model
+from track_events import TrackLifecycle
+
+
+def letterbox_params(mask_shape, frame_shape):
+    """
+    Tham số letterbox của YOLO (input model -> frame gốc)
+
+    Returns:
+        gain, pad_x, pad_y: toạ độ frame = (toạ độ mask - pad) / gain
+    """
+    mh, mw = mask_shape[:2]
+    h, w = frame_shape[:2]
+    gain = min(mh / h, mw / w)
+    pad_x = round((mw - w * gain) / 2 - 0.1)
+    pad_y = round((mh - h * gain) / 2 - 0.1)
+    return gain, pad_x, pad_y
+
+
+def masks_to_boxes(mask_data, frame_shape, min_area=100, threshold=0.5):
+    """
+    Tight bbox + centroid cho TẤT CẢ mask cùng lúc, ở độ phân giải gốc của mask
+
+    Dùng row/column projection (vectorized) thay cho resize từng mask lên
+    full frame + findContours + moments. Kết quả được scale ngược letterbox
+    về toạ độ frame gốc.
+
+    Args:
+        mask_data: (N, mh, mw) torch tensor hoặc numpy array (retina_masks=False)
+        frame_shape: Shape frame gốc (H, W, ...)
+        min_area: Diện tích tối thiểu (pixel frame gốc), nhỏ hơn -> invalid
+        threshold: Ngưỡng nhị phân hoá mask
+
+    Returns:
+        boxes: (N, 4) int [x1, y1, x2, y2] trong frame gốc
+        centroids: (N, 2) float (cx, cy) center of mass trong frame gốc
+        valid: (N,) bool - False nếu mask rỗng / quá nhỏ (dùng bbox YOLO)
+    """
+    binary = mask_data > threshold
+    if hasattr(binary, 'cpu'):
+        # Torch: projection chạy trên device, chỉ copy (N, mh) + (N, mw) về CPU
+        row_counts = binary.sum(dim=2).cpu().numpy()
+        col_counts = binary.sum(dim=1).cpu().numpy()
+    else:
+        row_counts = binary.sum(axis=2)
+        col_counts = binary.sum(axis=1)
+
+    n, mh = row_counts.shape
+    mw = col_counts.shape[1]
+    gain, pad_x, pad_y = letterbox_params((mh, mw), frame_shape)
+    h, w = frame_shape[:2]
+
+    area = row_counts.sum(axis=1).astype(np.float64)
+    rows_any = row_counts > 0
+    cols_any = col_counts > 0
+
+    # Hàng/cột đầu tiên và cuối cùng có pixel (x2, y2 exclusive như boundingRect)
+    mx1 = cols_any.argmax(axis=1)
+    mx2 = mw - cols_any[:, ::-1].argmax(axis=1)
+    my1 = rows_any.argmax(axis=1)
+    my2 = mh - rows_any[:, ::-1].argmax(axis=1)
+
+    boxes = np.stack([
+        np.clip((mx1 - pad_x) / gain, 0, w),
+        np.clip((my1 - pad_y) / gain, 0, h),
+        np.clip((mx2 - pad_x) / gain, 0, w),
+        np.clip((my2 - pad_y) / gain, 0, h),
+    ], axis=1).round().astype(int)
+
+    # Center of mass = trung bình toạ độ tâm pixel, có trọng số theo projection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cx = col_counts @ (np.arange(mw) + 0.5) / area
+        cy = row_counts @ (np.arange(mh) + 0.5) / area
+    centroids = np.stack([(cx - pad_x) / gain, (cy - pad_y) / gain], axis=1)
+
+    valid = (area / gain ** 2) >= max(min_area, 1)
+    return boxes, centroids, valid
+
+
+
+MASK_MODES = ('none', 'local', 'rle')
+
+
+def encode_mask_rle(mask):
+    """
+    Run-length encode 1 binary mask (row-major)
+
+    Returns:
+        {'size': (h, w), 'counts': uint32 array} - các run xen kẽ 0/1, bắt đầu bằng 0
+    """
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return {'size': mask.shape[:2], 'counts': np.zeros(1, dtype=np.uint32)}
+
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], change, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {'size': mask.shape[:2], 'counts': counts.astype(np.uint32)}
+
+
+def decode_mask_rle(rle):
+    """RLE -> binary mask uint8 (h, w)"""
+    h, w = rle['size']
+    counts = rle['counts']
+    values = np.arange(len(counts), dtype=np.uint8) % 2
+    return np.repeat(values, counts).reshape(h, w)
+
+
+def mask_to_array(mask):
+    """Mask của detection (bbox-local ndarray hoặc RLE dict) -> ndarray, None nếu không có"""
+    if mask is None:
+        return None
+    if isinstance(mask, dict):
+        return decode_mask_rle(mask)
+    return mask
 
 
 class CombinedDetector:
-    def __init__(self, yolo_model='yolo11n-seg.pt', device=None):
+    def __init__(self, yolo_model='yolo11n-seg.pt', device=None, tracker_backend='ocsort',
+                 mask_mode='local', detect_model=None):
         """
         Khởi tạo detector với SEGMENTATION support
         - Vehicle detection: YOLO Segmentation (pixel-perfect bboxes)
-        - Tracking: OC-SORT hoặc ByteTrack (mượt)
+        - Tracking: backend riêng (OC-SORT / ByteTrack) hoặc YOLO built-in
         - Plate reading: Fast-ALPR (chỉ chạy khi có xe)
 
         Args:
             yolo_model: Path to YOLO segmentation model (yolo11n-seg.pt)
             device: 'cuda', 'mps', or 'cpu'
+            tracker_backend: 'ocsort', 'bytetrack' hoặc 'ultralytics'
+            mask_mode: Cách lưu mask trong detection dict
+                - 'none'  : Không cần mask → chạy model detection-only (nhanh nhất)
+                - 'local' : Mask bbox-local uint8 (kích thước = vehicle_bbox)
+                - 'rle'   : Mask bbox-local dạng run-length encoding (nhỏ nhất)
+            detect_model: Model detection-only cho mask_mode='none'
+                          (mặc định: yolo_model bỏ '-seg', vd. yolo11n.pt)
         """
         # Auto-detect device
         if device is None:
@@ -73,12 +188,37 @@ class CombinedDetector:
         if not YOLO_AVAILABLE:
             raise ImportError("YOLO is not available. Please install: pip install ultralytics")
 
+        mask_mode = (mask_mode or 'local').lower()
+        if mask_mode not in MASK_MODES:
+            raise ValueError(f"Unknown mask mode: {mask_mode} (choose from {MASK_MODES})")
+        self.mask_mode = mask_mode
+
+        # Không cần mask → dùng model detection-only (bỏ head segmentation)
+        seg_model = yolo_model
+        if mask_mode == 'none' and 'seg' in yolo_model.lower():
+            yolo_model = detect_model or yolo_model.replace('-seg', '')
+            print(f">>> Mask mode 'none': using detection-only model {yolo_model}")
+
         # ============================================
         # 1. VEHICLE DETECTION (YOLO SEGMENTATION)
         # ============================================
-        print(f">>> Loading YOLO SEGMENTATION model: {yolo_model}")
+        print(f">>> Loading YOLO model: {yolo_model}")
+        # Registry: cùng weights + device chỉ load 1 lần. Riêng backend 'ultralytics'
+        # giữ state tracker trong model (persist=True) → KHÔNG dùng chung
+        if tracker_backend == 'ultralytics':
+            load_yolo = YOLO
+        else:
+            def load_yolo(name):
+                return get_model(name, lambda: YOLO(name), device=device)
         try:
-            self.yolo = YOLO(yolo_model)
+            try:
+                self.yolo = load_yolo(yolo_model)
+            except Exception as e:
+                if yolo_model == seg_model:
+                    raise
+                print(f"⚠️  Detection-only model loading failed: {e}, falling back to {seg_model}")
+                yolo_model = seg_model
+                self.yolo = load_yolo(yolo_model)
             self.device = device
 
             # Verify segmentation support
@@ -101,35 +241,37 @@ class CombinedDetector:
         }
 
         # ============================================
-        # 2. TRACKING - OC-SORT hoặc ByteTrack
+        # 2. TRACKING - Backend riêng, KHÔNG gắn vào model
         # ============================================
-        if OCSORT_AVAILABLE:
-            print(">>> Loading OC-SORT (smooth tracking)...")
-            try:
-                self.tracker = OCSort(det_thresh=0.25, iou_threshold=0.3, use_byte=False)
-                self.tracker_type = 'ocsort'
-                print("✅ OC-SORT tracker initialized")
-            except Exception as e:
-                print(f"⚠️  OC-SORT init failed: {e}, trying ByteTrack...")
-                self.tracker = None
-                self.tracker_type = None
-        else:
-            self.tracker = None
-            self.tracker_type = None
+        print(f">>> Loading tracker backend: {tracker_backend}...")
+        try:
+            self.tracker = create_tracker_backend(tracker_backend)
+        except Exception as e:
+            print(f"⚠️  Tracker backend '{tracker_backend}' init failed: {e}, using YOLO built-in")
+            self.tracker = create_tracker_backend('ultralytics')
+        if self.tracker.uses_model_tracking:
+            if tracker_backend != 'ultralytics':
+                # Fallback sang tracker built-in: model đang dùng chung qua registry
+                # → load instance riêng để state tracker không lẫn giữa các detector
+                self.yolo = YOLO(yolo_model)
+            self.tracker.bind(self.yolo)
+        self.tracker_type = self.tracker.name
+        print(f"✅ Tracker backend initialized: {self.tracker_type}")
+
+        # ROI polygon của nguồn hiện tại (None = toàn frame), xem set_roi()
+        self.roi = None
+
+        # Event track_started / track_lost / track_removed cho các store theo track
+        self.track_events = TrackLifecycle()
 
         # ============================================
-        # 3. PLATE DETECTOR (Fast-ALPR)
+        # 3. PLATE DETECTOR (Fast-ALPR) - LAZY
         # ============================================
-        if PLATE_DETECTOR_AVAILABLE:
-            print(">>> Loading Plate Detector (Fast-ALPR)...")
-            try:
-                self.plate_detector = PlateDetector()
-                print("✅ Plate detector initialized")
-            except Exception as e:
-                print(f"⚠️  Plate detector init failed: {e}")
-                self.plate_detector = None
-        else:
-            self.plate_detector = None
+        # app.py đọc biển số theo track qua alpr_service (enable_plate_detection=False)
+        # → chỉ load Fast-ALPR khi có caller bật plate detection, xem plate_detector
+        self._plate_detector = None
+        self._plate_detector_loaded = False
+        if not PLATE_DETECTOR_AVAILABLE:
             print("⚠️  Plate detector not available")
 
         print("=" * 60)
@@ -137,10 +279,25 @@ class CombinedDetector:
         print(f"   - Model: {yolo_model}")
         print(f"   - Device: {device}")
         print(f"   - Segmentation: {self.is_segmentation}")
-        print(f"   - Tracker: {self.tracker_type or 'YOLO built-in'}")
-        print(f"   - Plate detector: {'✅' if self.plate_detector else '❌'}")
+        print(f"   - Mask mode: {self.mask_mode}")
+        print(f"   - Tracker: {self.tracker_type}")
+        print(f"   - Plate detector: {'lazy' if PLATE_DETECTOR_AVAILABLE else '❌'}")
         print("=" * 60)
 
+    @property
+    def plate_detector(self):
+        """PlateDetector, load lần đầu khi detect(enable_plate_detection=True) - None nếu không có"""
+        if not self._plate_detector_loaded:
+            self._plate_detector_loaded = True
+            if PLATE_DETECTOR_AVAILABLE:
+                print(">>> Loading Plate Detector (Fast-ALPR)...")
+                try:
+                    self._plate_detector = PlateDetector()
+                    print("✅ Plate detector initialized")
+                except Exception as e:
+                    print(f"⚠️  Plate detector init failed: {e}")
+        return self._plate_detector
+
     def extract_bbox_from_mask(self, mask, original_bbox=None, min_area=100):
         """
         Extract tight bounding box from segmentation mask
@@ -207,7 +364,33 @@ class CombinedDetector:
                 return original_bbox, (cx, cy)
             return None, None
 
-    def detect(self, frame, enable_plate_detection=False, enable_tracking=True):
+    def _local_mask(self, native_mask, bbox, letterbox):
+        """
+        Cắt mask (độ phân giải model) theo bbox rồi resize về kích thước bbox
+
+        Chỉ resize vùng bbox - KHÔNG resize cả mask lên full frame.
+
+        Returns:
+            Binary mask (y2-y1, x2-x1) uint8, gốc toạ độ tại (x1, y1) của bbox
+        """
+        x1, y1, x2, y2 = bbox
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        gain, pad_x, pad_y = letterbox
+        mh, mw = native_mask.shape[:2]
+        mx1 = min(max(int(np.floor(x1 * gain + pad_x)), 0), mw - 1)
+        my1 = min(max(int(np.floor(y1 * gain + pad_y)), 0), mh - 1)
+        mx2 = min(max(int(np.ceil(x2 * gain + pad_x)), mx1 + 1), mw)
+        my2 = min(max(int(np.ceil(y2 * gain + pad_y)), my1 + 1), mh)
+
+        return cv2.resize(
+            native_mask[my1:my2, mx1:mx2],
+            (x2 - x1, y2 - y1),
+            interpolation=cv2.INTER_NEAREST
+        )
+
+    def detect(self, frame, enable_plate_detection=False, enable_tracking=True, track_states=None):
         """
         Detect vehicles with SEGMENTATION and optionally plates
 
@@ -215,6 +398,8 @@ class CombinedDetector:
             frame: Input frame (BGR)
             enable_plate_detection: Whether to detect plates
             enable_tracking: Whether to enable tracking
+            track_states: List nhận (tracked_ids, alive_ids) của frame thay vì gọi
+                          track_events.observe() ngay (xem detect_batch)
 
         Returns:
             List of detections:
@@ -224,161 +409,362 @@ class CombinedDetector:
                 'vehicle_bbox': (x1, y1, x2, y2),  # TIGHT from mask
                 'vehicle_centroid': (cx, cy),       # Center of mass
                 'confidence': float,
-                'mask': np.array or None,           # Segmentation mask
+                'mask': np.array, dict or None,     # Mask bbox-local (ndarray hoặc RLE theo mask_mode)
                 'plate': str or None,
                 'plate_bbox': (x1, y1, x2, y2) or None,
                 'plate_confidence': float or None
             }
         """
+        if not self.tracker.uses_model_tracking:
+            # Detection thuần + tracker backend riêng
+            return self.detect_batch([frame], enable_plate_detection, enable_tracking, track_states)[0]
+
+        states = []
+        detections = self._detect_tracked(frame, enable_plate_detection, enable_tracking, states)
+        self._emit_track_states(states or [None], track_states)
+        return detections
+
+    def _detect_tracked(self, frame, enable_plate_detection, enable_tracking, states):
+        """detect() với YOLO built-in tracking, (tracked_ids, alive_ids) ghi vào states"""
         if frame is None or frame.size == 0:
             return []
 
-        detections = []
-
         try:
-            # Run vehicle detection
-            results = self.yolo.track(
-                frame,
-                persist=True,
+            roi_frame, offset = self._roi_input(frame)
+
+            # Run vehicle detection + YOLO built-in tracking
+            results = self.tracker.track(
+                roi_frame,
                 conf=0.25,
                 classes=list(self.vehicle_classes.keys()),
                 verbose=False,
                 device=self.device,
-                retina_masks=True if self.is_segmentation else False
+                retina_masks=False
             )
 
             if not results or len(results) == 0:
                 return []
 
             result = results[0]
+            keep = self._roi_keep(result, frame.shape, offset)
+            # Chưa có track được xác nhận (boxes.id None) → track_id = index như trước
+            track_ids = None
+            if result.boxes is not None and result.boxes.id is not None:
+                track_ids = self.tracker.update(result.boxes.data.cpu().numpy())
+            detections = self._parse_result(result, roi_frame, enable_plate_detection,
+                                            track_ids=track_ids, keep=keep, offset=offset,
+                                            plate_frame=self._roi_source(frame, roi_frame, offset))
+            if enable_tracking:
+                states.append(([det['track_id'] for det in detections], None))
+            return detections
 
-            if result.boxes is None or len(result.boxes) == 0:
-                return []
+        except Exception as e:
+            print(f"[DETECTOR] ❌ Detection error: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+
+    def detect_batch(self, frames, enable_plate_detection=False, enable_tracking=True, track_states=None):
+        """
+        Detect NHIỀU frame trong 1 forward pass (batched inference)
+
+        - YOLO chạy detection thuần 1 lần cho cả batch (giảm overhead mỗi lần gọi model)
+        - Tracker backend vẫn chạy TUẦN TỰ theo đúng thứ tự frame
+        - Backend 'ultralytics' (tracking trong model) → fallback detect() từng frame
+
+        Args:
+            frames: List frame BGR (đúng thứ tự thời gian)
+            enable_plate_detection: Whether to detect plates
+            enable_tracking: False → track_id = index detection trong frame
+            track_states: None → gọi track_events.observe() ngay sau tracker update.
+                          List → thêm (tracked_ids, alive_ids) của TỪNG frame (None nếu
+                          frame không tracking) để caller observe khi xử lý đúng frame đó,
+                          tránh event lost/removed của cả batch đến trước frame đầu
+
+        Returns:
+            List (cùng độ dài với frames) các list detections như detect()
+        """
+        if self.tracker.uses_model_tracking:
+            batch_results, states = [], []
+            for frame in frames:
+                frame_states = []
+                batch_results.append(self._detect_tracked(frame, enable_plate_detection,
+                                                          enable_tracking, frame_states))
+                states.append(frame_states[0] if frame_states else None)
+            self._emit_track_states(states, track_states)
+            return batch_results
+
+        batch_results = [[] for _ in frames]
+        states = [None] * len(frames)
+        valid_idx = [i for i, frame in enumerate(frames) if frame is not None and frame.size > 0]
+        if not valid_idx:
+            self._emit_track_states(states, track_states)
+            return batch_results
+
+        roi_inputs = {i: self._roi_input(frames[i]) for i in valid_idx}
+
+        try:
+            results = self.yolo.predict(
+                [roi_inputs[i][0] for i in valid_idx],
+                conf=0.25,
+                classes=list(self.vehicle_classes.keys()),
+                verbose=False,
+                device=self.device,
+                retina_masks=False
+            )
+        except Exception as e:
+            print(f"[DETECTOR] ❌ Batch detection error: {e}")
+            import traceback
+            traceback.print_exc()
+            self._emit_track_states(states, track_states)
+            return batch_results
 
-            # Check if we have masks (segmentation)
-            has_masks = hasattr(result, 'masks') and result.masks is not None and self.is_segmentation
+        for i, result in zip(valid_idx, results):
+            try:
+                roi_frame, offset = roi_inputs[i]
+                keep = self._roi_keep(result, frames[i].shape, offset)
+                track_ids = self._update_tracker(result, keep, offset) if enable_tracking else None
+                if track_ids is not None:
+                    states[i] = (list(track_ids.values()), self.tracker.alive_track_ids())
+                batch_results[i] = self._parse_result(
+                    result, roi_frame, enable_plate_detection, track_ids=track_ids,
+                    keep=keep, offset=offset,
+                    plate_frame=self._roi_source(frames[i], roi_frame, offset)
+                )
+            except Exception as e:
+                print(f"[DETECTOR] ❌ Batch post-processing error: {e}")
+
+        self._emit_track_states(states, track_states)
+        return batch_results
+
+    def _emit_track_states(self, states, track_states):
+        """Observe ngay (track_states None) hoặc trả state từng frame cho caller"""
+        if track_states is not None:
+            track_states.extend(states)
+            return
+        for state in states:
+            if state is not None:
+                self.track_events.observe(*state)
+
+    def _update_tracker(self, result, keep=None, offset=(0, 0)):
+        """
+        Đưa [x1, y1, x2, y2, score, cls] của 1 frame vào tracker backend
 
-            # Process each detection
-            for idx in range(len(result.boxes)):
-                box = result.boxes[idx]
+        Args:
+            keep: Bool mask detection nằm trong ROI (None = giữ tất cả)
+            offset: (x, y) của ROI crop trong full frame
+
+        Returns:
+            Dict {detection index trong result.boxes: track_id}
+        """
+        if result.boxes is None or len(result.boxes) == 0:
+            return self.tracker.update(empty_detections())
+
+        dets = result.boxes.data.cpu().numpy()[:, :6].copy()
+        dets[:, [0, 2]] += offset[0]
+        dets[:, [1, 3]] += offset[1]
+        if keep is None:
+            return self.tracker.update(dets)
+
+        # Detection ngoài ROI bị loại TRƯỚC tracking → map index về result.boxes
+        kept_idx = np.flatnonzero(keep)
+        track_ids = self.tracker.update(dets[kept_idx])
+        return {int(kept_idx[k]): track_id for k, track_id in track_ids.items()}
+
+    def reset_tracking(self):
+        """Reset tracker (khi đổi video/camera) - track ID bắt đầu lại"""
+        self.tracker.reset()
+        self.track_events.reset()
+
+    def set_roi(self, roi):
+        """Đặt ROI polygon (roi.RoiPolygon) cho nguồn hiện tại, None = toàn frame"""
+        self.roi = roi
+
+    def _roi_input(self, frame):
+        """
+        Input cho model: bounding rect của ROI, ngoài polygon tô đen
+
+        Returns:
+            (input_frame, (offset_x, offset_y))
+        """
+        if self.roi is None:
+            return frame, (0, 0)
+        return self.roi.apply(frame)
+
+    @staticmethod
+    def _roi_source(frame, roi_frame, offset):
+        """
+        Vùng frame gốc (CHƯA tô đen) cùng toạ độ với input của model
+
+        ROI chỉ dùng để lọc xe; crop biển số lấy từ đây để xe nằm sát biên
+        polygon không bị mất nửa biển số (view, không copy)
+        """
+        if roi_frame is frame:
+            return frame
+        x, y = offset
+        h, w = roi_frame.shape[:2]
+        return frame[y:y + h, x:x + w]
+
+    def _roi_keep(self, result, frame_shape, offset):
+        """Bool mask các box có điểm tiếp đất nằm trong ROI (None nếu không có ROI)"""
+        if self.roi is None or result.boxes is None or len(result.boxes) == 0:
+            return None
+        boxes = result.boxes.xyxy.cpu().numpy() + [offset[0], offset[1], offset[0], offset[1]]
+        return self.roi.contains_boxes(boxes, frame_shape)
+
+    def _parse_result(self, result, frame, enable_plate_detection=False, track_ids=None,
+                      keep=None, offset=(0, 0), plate_frame=None):
+        """
+        Chuyển 1 kết quả YOLO thành list detection dict
+
+        Args:
+            frame: Frame đã đưa vào model (ROI crop nếu có ROI)
+            track_ids: Dict {idx: track_id} từ tracker riêng, None = dùng box.id của YOLO
+            keep: Bool mask detection nằm trong ROI (None = giữ tất cả)
+            offset: (x, y) của ROI crop - bbox trả về được dịch về toạ độ full frame
+            plate_frame: Frame chưa tô đen cùng toạ độ với frame (crop biển số), None = frame
+        """
+        detections = []
+        if plate_frame is None:
+            plate_frame = frame
+
+        if result.boxes is None or len(result.boxes) == 0:
+            return []
 
-                # Get class
-                cls_id = int(box.cls[0])
-                if cls_id not in self.vehicle_classes:
+        # Check if we have masks (segmentation)
+        has_masks = hasattr(result, 'masks') and result.masks is not None and self.is_segmentation
+
+        # Tight bbox + centroid cho tất cả mask 1 lần (độ phân giải gốc của mask)
+        mask_boxes = None
+        if has_masks:
+            try:
+                mask_data = result.masks.data
+                mask_boxes, mask_centroids, mask_valid = masks_to_boxes(mask_data, frame.shape)
+                if self.mask_mode != 'none':
+                    native_masks = mask_data > 0.5
+                    if hasattr(native_masks, 'cpu'):
+                        native_masks = native_masks.cpu().numpy()
+                    native_masks = native_masks.astype(np.uint8)
+                    letterbox = letterbox_params(native_masks.shape[1:], frame.shape)
+            except Exception as e:
+                print(f"[DETECTOR] ⚠️  Mask processing error: {e}")
+                mask_boxes = None
+
+        # Process each detection
+        for idx in range(len(result.boxes)):
+            box = result.boxes[idx]
+
+            # Get class
+            cls_id = int(box.cls[0])
+            if cls_id not in self.vehicle_classes:
+                continue
+
+            if keep is not None and not keep[idx]:
+                continue
+
+            vehicle_class = self.vehicle_classes[cls_id]
+            confidence = float(box.conf[0])
+
+            # Get original bbox from YOLO
+            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+            original_bbox = (int(x1), int(y1), int(x2), int(y2))
+
+            # Get track ID
+            if track_ids is not None:
+                if idx not in track_ids:
+                    # Track chưa được xác nhận
                     continue
+                track_id = track_ids[idx]
+            elif hasattr(box, 'id') and box.id is not None:
+                track_id = int(box.id[0])
+            else:
+                track_id = idx
 
-                vehicle_class = self.vehicle_classes[cls_id]
-                confidence = float(box.conf[0])
+            # Extract mask and get tight bbox + centroid
+            mask = None
+            tight_bbox = original_bbox
+            centroid = ((x1 + x2) / 2, (y1 + y2) / 2)
 
-                # Get original bbox from YOLO
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                original_bbox = (int(x1), int(y1), int(x2), int(y2))
+            if mask_boxes is not None and idx < len(mask_boxes):
+                try:
+                    if mask_valid[idx]:
+                        tight_bbox = tuple(int(v) for v in mask_boxes[idx])
+                        centroid = (float(mask_centroids[idx][0]), float(mask_centroids[idx][1]))
+                    if self.mask_mode != 'none':
+                        mask = self._local_mask(native_masks[idx], tight_bbox, letterbox)
+                        if mask is not None and self.mask_mode == 'rle':
+                            mask = encode_mask_rle(mask)
+                except Exception as e:
+                    # Fallback to original bbox
+                    mask = None
+                    tight_bbox = original_bbox
+
+            # Create detection dict
+            detection = {
+                'track_id': track_id,
+                'vehicle_class': vehicle_class,
+                'vehicle_bbox': tight_bbox,
+                'vehicle_centroid': centroid,
+                'confidence': confidence,
+                'mask': mask,
+                'plate': None,
+                'plate_bbox': None,
+                'plate_confidence': None
+            }
 
-                # Get track ID
-                if hasattr(box, 'id') and box.id is not None:
-                    track_id = int(box.id[0])
-                else:
-                    track_id = idx
+            # Detect plate if enabled
+            if enable_plate_detection and self.plate_detector is not None:
+                vx1, vy1, vx2, vy2 = tight_bbox
 
-                # Extract mask and get tight bbox + centroid
-                mask = None
-                tight_bbox = original_bbox
-                centroid = ((x1 + x2) / 2, (y1 + y2) / 2)
+                h, w = plate_frame.shape[:2]
+                vx1 = max(0, vx1)
+                vy1 = max(0, vy1)
+                vx2 = min(w, vx2)
+                vy2 = min(h, vy2)
+
+                if vx2 > vx1 and vy2 > vy1:
+                    vehicle_crop = plate_frame[vy1:vy2, vx1:vx2]
 
-                if has_masks and idx < len(result.masks):
                     try:
-                        # Get mask
-                        mask_data = result.masks[idx]
-
-                        if hasattr(mask_data, 'data'):
-                            mask = mask_data.data[0].cpu().numpy()
-                        else:
-                            mask = mask_data.cpu().numpy()
-
-                        # Resize mask to frame size
-                        if mask.shape[0] != frame.shape[0] or mask.shape[1] != frame.shape[1]:
-                            mask = cv2.resize(
-                                mask,
-                                (frame.shape[1], frame.shape[0]),
-                                interpolation=cv2.INTER_LINEAR
-                            )
-
-                        # Threshold to binary
-                        mask = (mask > 0.5).astype(np.uint8)
-
-                        # Extract tight bbox from mask
-                        extracted_bbox, extracted_centroid = self.extract_bbox_from_mask(
-                            mask,
-                            original_bbox
-                        )
-
-                        if extracted_bbox is not None:
-                            tight_bbox = extracted_bbox
-                            centroid = extracted_centroid
+                        plate_results = self.plate_detector.detect(vehicle_crop)
+
+                        if plate_results and len(plate_results) > 0:
+                            best_plate = max(plate_results, key=lambda p: p.get('confidence', 0))
+
+                            plate_bbox_crop = best_plate.get('bbox')
+                            if plate_bbox_crop:
+                                px1, py1, px2, py2 = plate_bbox_crop
+
+                                plate_bbox = (
+                                    int(vx1 + px1),
+                                    int(vy1 + py1),
+                                    int(vx1 + px2),
+                                    int(vy1 + py2)
+                                )
 
+                                detection['plate_bbox'] = plate_bbox
+                                detection['plate_confidence'] = best_plate.get('confidence', 0)
+                                detection['plate'] = best_plate.get('text', '')
                     except Exception as e:
-                        # Fallback to original bbox
-                        mask = None
-                        tight_bbox = original_bbox
-
-                # Create detection dict
-                detection = {
-                    'track_id': track_id,
-                    'vehicle_class': vehicle_class,
-                    'vehicle_bbox': tight_bbox,
-                    'vehicle_centroid': centroid,
-                    'confidence': confidence,
-                    'mask': mask,
-                    'plate': None,
-                    'plate_bbox': None,
-                    'plate_confidence': None
-                }
-
-                # Detect plate if enabled
-                if enable_plate_detection and self.plate_detector is not None:
-                    vx1, vy1, vx2, vy2 = tight_bbox
-
-                    h, w = frame.shape[:2]
-                    vx1 = max(0, vx1)
-                    vy1 = max(0, vy1)
-                    vx2 = min(w, vx2)
-                    vy2 = min(h, vy2)
-
-                    if vx2 > vx1 and vy2 > vy1:
-                        vehicle_crop = frame[vy1:vy2, vx1:vx2]
-
-                        try:
-                            plate_results = self.plate_detector.detect(vehicle_crop)
-
-                            if plate_results and len(plate_results) > 0:
-                                best_plate = max(plate_results, key=lambda p: p.get('confidence', 0))
-
-                                plate_bbox_crop = best_plate.get('bbox')
-                                if plate_bbox_crop:
-                                    px1, py1, px2, py2 = plate_bbox_crop
-
-                                    plate_bbox = (
-                                        int(vx1 + px1),
-                                        int(vy1 + py1),
-                                        int(vx1 + px2),
-                                        int(vy1 + py2)
-                                    )
-
-                                    detection['plate_bbox'] = plate_bbox
-                                    detection['plate_confidence'] = best_plate.get('confidence', 0)
-                                    detection['plate'] = best_plate.get('text', '')
-                        except Exception as e:
-                            pass
-
-                detections.append(detection)
+                        pass
 
-            return detections
+            if offset != (0, 0):
+                self._shift_detection(detection, *offset)
 
-        except Exception as e:
-            print(f"[DETECTOR] ❌ Detection error: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            detections.append(detection)
+
+        return detections
+
+    @staticmethod
+    def _shift_detection(detection, dx, dy):
+        """Dịch bbox / centroid / plate bbox từ toạ độ ROI crop về full frame"""
+        x1, y1, x2, y2 = detection['vehicle_bbox']
+        detection['vehicle_bbox'] = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+        cx, cy = detection['vehicle_centroid']
+        detection['vehicle_centroid'] = (cx + dx, cy + dy)
+        if detection['plate_bbox'] is not None:
+            px1, py1, px2, py2 = detection['plate_bbox']
+            detection['plate_bbox'] = (px1 + dx, py1 + dy, px2 + dx, py2 + dy)
 
     def draw_detections(self, frame, detection, speed=None, speed_limit=40,
                        draw_mask=False, mask_alpha=0.3):
@@ -389,7 +775,7 @@ class CombinedDetector:
             vehicle_bbox = detection.get('vehicle_bbox')
             vehicle_class = detection.get('vehicle_class', 'vehicle')
             track_id = detection.get('track_id', 0)
-            mask = detection.get('mask')
+            mask = mask_to_array(detection.get('mask'))
             centroid = detection.get('vehicle_centroid')
 
             if vehicle_bbox is None:
@@ -406,12 +792,15 @@ class CombinedDetector:
             # Draw mask overlay if enabled
             if draw_mask and mask is not None:
                 try:
-                    mask_overlay = np.zeros_like(frame)
-                    mask_overlay[mask > 0] = color
-                    cv2.addWeighted(frame, 1.0, mask_overlay, mask_alpha, 0, frame)
-
-                    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                    cv2.drawContours(frame, contours, -1, color, 2)
+                    # Mask là bbox-local → chỉ blend trong vùng bbox
+                    roi = frame[y1:y1 + mask.shape[0], x1:x1 + mask.shape[1]]
+                    local = mask[:roi.shape[0], :roi.shape[1]]
+                    mask_overlay = np.zeros_like(roi)
+                    mask_overlay[local > 0] = color
+                    cv2.addWeighted(roi, 1.0, mask_overlay, mask_alpha, 0, roi)
+
+                    contours, _ = cv2.findContours(local, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                    cv2.drawContours(frame, contours, -1, color, 2, offset=(x1, y1))
                 except:
                     pass
 
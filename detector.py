@@ -1,24 +1,45 @@
 # detector.py
 import cv2
+import numpy as np
+from types import SimpleNamespace
 from fast_alpr import ALPR
 from difflib import SequenceMatcher
 import torch
 
-# Memory chống nhận diện sai biển số
-plate_memory = {}  # bbox_hash -> stable plate text
+from model_registry import get_model
+from plate_quality import PlateQualityGate, KIND_PLATE
+from ttl_store import TTLStore
+
+# Memory chống nhận diện sai biển số (bbox_hash -> stable plate text)
+# TTL + capacity: bbox_hash gần như không lặp lại → dict thường sẽ tăng mãi
+plate_memory = TTLStore(ttl=30.0, capacity=1024)
 
 
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
 
+def supports_batch_ocr(alpr):
+    """
+    ALPR có dùng được OCR batch không (fast-alpr 0.3.0 + fast-plate-ocr 1.0.x, xem requirements.txt):
+    ocr.ocr_model.run(list ảnh, return_confidence=True) với OCR model ảnh xám
+    """
+    ocr_model = getattr(getattr(alpr, 'ocr', None), 'ocr_model', None)
+    config = getattr(ocr_model, 'config', None)
+    return callable(getattr(ocr_model, 'run', None)) and getattr(config, 'image_color_mode', None) == 'grayscale'
+
+
 class PlateDetector:
-    def __init__(self, device=None):
+    def __init__(self, device=None, quality_gate=None):
         """
         Khởi tạo Fast-ALPR với GPU support
         Args:
             device: 'cuda', 'mps', hoặc None (auto-detect)
+            quality_gate: PlateQualityGate - crop biển số không đạt thì bỏ qua OCR
+                (None = ngưỡng mặc định)
         """
+        self.quality_gate = quality_gate or PlateQualityGate()
+
         # Auto-detect device nếu không chỉ định
         if device is None:
             try:
@@ -47,38 +68,152 @@ class PlateDetector:
         print(f">>> Loading Fast-ALPR on {device.upper()}...")
         
         try:
-            # Fast-ALPR với GPU support - thử với device parameter trước
-            try:
-                self.alpr = ALPR(
-                    detector_model="yolo-v9-t-384-license-plate-end2end",
-                    ocr_model="cct-s-v1-global-model",
-                    device=device  # Pass device to Fast-ALPR
-                )
-                print(f">>> ✅ Fast-ALPR Loaded on {device.upper()}!")
-            except TypeError:
-                # Nếu Fast-ALPR không hỗ trợ device parameter, thử không truyền
-                # Fast-ALPR sẽ tự động detect device
-                print(f">>> Fast-ALPR không hỗ trợ device parameter, sử dụng auto-detect...")
-                self.alpr = ALPR(
-                    detector_model="yolo-v9-t-384-license-plate-end2end",
-                    ocr_model="cct-s-v1-global-model"
-                )
-                print(f">>> ✅ Fast-ALPR Loaded (device auto-detected on {device.upper()})!")
+            # Registry: ALPR cùng device chỉ load 1 lần cho cả process
+            # (CombinedDetector, EnhancedPlateDetector, init_detector đều tạo PlateDetector)
+            self.alpr = get_model(
+                "fast-alpr:yolo-v9-t-384-license-plate-end2end+cct-s-v1-global-model",
+                lambda: self._load_alpr(device),
+                device=device,
+            )
         except Exception as e:
             print(f"❌ Error loading Fast-ALPR: {e}")
             import traceback
             traceback.print_exc()
             raise RuntimeError(f"❌ Failed to load Fast-ALPR: {e}")
 
+        # Chọn đường OCR 1 lần: batch (1 lần run cho mọi crop) hoặc ocr.predict từng crop
+        # Cả 2 đường đều dùng alpr.detector + quality gate như nhau
+        self._batch_ocr = supports_batch_ocr(self.alpr)
+        if not self._batch_ocr:
+            print("[PlateDetector] ⚠️  Batch OCR unavailable for this fast_alpr version, using per-crop OCR")
+
+    @staticmethod
+    def _load_alpr(device):
+        try:
+            # Fast-ALPR với GPU support - thử với device parameter trước
+            alpr = ALPR(
+                detector_model="yolo-v9-t-384-license-plate-end2end",
+                ocr_model="cct-s-v1-global-model",
+                device=device  # Pass device to Fast-ALPR
+            )
+            print(f">>> ✅ Fast-ALPR Loaded on {device.upper()}!")
+        except TypeError:
+            # Nếu Fast-ALPR không hỗ trợ device parameter, thử không truyền
+            # Fast-ALPR sẽ tự động detect device
+            print(f">>> Fast-ALPR không hỗ trợ device parameter, sử dụng auto-detect...")
+            alpr = ALPR(
+                detector_model="yolo-v9-t-384-license-plate-end2end",
+                ocr_model="cct-s-v1-global-model"
+            )
+            print(f">>> ✅ Fast-ALPR Loaded (device auto-detected on {device.upper()})!")
+        return alpr
+
     def detect(self, frame):
         """
         Nhận diện biển số trong frame bằng Fast-ALPR
         Trả về danh sách biển số với bounding box chính xác
         """
-        results = self.alpr.predict(frame)
+        # Cùng đường với batch → crop biển số qua quality gate trước OCR
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        """
+        Nhận diện biển số cho NHIỀU ảnh: plate detector chạy từng ảnh,
+        OCR chạy 1 lượt cho tất cả plate crop của cả batch
+
+        Returns:
+            List kết quả (như detect()) theo đúng thứ tự frames
+        """
+        return [self._parse_results(results) for results in self._predict_batch(frames)]
+
+    def _predict_batch(self, frames):
+        """Giống ALPR.predict nhưng gom plate crop (đã qua quality gate) của mọi ảnh vào 1 lần OCR"""
+        detections, crops, owners = [], [], []
+        for i, frame in enumerate(frames):
+            for detection in self.alpr.detector.predict(frame):
+                bbox = detection.bounding_box
+                x1, y1 = max(bbox.x1, 0), max(bbox.y1, 0)
+                x2, y2 = min(bbox.x2, frame.shape[1]), min(bbox.y2, frame.shape[0])
+                crop = frame[y1:y2, x1:x2]
+                # Biển số quá nhỏ / nhoè / tối / sai tỉ lệ → không thể đọc, bỏ qua OCR
+                if crop.size == 0 or self.quality_gate.check(crop, KIND_PLATE) is not None:
+                    continue
+                detections.append(detection)
+                crops.append(crop)
+                owners.append(i)
+
+        batch_results = [[] for _ in frames]
+        for detection, owner, reading in zip(detections, owners, self._ocr_batch(crops)):
+            batch_results[owner].append(SimpleNamespace(detection=detection, ocr=reading))
+        return batch_results
+
+    def _ocr_batch(self, crops):
+        """
+        OCR cho list crop biển số BGR → list reading (text, confidence) giống hệt
+        alpr.ocr.predict() từng crop (ảnh xám, bỏ ký tự padding '_')
+        """
+        if not crops:
+            return []
+        if self._batch_ocr:
+            try:
+                return self._run_ocr_batch(crops)
+            except TypeError as e:
+                # fast-plate-ocr khác bản đã pin (kiểu kết quả run() đổi) → từ giờ OCR từng crop
+                print(f"[PlateDetector] ⚠️  Batch OCR failed ({e}), switching to per-crop OCR")
+                self._batch_ocr = False
+        return [self.alpr.ocr.predict(crop) for crop in crops]
+
+    def _run_ocr_batch(self, crops):
+        # OCR model (cct-s-v1-global-model) nhận ảnh xám - giống DefaultOCR.predict
+        crops = [cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop for crop in crops]
+        output = self.alpr.ocr.ocr_model.run(crops, return_confidence=True)
+        # fast-plate-ocr 1.0.x: (list text, ndarray (N, slots)) - kiểm tra như DefaultOCR.predict
+        if not (isinstance(output, tuple) and len(output) == 2
+                and isinstance(output[0], list) and isinstance(output[1], np.ndarray)):
+            raise TypeError(f"unexpected OCR output type: {type(output).__name__}")
+        texts, probabilities = output
+        # fast_plate_ocr pad text bằng '_' tới max_plate_slots
+        return [SimpleNamespace(text=text.replace('_', ''), confidence=float(np.mean(probs)))
+                for text, probs in zip(texts, probabilities)]
+
+    def recognize_batch(self, plate_crops, scores=None):
+        """
+        CHỈ chạy OCR (bỏ qua plate detector) cho các crop biển số đã biết vị trí
+        (plate_tracker dự đoán bbox biển số từ track xe)
+
+        Args:
+            plate_crops: List crop biển số
+            scores: Độ tin cậy vị trí của từng crop (điểm match), dùng như detection confidence
+
+        Returns:
+            List kết quả (như detect(), bbox theo toạ độ crop) theo đúng thứ tự plate_crops
+        """
+        scores = scores or [1.0] * len(plate_crops)
+        detections, crops, owners = [], [], []
+        for i, (crop, score) in enumerate(zip(plate_crops, scores)):
+            if crop.size == 0 or self.quality_gate.check(crop, KIND_PLATE) is not None:
+                continue
+            h, w = crop.shape[:2]
+            box = SimpleNamespace(x1=0, y1=0, x2=w, y2=h)
+            detections.append(SimpleNamespace(bounding_box=box, confidence=score))
+            crops.append(crop)
+            owners.append(i)
+
+        batch_results = [[] for _ in plate_crops]
+        for detection, owner, reading in zip(detections, owners, self._ocr_batch(crops)):
+            batch_results[owner].append(SimpleNamespace(detection=detection, ocr=reading))
+        return [self._parse_results(results, stabilize=False) for results in batch_results]
+
+    def _parse_results(self, results, stabilize=True):
+        """
+        Kết quả ALPR (detection + ocr) → list dict biển số đã ổn định
 
+        stabilize=False: bỏ qua plate_memory (bbox theo toạ độ crop biển số không phân biệt được xe)
+        """
         plates = []
         for r in results:
+            if r.ocr is None:
+                continue
             try:
                 # ============================
                 # BBOX - Lấy chính xác từ Fast-ALPR
@@ -134,18 +269,18 @@ class PlateDetector:
                 # ============================
                 # ỔN ĐỊNH BIỂN SỐ
                 # ============================
-                if bbox_hash in plate_memory:
-                    old_plate = plate_memory[bbox_hash]
-
-                    # Nếu giống nhau > 80% => dùng biển cũ (ổn định hơn)
-                    if similar(old_plate, plate_text) > 0.8:
-                        plate_text = old_plate
+                if stabilize:
+                    old_plate = plate_memory.get(bbox_hash)
+                    if old_plate is not None:
+                        # Nếu giống nhau > 80% => dùng biển cũ (ổn định hơn)
+                        if similar(old_plate, plate_text) > 0.8:
+                            plate_text = old_plate
+                        else:
+                            # OCR sai quá → bỏ qua biển số này
+                            continue
                     else:
-                        # OCR sai quá → bỏ qua biển số này
-                        continue
-                else:
-                    # Lần đầu thấy bbox này
-                    plate_memory[bbox_hash] = plate_text
+                        # Lần đầu thấy bbox này
+                        plate_memory.set(bbox_hash, plate_text)
 
                 # ============================
                 # Trả về kết quả với đầy đủ thông tin
@@ -5,10 +5,27 @@ Enhanced Plate Detector với nhiều phương pháp fallback:
 2. Preprocessing nâng cao (nhiều phương pháp enhance)
 3. EasyOCR fallback (nếu Fast-ALPR không đọc được)
 4. Ensemble kết quả từ nhiều phương pháp
+
+Preprocessing chạy theo cascade (preprocess_cascade.py):
+- Phương pháp rẻ (clahe, sharpen, bright, contrast) chọn theo success rate / thời gian
+  đo được vừa phần budget của mỗi crop, chạy từng vòng (1 batch Fast-ALPR / phương pháp)
+  cho crop chưa đọc được, dừng khi hết budget
+- Phương pháp chậm (denoise, combined) + EasyOCR chạy trên worker pool giới hạn,
+  stage gọi chỉ chờ tới hết budget
+- Fast-ALPR CHỈ được gọi trên thread gọi detect / detect_batch (thread ALPR service
+  sở hữu model): worker pool chỉ preprocessing + EasyOCR (reader có lock riêng)
 """
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 import cv2
 import numpy as np
 from detector import PlateDetector
+from model_registry import get_model
+from plate_quality import PlateQualityGate, KIND_VEHICLE, REJECT_TOO_SMALL, REJECT_BLURRY
+from preprocess_cascade import PreprocessCascade, CHEAP_METHODS, SLOW_METHODS
 
 # Thử import EasyOCR (optional)
 try:
@@ -21,12 +38,35 @@ except ImportError:
 
 
 class EnhancedPlateDetector:
-    def __init__(self):
-        """Khởi tạo Enhanced Plate Detector với nhiều phương pháp"""
+    def __init__(self, budget_ms=400, slow_workers=2, quality_gate=None):
+        """
+        Khởi tạo Enhanced Plate Detector với nhiều phương pháp
+
+        Args:
+            budget_ms: Budget thời gian cho các bước fallback của 1 lần gọi (ms), chia đều cho
+                các crop chưa đọc được; mặc định đủ cho 1 phương pháp chậm (~250-300ms) sau tier rẻ
+            slow_workers: Số thread cho fallback chậm (denoise, combined, EasyOCR)
+            quality_gate: PlateQualityGate dùng chung với Fast-ALPR (None = ngưỡng mặc định)
+        """
         print(">>> Loading Enhanced Plate Detector...")
+
+        self.budget = budget_ms / 1000.0
+        self.cascade = PreprocessCascade()
+        self.slow_pool = ThreadPoolExecutor(max_workers=slow_workers, thread_name_prefix='plate-slow')
+        # Tối đa 2 job / worker (đang chạy + chờ), đầy → bỏ fallback chậm cho crop
+        self._slow_slots = threading.BoundedSemaphore(slow_workers * 2)
+        self._easyocr_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.slow_submitted = 0
+        self.slow_skipped = 0
+        self.slow_timeouts = 0
+        self.slow_over_budget = 0
+        # Thời gian Fast-ALPR / ảnh (trung bình trượt) - giữ chỗ trong budget cho batch ALPR
+        self._alpr_seconds = 0.02
         
-        # 1. Fast-ALPR (chính)
-        self.fast_alpr = PlateDetector()
+        # 1. Fast-ALPR (chính) - crop biển số qua quality gate trước OCR
+        self.quality_gate = quality_gate or PlateQualityGate()
+        self.fast_alpr = PlateDetector(quality_gate=self.quality_gate)
         
         # 2. EasyOCR (fallback) - chỉ load nếu cần
         self.easyocr_reader = None
@@ -34,7 +74,12 @@ class EnhancedPlateDetector:
             try:
                 print(">>> Loading EasyOCR (fallback)...")
                 # Chỉ load tiếng Việt và tiếng Anh để nhanh hơn
-                self.easyocr_reader = easyocr.Reader(['vi', 'en'], gpu=True, verbose=False)
+                # Registry: reader dùng chung nếu EnhancedPlateDetector bị tạo lại
+                self.easyocr_reader = get_model(
+                    'easyocr:vi+en',
+                    lambda: easyocr.Reader(['vi', 'en'], gpu=True, verbose=False),
+                    device='gpu',
+                )
                 print(">>> ✅ EasyOCR loaded!")
             except Exception as e:
                 print(f">>> ⚠️ EasyOCR load failed: {e}")
@@ -163,49 +208,200 @@ class EnhancedPlateDetector:
         
         Flow:
         1. Thử Fast-ALPR với ảnh gốc
-        2. Nếu không có kết quả, thử Fast-ALPR với các preprocessing khác nhau
-        3. Nếu vẫn không có, thử EasyOCR
+        2. Nếu không có kết quả, thử Fast-ALPR với các preprocessing rẻ (1 batch)
+        3. Nếu vẫn không có, preprocessing chậm + EasyOCR trên worker pool (trong budget)
         4. Ensemble kết quả từ tất cả các phương pháp
         """
+        return self._detect_from([img], [self.detect_with_fast_alpr(img, 'default')])[0]
+
+    def detect_batch(self, imgs):
+        """
+        Detect nhiều ảnh: bước 1 (Fast-ALPR ảnh gốc) chạy batch, các bước fallback
+        (preprocessing, EasyOCR) chỉ chạy cho ảnh chưa đọc được
+        """
+        return self._detect_from(imgs, self.fast_alpr.detect_batch(imgs))
+
+    def recognize_batch(self, plate_crops, scores=None):
+        """
+        Chỉ OCR crop biển số đã định vị (plate_tracker) - KHÔNG chạy cascade:
+        đọc không ra thì lần sau caller detect đầy đủ
+        """
+        batch_results = self.fast_alpr.recognize_batch(plate_crops, scores)
+        for results in batch_results:
+            for r in results:
+                r['method'] = 'fast_alpr_tracked'
+        return batch_results
+
+    def _detect_from(self, imgs, first_results):
+        """Flow detect() từ bước 2, với first_results = kết quả Fast-ALPR trên ảnh gốc"""
+        start = time.perf_counter()
+        deadline = start + self.budget
         all_results = []
         
-        # 1. Thử Fast-ALPR với ảnh gốc
-        results = self.detect_with_fast_alpr(img, 'default')
-        if results:
-            for r in results:
+        # 1. Kết quả Fast-ALPR với ảnh gốc
+        for results in first_results:
+            for r in results or []:
                 r['method'] = 'fast_alpr_default'
-                all_results.append(r)
-        
-        # 2. Nếu không có kết quả, thử các preprocessing methods
-        if not all_results:
-            preprocess_methods = ['clahe', 'sharpen', 'denoise', 'bright', 'contrast', 'combined']
-            
-            for method in preprocess_methods:
-                results = self.detect_with_fast_alpr(img, method)
-                if results:
-                    for r in results:
-                        r['method'] = f'fast_alpr_{method}'
-                        all_results.append(r)
-                    # Nếu đã có kết quả tốt, có thể dừng sớm
-                    if any(r.get('confidence', 0) > 0.7 for r in results):
-                        break
+            all_results.append(list(results or []))
         
-        # 3. Nếu vẫn không có kết quả, thử EasyOCR
-        if not all_results and self.easyocr_reader:
-            print("[Enhanced] Fast-ALPR không đọc được, thử EasyOCR...")
-            # Thử EasyOCR với ảnh đã preprocess
-            for method in ['default', 'clahe', 'sharpen', 'combined']:
-                processed_img = self.preprocess_image(img, method)
-                results = self.detect_with_easyocr(processed_img)
-                if results:
-                    all_results.extend(results)
-                    break
+        # 2. Ảnh chưa đọc được → các preprocessing rẻ, gom 1 batch Fast-ALPR
+        #    Crop quá nhỏ / nhoè thì preprocessing cũng không cứu được → bỏ qua fallback
+        failed = [i for i, results in enumerate(all_results)
+                  if not results and self.quality_gate.evaluate(imgs[i], KIND_VEHICLE)['reason']
+                  not in (REJECT_TOO_SMALL, REJECT_BLURRY)]
+        if failed:
+            self._run_cheap(imgs, failed, all_results, deadline)
+
+        # 3. Vẫn chưa đọc được → preprocessing chậm + EasyOCR trên worker pool
+        failed = [i for i in failed if not all_results[i]]
+        if failed and time.perf_counter() < deadline:
+            self._run_slow(imgs, failed, all_results, deadline)
         
         # 4. Ensemble kết quả - chọn kết quả tốt nhất
+        return [self._ensemble(results) for results in all_results]
+
+    def _run_cheap(self, imgs, failed, all_results, deadline):
+        """
+        Các preprocessing rẻ: plan theo phần budget của 1 crop, mỗi vòng 1 phương pháp
+        (1 lần detect_batch) cho các crop CHƯA đọc được, không bắt đầu vòng mới khi hết budget
+        """
+        share = (deadline - time.perf_counter()) / len(failed)
+        for method in self.cascade.plan(CHEAP_METHODS, share):
+            pending = [i for i in failed if not all_results[i]]
+            if not pending or time.perf_counter() >= deadline:
+                return
+            variants, prep_times = [], []
+            for i in pending:
+                t0 = time.perf_counter()
+                variants.append(self.preprocess_image(imgs[i], method))
+                prep_times.append(time.perf_counter() - t0)
+
+            for i, prep_time, results in zip(pending, prep_times, self._alpr_batch(variants)):
+                self.cascade.record(method, bool(results), prep_time + self._alpr_seconds)
+                for r in results:
+                    r['method'] = f'fast_alpr_{method}'
+                    all_results[i].append(r)
+
+    def _alpr_batch(self, variants):
+        """Fast-ALPR cho list ảnh (thread gọi), cập nhật thời gian ALPR / ảnh"""
+        t0 = time.perf_counter()
+        batch_results = self.fast_alpr.detect_batch(variants)
+        per_image = (time.perf_counter() - t0) / max(len(variants), 1)
+        self._alpr_seconds = 0.8 * self._alpr_seconds + 0.2 * per_image
+        return batch_results
+
+    def _run_slow(self, imgs, failed, all_results, deadline):
+        """
+        Fallback chậm, chờ tối đa tới deadline (job chưa chạy thì huỷ)
+
+        Worker pool CHỈ chạy phần CPU (denoise / combined) và EasyOCR; Fast-ALPR trên
+        ảnh đã preprocess chạy lại trên thread gọi (thread ALPR service sở hữu model)
+        """
+        # Chỉ phương pháp có thời gian ước lượng vừa phần budget còn lại
+        remaining = deadline - time.perf_counter()
+        methods = [m for m in self.cascade.order(SLOW_METHODS) if self.cascade.estimated_cost(m) <= remaining]
+        if not methods:
+            with self._stats_lock:
+                self.slow_over_budget += len(failed)
+        futures = self._submit_slow([((i, method), self._prepare_variant, imgs[i], method)
+                                     for i in failed for method in methods])
+        # Giữ chỗ cho batch Fast-ALPR trên các ảnh đã preprocess (tính vào deadline)
+        prep_deadline = deadline - self._alpr_seconds * len(futures)
+        variants, owners, prep_times = [], [], []
+        for (i, method), (variant, prep_time) in self._collect_slow(futures, prep_deadline):
+            variants.append(variant)
+            owners.append((i, method))
+            prep_times.append(prep_time)
+
+        if variants:
+            batch_results = self._alpr_batch(variants)
+            for (i, method), prep_time, results in zip(owners, prep_times, batch_results):
+                self.cascade.record(method, bool(results), prep_time + self._alpr_seconds)
+                for r in results:
+                    r['method'] = f'fast_alpr_{method}'
+                    all_results[i].append(r)
+
+        # Vẫn không đọc được → EasyOCR (model riêng, chỉ worker pool dùng, khoá _easyocr_lock)
+        failed = [i for i in failed if not all_results[i]]
+        if failed and self.easyocr_reader and time.perf_counter() < deadline:
+            futures = self._submit_slow([(i, self._easyocr_fallback, imgs[i], deadline) for i in failed])
+            for i, results in self._collect_slow(futures, deadline):
+                all_results[i].extend(results)
+
+    def _submit_slow(self, jobs):
+        """
+        Đưa job (key, fn, *args) lên worker pool, mỗi job giữ 1 slot
+
+        Returns:
+            List (key, future); hết slot → bỏ job (đếm slow_skipped)
+        """
+        futures = []
+        for key, fn, *args in jobs:
+            if not self._slow_slots.acquire(blocking=False):
+                with self._stats_lock:
+                    self.slow_skipped += 1
+                continue
+            future = self.slow_pool.submit(fn, *args)
+            future.add_done_callback(lambda _: self._slow_slots.release())
+            futures.append((key, future))
+            with self._stats_lock:
+                self.slow_submitted += 1
+        return futures
+
+    def _collect_slow(self, futures, deadline):
+        """(key, kết quả) của các job xong trước deadline; job chưa xong thì huỷ / bỏ"""
+        done = []
+        for key, future in futures:
+            try:
+                done.append((key, future.result(timeout=max(0.0, deadline - time.perf_counter()))))
+            except FutureTimeoutError:
+                # Job đang chạy thì chạy nốt (kết quả bỏ); chưa chạy thì huỷ luôn
+                future.cancel()
+                with self._stats_lock:
+                    self.slow_timeouts += 1
+            except Exception as e:
+                print(f"[Enhanced] Slow fallback error: {e}")
+        return done
+
+    def _prepare_variant(self, img, method):
+        """Chạy trên worker pool: CHỈ preprocessing (không gọi model) → (ảnh, thời gian)"""
+        t0 = time.perf_counter()
+        variant = self.preprocess_image(img, method)
+        return variant, time.perf_counter() - t0
+
+    def _easyocr_fallback(self, img, deadline):
+        """Chạy trên worker pool: EasyOCR trên vài bản preprocess, dừng khi hết budget"""
+        print("[Enhanced] Fast-ALPR không đọc được, thử EasyOCR...")
+        for method in ['default', 'clahe', 'sharpen', 'combined']:
+            if time.perf_counter() >= deadline:
+                break
+            processed_img = self.preprocess_image(img, method)
+            # Reader EasyOCR dùng chung giữa các worker → 1 thread gọi tại 1 thời điểm
+            with self._easyocr_lock:
+                easyocr_results = self.detect_with_easyocr(processed_img)
+            if easyocr_results:
+                return easyocr_results
+        return []
+
+    def get_stats(self):
+        """
+        Thống kê cascade theo phương pháp + số fallback chậm đã chạy / bỏ (hết slot) /
+        quá deadline / không chạy vì budget còn lại không đủ cho phương pháp chậm nào
+        """
+        with self._stats_lock:
+            return {
+                'methods': self.cascade.get_stats(),
+                'slow_submitted': self.slow_submitted,
+                'slow_skipped': self.slow_skipped,
+                'slow_timeouts': self.slow_timeouts,
+                'slow_over_budget': self.slow_over_budget,
+                'alpr_ms': round(self._alpr_seconds * 1000, 1),
+            }
+
+    def _ensemble(self, all_results):
+        """Chọn kết quả tốt nhất trong các kết quả của 1 ảnh"""
         if all_results:
             # Nhóm theo biển số đã normalize
-            # Import normalize và validate functions
-            import re
             def normalize_plate(plate):
                 """Normalize biển số: loại bỏ ký tự đặc biệt, khoảng trắng, chuyển thành chữ hoa"""
                 if not plate:
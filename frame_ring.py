@@ -0,0 +1,167 @@
+# frame_ring.py
+"""
+Frame Ring - Buffer vòng DUY NHẤT cho frame gốc
+================================================
+
+Thay cho kiểu cũ: mỗi track có 1 deque(maxlen=150) và video reader copy
+frame vào TẤT CẢ deque của active tracks (chi phí = số track × số frame).
+
+NGUYÊN TẮC:
+✅ Mỗi frame chỉ lưu 1 lần trong ring (dung lượng cố định)
+✅ Mỗi slot có seq tăng dần (monotonic), không bao giờ reset khi ring quay vòng
+✅ Mỗi track chỉ giữ [first_seq, last_seq] trỏ vào ring
+✅ Lấy pre-roll frames cho vi phạm bằng range lookup
+"""
+import threading
+
+
+class FrameRing:
+    """
+    Ring buffer dung lượng cố định, đánh số frame bằng seq tăng dần.
+
+    Track range: track_id -> [first_seq, last_seq, seen_seq]
+    - last_seq = None nghĩa là track còn active, range kéo dài đến frame mới nhất
+    - seen_seq = frame cuối track được detect (close_track chốt last_seq tại đây)
+    - Frame đã bị ring ghi đè sẽ tự động bị bỏ qua khi lookup
+    """
+
+    def __init__(self, capacity=150):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be > 0, got {capacity}")
+
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._slot_seqs = [-1] * capacity
+        self._next_seq = 0
+        self._count = 0  # Số slot đang có frame (clear() → 0)
+        self._lock = threading.Lock()
+        self.track_ranges = {}  # track_id -> [first_seq, last_seq, seen_seq]
+
+    # ------------------------------------------------------------------
+    # FRAMES
+    # ------------------------------------------------------------------
+    def append(self, frame_data):
+        """
+        Thêm frame vào ring (ghi đè slot cũ nhất khi đầy)
+
+        Args:
+            frame_data: Dict frame ({'frame', 'frame_id', 'timestamp', ...})
+
+        Returns:
+            seq của frame vừa thêm
+        """
+        with self._lock:
+            seq = self._next_seq
+            idx = seq % self.capacity
+            frame_data['seq'] = seq
+            self._slots[idx] = frame_data
+            self._slot_seqs[idx] = seq
+            self._next_seq = seq + 1
+            self._count = min(self._count + 1, self.capacity)
+            return seq
+
+    @property
+    def head_seq(self):
+        """seq của frame mới nhất (-1 nếu ring rỗng)"""
+        return self._next_seq - 1
+
+    @property
+    def oldest_seq(self):
+        """seq của frame cũ nhất còn trong ring"""
+        return max(0, self._next_seq - self.capacity)
+
+    def get(self, seq):
+        """Lấy frame theo seq, None nếu đã bị ghi đè hoặc chưa có"""
+        with self._lock:
+            idx = seq % self.capacity
+            if seq < 0 or self._slot_seqs[idx] != seq:
+                return None
+            return self._slots[idx]
+
+    def get_range(self, first_seq, last_seq):
+        """
+        Lấy các frame trong [first_seq, last_seq] (theo thứ tự), chỉ những
+        frame còn trong ring.
+        """
+        with self._lock:
+            first_seq = max(first_seq, self._next_seq - self.capacity, 0)
+            last_seq = min(last_seq, self._next_seq - 1)
+            frames = []
+            for seq in range(first_seq, last_seq + 1):
+                idx = seq % self.capacity
+                if self._slot_seqs[idx] == seq:
+                    frames.append(self._slots[idx])
+            return frames
+
+    def latest(self):
+        """Frame mới nhất, None nếu ring rỗng"""
+        return self.get(self.head_seq)
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        """Xóa toàn bộ frame và track ranges (seq vẫn tiếp tục tăng)"""
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._slot_seqs = [-1] * self.capacity
+            self._count = 0
+            self.track_ranges.clear()
+
+    # ------------------------------------------------------------------
+    # TRACK RANGES
+    # ------------------------------------------------------------------
+    def open_track(self, track_id, seq=None):
+        """
+        Đánh dấu track đang active (gọi mỗi frame track được detect): range bắt
+        đầu từ frame track xuất hiện và kéo dài theo ring cho đến khi close_track()
+
+        Args:
+            seq: seq của frame track được detect (None = frame mới nhất). Detection
+                chạy sau video reader nên ring head thường đã đi trước frame đó
+        """
+        with self._lock:
+            seen_seq = max(0, self._next_seq - 1 if seq is None else seq)
+            track_range = self.track_ranges.get(track_id)
+            if track_range is None:
+                self.track_ranges[track_id] = [seen_seq, None, seen_seq]
+                return
+            track_range[2] = max(track_range[2], seen_seq)
+            if track_range[1] is not None:
+                # Track xuất hiện lại - mở lại range
+                track_range[1] = None
+
+    def close_track(self, track_id):
+        """
+        Chốt last_seq = frame cuối track được detect (track không còn active)
+
+        KHÔNG dùng ring head: video reader chạy trước detection nên head chứa
+        các frame sau khi track đã mất
+        """
+        with self._lock:
+            track_range = self.track_ranges.get(track_id)
+            if track_range is not None and track_range[1] is None:
+                track_range[1] = track_range[2]
+
+    def remove_track(self, track_id):
+        """Xóa range của track"""
+        with self._lock:
+            self.track_ranges.pop(track_id, None)
+
+    def track_range(self, track_id):
+        """(first_seq, last_seq) đã resolve, None nếu track không có range"""
+        with self._lock:
+            track_range = self.track_ranges.get(track_id)
+            if track_range is None:
+                return None
+            first_seq, last_seq, _ = track_range
+            if last_seq is None:
+                last_seq = self._next_seq - 1
+            return first_seq, last_seq
+
+    def track_frames(self, track_id):
+        """Tất cả frame (còn trong ring) thuộc range của track"""
+        resolved = self.track_range(track_id)
+        if resolved is None:
+            return []
+        return self.get_range(*resolved)
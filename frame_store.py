@@ -0,0 +1,130 @@
+# frame_store.py
+"""
+Frame Store - Truyền frame qua pipeline bằng HANDLE thay vì copy ndarray
+=========================================================================
+
+Trước đây 1 vi phạm copy frame full-resolution rất nhiều lần
+(original_frame.copy(), copy từng frame vào violation_frame_buffer,
+vehicle_region.copy(), best_frame.copy() ...) và ndarray đi qua
+alpr_realtime_queue → best_frame_queue → violation_queue.
+
+NGUYÊN TẮC:
+✅ Frame được đăng ký 1 lần, nhận về FrameHandle (frame_id + read-only view)
+✅ Các stage chỉ truyền handle - KHÔNG copy
+✅ Frame tự giải phóng khi handle cuối cùng bị drop (refcount)
+✅ Stage nào cần vẽ/sửa frame thì tự copy (frame gốc là read-only)
+"""
+import threading
+import weakref
+
+
+class _FrameEntry:
+    """Giữ ndarray thật - chỉ sống khi còn FrameHandle trỏ tới"""
+
+    __slots__ = ('frame', '__weakref__')
+
+    def __init__(self, frame):
+        self.frame = frame
+
+
+class FrameHandle:
+    """
+    Handle nhẹ, bất biến cho 1 frame trong FrameStore.
+
+    Attributes:
+        frame_id: ID duy nhất của frame trong store
+        frame: Read-only view của frame (numpy.ndarray)
+    """
+
+    __slots__ = ('frame_id', '_entry')
+
+    def __init__(self, frame_id, entry):
+        object.__setattr__(self, 'frame_id', frame_id)
+        object.__setattr__(self, '_entry', entry)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrameHandle is immutable")
+
+    @property
+    def frame(self):
+        return self._entry.frame
+
+    @property
+    def shape(self):
+        return self._entry.frame.shape
+
+    def crop(self, x1, y1, x2, y2):
+        """Read-only view vùng [y1:y2, x1:x2] - KHÔNG copy"""
+        return self._entry.frame[y1:y2, x1:x2]
+
+    def __repr__(self):
+        return f"FrameHandle(frame_id={self.frame_id}, shape={self.shape})"
+
+
+class FrameStore:
+    """
+    Store cấp phát FrameHandle cho frame gốc.
+
+    Store chỉ giữ weakref tới frame: khi handle cuối cùng bị drop,
+    CPython refcount giải phóng ndarray ngay lập tức.
+    """
+
+    def __init__(self):
+        self._entries = weakref.WeakValueDictionary()  # frame_id -> _FrameEntry
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._live_bytes = 0
+        self.frames_put = 0
+        self.frames_released = 0
+
+    def put(self, frame):
+        """
+        Đăng ký frame vào store (KHÔNG copy) và trả về handle.
+
+        Store giữ 1 view read-only của frame để không stage nào vô tình sửa
+        frame dùng chung. Chỉ khoá view của store - mảng của caller (decoder)
+        vẫn giữ nguyên flags.
+        """
+        frame = frame.view()
+        frame.flags.writeable = False
+        entry = _FrameEntry(frame)
+        nbytes = frame.nbytes
+
+        with self._lock:
+            frame_id = self._next_id
+            self._next_id += 1
+            self._entries[frame_id] = entry
+            self._live_bytes += nbytes
+            self.frames_put += 1
+
+        weakref.finalize(entry, self._on_release, nbytes)
+        return FrameHandle(frame_id, entry)
+
+    def get(self, frame_id):
+        """Lấy lại handle theo frame_id, None nếu frame đã được giải phóng"""
+        entry = self._entries.get(frame_id)
+        if entry is None:
+            return None
+        return FrameHandle(frame_id, entry)
+
+    def _on_release(self, nbytes):
+        with self._lock:
+            self._live_bytes -= nbytes
+            self.frames_released += 1
+
+    def get_stats(self):
+        """Thống kê bộ nhớ frame đang sống"""
+        with self._lock:
+            return {
+                'live_frames': len(self._entries),
+                'live_mb': self._live_bytes / 1024 ** 2,
+                'frames_put': self.frames_put,
+                'frames_released': self.frames_released,
+            }
+
+
+def as_array(frame):
+    """Trả về ndarray từ FrameHandle hoặc ndarray (tương thích ngược)"""
+    if isinstance(frame, FrameHandle):
+        return frame.frame
+    return frame
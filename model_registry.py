@@ -0,0 +1,137 @@
+# model_registry.py
+"""
+Model Registry - Mỗi model chỉ load 1 lần cho cả process
+=========================================================
+
+CombinedDetector tự tạo PlateDetector(), init_detector tạo EnhancedPlateDetector
+(lại tạo 1 PlateDetector) và có thể fallback tạo thêm 1 cái nữa → yolo-v9 plate
+detector + CCT OCR bị load 2-3 lần, cộng EasyOCR.
+
+NGUYÊN TẮC:
+✅ Key = (tên model, device, options) → trả về instance dùng chung
+✅ Load dưới lock theo key → 2 thread cùng xin 1 model chỉ load 1 lần
+✅ Ghi lại thời gian load + RSS (và bộ nhớ CUDA nếu có) tăng thêm của từng model
+✅ Load lỗi KHÔNG được cache → lần sau thử lại (caller tự fallback như cũ)
+"""
+import os
+import threading
+import time
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def current_rss():
+    """RSS hiện tại của process (bytes), None nếu không đo được"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def current_cuda_memory():
+    """Bộ nhớ CUDA đang cấp phát bởi PyTorch (bytes), None nếu không có CUDA"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return torch.cuda.memory_allocated()
+    except Exception:
+        pass
+    return None
+
+
+def _delta(before, after):
+    if before is None or after is None:
+        return None
+    return max(0, after - before)
+
+
+class ModelRegistry:
+    """
+    Cache instance model theo (name, device, options)
+    """
+
+    def __init__(self):
+        self._models = {}  # key -> instance
+        self._stats = {}   # key -> {'name', 'device', 'load_time', 'rss_bytes', 'cuda_bytes', 'hits'}
+        self._locks = {}   # key -> Lock (load song song các model khác nhau)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name, device=None, **options):
+        return (name, device, tuple(sorted(options.items())))
+
+    def get(self, name, factory, device=None, **options):
+        """
+        Instance dùng chung của model, load bằng factory() nếu chưa có
+
+        Args:
+            name: Tên model (file weights / tên model của thư viện)
+            factory: Hàm không tham số tạo model
+            device: Device của model (một phần của key)
+            **options: Options khác ảnh hưởng tới model (một phần của key, phải hashable)
+        """
+        key = self.make_key(name, device, **options)
+        with self._lock:
+            if key in self._models:
+                self._stats[key]['hits'] += 1
+                return self._models[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._models:
+                    self._stats[key]['hits'] += 1
+                    return self._models[key]
+
+            rss_before, cuda_before = current_rss(), current_cuda_memory()
+            start = time.perf_counter()
+            model = factory()
+            load_time = time.perf_counter() - start
+            stats = {
+                'name': name,
+                'device': device,
+                'load_time': load_time,
+                'rss_bytes': _delta(rss_before, current_rss()),
+                'cuda_bytes': _delta(cuda_before, current_cuda_memory()),
+                'hits': 0,
+            }
+
+            with self._lock:
+                self._models[key] = model
+                self._stats[key] = stats
+
+        rss_mb = f"{stats['rss_bytes'] / 1024 ** 2:.0f} MB" if stats['rss_bytes'] is not None else 'n/a'
+        print(f"[MODEL REGISTRY] ✅ Loaded {name} ({device or 'auto'}) in {load_time:.2f}s, RSS +{rss_mb}")
+        return model
+
+    def release(self, name, device=None, **options):
+        """Bỏ model khỏi registry (instance được giải phóng khi không còn ai giữ)"""
+        key = self.make_key(name, device, **options)
+        with self._lock:
+            self._models.pop(key, None)
+            self._stats.pop(key, None)
+
+    def get_stats(self):
+        """List thống kê từng model: thời gian load, RSS / CUDA tăng thêm, số lần dùng lại"""
+        with self._lock:
+            return [dict(stats) for stats in self._stats.values()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._models)
+
+
+# Registry mặc định cho cả process
+registry = ModelRegistry()
+
+
+def get_model(name, factory, device=None, **options):
+    """Shortcut: registry.get(...)"""
+    return registry.get(name, factory, device=device, **options)
@@ -0,0 +1,109 @@
+# motion_gate.py
+"""
+Motion Gate - Bỏ qua detection khi khung hình đứng yên
+=======================================================
+
+Camera giao thông ban đêm phần lớn thời gian nhìn đường trống, nhưng
+video reader vẫn đẩy mọi frame (theo detection_frequency) vào YOLO.
+
+NGUYÊN TẮC:
+✅ Frame differencing trên ảnh xám thu nhỏ (rẻ hơn YOLO hàng trăm lần)
+✅ So với frame cuối cùng ĐÃ gửi detection → chuyển động chậm vẫn tích luỹ
+✅ Bắt buộc detection mỗi K frame để track cũ không bị mất
+✅ Đếm số frame bị bỏ qua / có chuyển động / bị ép detection
+"""
+import threading
+
+import cv2
+
+
+class MotionGate:
+    """
+    Quyết định frame nào cần chạy detection.
+
+    Attributes:
+        width: Chiều rộng ảnh thu nhỏ để so sánh
+        pixel_threshold: Chênh lệch mức xám tối thiểu để coi 1 pixel là thay đổi
+        min_motion_ratio: Tỉ lệ pixel thay đổi tối thiểu để coi frame có chuyển động
+        force_every: Bắt buộc detection nếu đã bỏ qua liên tiếp K frame (0 = không ép)
+    """
+
+    def __init__(self, width=160, pixel_threshold=25, min_motion_ratio=0.002, force_every=10):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_motion_ratio = min_motion_ratio
+        self.force_every = force_every
+
+        self._reference = None  # Ảnh xám thu nhỏ của frame cuối cùng được detect
+        self._since_detection = 0
+        self._lock = threading.Lock()
+
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.frames_motion = 0
+        self.frames_forced = 0
+
+    def _prepare(self, frame):
+        """Ảnh xám thu nhỏ + blur nhẹ để giảm nhiễu sensor"""
+        h, w = frame.shape[:2]
+        if w > self.width:
+            height = max(1, int(h * self.width / w))
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(frame, (5, 5), 0)
+
+    def motion_ratio(self, small):
+        """Tỉ lệ pixel thay đổi so với reference (1.0 nếu chưa có reference)"""
+        if self._reference is None or self._reference.shape != small.shape:
+            return 1.0
+        diff = cv2.absdiff(small, self._reference)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed / diff.size
+
+    def should_detect(self, frame):
+        """
+        Args:
+            frame: Frame BGR (hoặc grayscale)
+
+        Returns:
+            True nếu frame cần chạy detection
+        """
+        small = self._prepare(frame)
+
+        with self._lock:
+            self.frames_checked += 1
+
+            if self.motion_ratio(small) >= self.min_motion_ratio:
+                self.frames_motion += 1
+            elif self.force_every and self._since_detection + 1 >= self.force_every:
+                self.frames_forced += 1
+            else:
+                self._since_detection += 1
+                self.frames_skipped += 1
+                return False
+
+            self._reference = small
+            self._since_detection = 0
+            return True
+
+    def reset(self):
+        """Xoá reference + thống kê (khi đổi video/camera) - frame kế tiếp luôn được detect"""
+        with self._lock:
+            self._reference = None
+            self._since_detection = 0
+            self.frames_checked = 0
+            self.frames_skipped = 0
+            self.frames_motion = 0
+            self.frames_forced = 0
+
+    def get_stats(self):
+        """Thống kê số frame bỏ qua / có chuyển động / bị ép detection"""
+        with self._lock:
+            return {
+                'frames_checked': self.frames_checked,
+                'frames_skipped': self.frames_skipped,
+                'frames_motion': self.frames_motion,
+                'frames_forced': self.frames_forced,
+                'skip_ratio': self.frames_skipped / self.frames_checked if self.frames_checked else 0.0,
+            }
@@ -4,8 +4,9 @@ OC-SORT: Observation-Centric SORT
 Better than ByteTrack for smooth tracking with better occlusion handling
 """
 import numpy as np
-from filterpy.kalman import KalmanFilter
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 class TrackState:
     New = 0
@@ -13,36 +14,119 @@ class TrackState:
     Lost = 2
     Removed = 3
 
-class OCTrack:
-    """Track with Kalman Filter and velocity smoothing"""
+
+def tlbr_to_xyah(tlbr):
+    """(N, 4) [x1, y1, x2, y2] -> (N, 4) [x, y, a, h]"""
+    tlbr = np.asarray(tlbr, dtype=np.float64).reshape(-1, 4)
+    w = tlbr[:, 2] - tlbr[:, 0]
+    h = tlbr[:, 3] - tlbr[:, 1]
+    x = tlbr[:, 0] + w / 2
+    y = tlbr[:, 1] + h / 2
+    a = w / (h + 1e-6)
+    return np.stack([x, y, a, h], axis=1)
+
+
+def xyah_to_tlbr(xyah):
+    """(N, 4) [x, y, a, h] -> (N, 4) [x1, y1, x2, y2] (w, h >= 1)"""
+    x, y, a, h = xyah[:, 0], xyah[:, 1], xyah[:, 2], xyah[:, 3]
+    # Đảm bảo w và h hợp lệ
+    w = np.maximum(1, a * h)
+    h = np.maximum(1, h)
+    return np.stack([x - w / 2, y - h / 2, x + w / 2, y + h / 2], axis=1).astype(np.float32)
+
+
+def iou_batch(bboxes1, bboxes2):
+    """Compute IoU between two sets of bboxes -> (len(bboxes1), len(bboxes2))"""
+    bboxes2 = np.expand_dims(bboxes2, 0)
+    bboxes1 = np.expand_dims(bboxes1, 1)
     
-    def __init__(self, tlbr, score, cls, track_id, frame_id):
-        self.tlbr = tlbr.astype(np.float32)
-        self.score = score
-        self.cls = cls
-        self.track_id = track_id
-        self.frame_id = frame_id
-        self.state = TrackState.New
-        self.is_activated = False
-        self.tracklet_len = 0
-        self.time_since_update = 0
-        
-        # Kalman Filter - 7D state: [x, y, a, h, vx, vy, va]
-        # x, y: center, a: aspect ratio, h: height
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        
-        # Convert tlbr to [x, y, a, h]
-        x1, y1, x2, y2 = tlbr
-        w = x2 - x1
-        h = y2 - y1
-        x = x1 + w / 2
-        y = y1 + h / 2
-        a = w / (h + 1e-6)
-        
-        self.kf.x[:4] = np.array([[x], [y], [a], [h]])
-        
+    xx1 = np.maximum(bboxes1[..., 0], bboxes2[..., 0])
+    yy1 = np.maximum(bboxes1[..., 1], bboxes2[..., 1])
+    xx2 = np.minimum(bboxes1[..., 2], bboxes2[..., 2])
+    yy2 = np.minimum(bboxes1[..., 3], bboxes2[..., 3])
+    
+    w = np.maximum(0., xx2 - xx1)
+    h = np.maximum(0., yy2 - yy1)
+    
+    wh = w * h
+    o = wh / ((bboxes1[..., 2] - bboxes1[..., 0]) * (bboxes1[..., 3] - bboxes1[..., 1]) +
+              (bboxes2[..., 2] - bboxes2[..., 0]) * (bboxes2[..., 3] - bboxes2[..., 1]) - wh)
+    
+    return o
+
+
+def iou_pairs(bboxes1, bboxes2):
+    """IoU từng cặp tương ứng: bboxes1[k] với bboxes2[k] -> (K,)"""
+    xx1 = np.maximum(bboxes1[:, 0], bboxes2[:, 0])
+    yy1 = np.maximum(bboxes1[:, 1], bboxes2[:, 1])
+    xx2 = np.minimum(bboxes1[:, 2], bboxes2[:, 2])
+    yy2 = np.minimum(bboxes1[:, 3], bboxes2[:, 3])
+    
+    wh = np.maximum(0., xx2 - xx1) * np.maximum(0., yy2 - yy1)
+    union = ((bboxes1[:, 2] - bboxes1[:, 0]) * (bboxes1[:, 3] - bboxes1[:, 1]) +
+             (bboxes2[:, 2] - bboxes2[:, 0]) * (bboxes2[:, 3] - bboxes2[:, 1]) - wh)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        o = wh / union
+    return np.nan_to_num(o, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def overlap_pairs(bboxes1, bboxes2):
+    """
+    Tìm các cặp (i, j) mà bboxes1[i] và bboxes2[j] giao nhau
+    bằng sorted-interval index theo x1 - KHÔNG tính full N×M
+
+    Với mỗi bbox i, chỉ xét cửa sổ bboxes2 có
+    x1 trong (x1_i - max_w, x2_i), sau đó lọc theo x2 và trục y.
+
+    Returns:
+        (idx1, idx2) int arrays
+    """
+    if len(bboxes1) == 0 or len(bboxes2) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    order = np.argsort(bboxes2[:, 0], kind='stable')
+    sorted_x1 = bboxes2[order, 0]
+    max_w = np.max(bboxes2[:, 2] - bboxes2[:, 0])
+
+    starts = np.searchsorted(sorted_x1, bboxes1[:, 0] - max_w, side='right')
+    ends = np.searchsorted(sorted_x1, bboxes1[:, 2], side='left')
+    counts = np.maximum(ends - starts, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Flatten các cửa sổ [start, end) thành danh sách cặp
+    idx1 = np.repeat(np.arange(len(bboxes1)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    idx2 = order[np.repeat(starts, counts) + offsets]
+
+    b1 = bboxes1[idx1]
+    b2 = bboxes2[idx2]
+    overlap = ((b2[:, 2] > b1[:, 0]) & (b2[:, 0] < b1[:, 2]) &
+               (b2[:, 3] > b1[:, 1]) & (b2[:, 1] < b1[:, 3]))
+    return idx1[overlap], idx2[overlap]
+
+
+class BatchKalmanFilter:
+    """
+    Kalman Filter dạng struct-of-arrays cho TẤT CẢ track
+
+    - State x (N, 7) và covariance P (N, 7, 7) xếp chồng trong NumPy arrays
+    - predict(): 1 phép matmul batch cho mọi track
+    - update(): 1 lần gọi batch cho tập track được match
+    - Mỗi track giữ 1 slot, slot được tái sử dụng khi track bị xóa
+
+    State 7D: [x, y, a, h, vx, vy, va] - x, y: center, a: aspect ratio, h: height
+    Công thức giống hệt filterpy.KalmanFilter (update dạng Joseph).
+    """
+
+    dim_x = 7
+    dim_z = 4
+
+    def __init__(self, capacity=64):
         # State transition matrix
-        self.kf.F = np.array([
+        self.F = np.array([
             [1, 0, 0, 0, 1, 0, 0],  # x = x + vx
             [0, 1, 0, 0, 0, 1, 0],  # y = y + vy
             [0, 0, 1, 0, 0, 0, 1],  # a = a + va
@@ -50,72 +134,143 @@ class OCTrack:
             [0, 0, 0, 0, 1, 0, 0],  # vx = vx
             [0, 0, 0, 0, 0, 1, 0],  # vy = vy
             [0, 0, 0, 0, 0, 0, 1],  # va = va
-        ])
-        
+        ], dtype=np.float64)
+
         # Measurement matrix [x, y, a, h]
-        self.kf.H = np.array([
-            [1, 0, 0, 0, 0, 0, 0],
-            [0, 1, 0, 0, 0, 0, 0],
-            [0, 0, 1, 0, 0, 0, 0],
-            [0, 0, 0, 1, 0, 0, 0],
-        ])
-        
+        self.H = np.eye(self.dim_z, self.dim_x)
+
         # Measurement noise - cân bằng để tracking mượt
-        self.kf.R[0:2, 0:2] *= 0.8  # Position
-        self.kf.R[2:, 2:] *= 10.0  # Aspect ratio and height
-        
+        # Position: 0.8, Aspect ratio and height: 10.0
+        self.R = np.diag([0.8, 0.8, 10.0, 10.0])
+
         # Process noise - cân bằng
-        self.kf.Q[-1, -1] *= 0.01  # va
-        self.kf.Q[4:6, 4:6] *= 0.01  # vx, vy
-        self.kf.Q[0:4, 0:4] *= 0.15  # Position
-        
+        # Position: 0.15, vx, vy, va: 0.01
+        self.Q = np.diag([0.15, 0.15, 0.15, 0.15, 0.01, 0.01, 0.01])
+
         # Initial covariance
-        self.kf.P[4:, 4:] *= 1000.0  # High uncertainty for velocities
-        self.kf.P[0:4, 0:4] *= 8.0  # Position covariance
+        # Position covariance: 8.0, high uncertainty for velocities: 1000.0
+        self.P0 = np.diag([8.0, 8.0, 8.0, 8.0, 1000.0, 1000.0, 1000.0])
+
+        self.capacity = 0
+        self.x = np.zeros((0, self.dim_x))
+        self.P = np.zeros((0, self.dim_x, self.dim_x))
+        self.time_since_update = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self._free = []
+        self._grow(capacity)
+
+    def _grow(self, new_capacity):
+        """Tăng dung lượng (x2) khi hết slot"""
+        extra = new_capacity - self.capacity
+        self.x = np.concatenate([self.x, np.zeros((extra, self.dim_x))])
+        self.P = np.concatenate([self.P, np.zeros((extra, self.dim_x, self.dim_x))])
+        self.time_since_update = np.concatenate([self.time_since_update, np.zeros(extra, dtype=np.int64)])
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self._free.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def allocate(self, tlbr):
+        """Cấp slot mới, khởi tạo state từ bbox tlbr. Returns: slot index"""
+        if not self._free:
+            self._grow(max(1, self.capacity * 2))
+        slot = self._free.pop()
+        self.x[slot] = 0.0
+        self.x[slot, :4] = tlbr_to_xyah(tlbr)[0]
+        self.P[slot] = self.P0
+        self.time_since_update[slot] = 0
+        self.active[slot] = True
+        return slot
+
+    def release(self, slot):
+        """Trả slot về free list"""
+        if self.active[slot]:
+            self.active[slot] = False
+            self._free.append(slot)
+
+    def predict(self, slots):
+        """
+        Predict cho nhiều slot cùng lúc
+
+        Returns:
+            (N, 4) predicted tlbr
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == 0:
+            return np.zeros((0, 4), dtype=np.float32)
+
+        self.x[slots] = self.x[slots] @ self.F.T
+        self.P[slots] = self.F @ self.P[slots] @ self.F.T + self.Q
+        self.time_since_update[slots] += 1
+        return xyah_to_tlbr(self.x[slots, :4])
+
+    def update(self, slots, tlbrs):
+        """
+        Update nhiều slot với measurement tương ứng (1 lần gọi batch)
+
+        Args:
+            slots: (M,) slot index
+            tlbrs: (M, 4) detection [x1, y1, x2, y2]
+        """
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == 0:
+            return
+
+        z = tlbr_to_xyah(tlbrs)
+        x = self.x[slots]
+        P = self.P[slots]
+        H, R = self.H, self.R
+
+        y = z - x @ H.T                                  # (M, 4)
+        PHT = P @ H.T                                    # (M, 7, 4)
+        S = H @ PHT + R                                  # (M, 4, 4)
+        K = PHT @ np.linalg.inv(S)                       # (M, 7, 4)
+        self.x[slots] = x + np.einsum('mij,mj->mi', K, y)
+
+        I_KH = np.eye(self.dim_x) - K @ H                # (M, 7, 7)
+        self.P[slots] = I_KH @ P @ np.swapaxes(I_KH, 1, 2) + K @ R @ np.swapaxes(K, 1, 2)
+        self.time_since_update[slots] = 0
+
+    def get_tlbr(self, slots):
+        """(N, 4) tlbr từ state hiện tại"""
+        slots = np.asarray(slots, dtype=np.int64)
+        return xyah_to_tlbr(self.x[slots, :4])
+
+
+class OCTrack:
+    """Track with Kalman Filter and velocity smoothing (state nằm trong BatchKalmanFilter)"""
     
-    def predict(self):
-        """Predict next state - Cải thiện để tracking mượt hơn"""
-        self.kf.predict()
-        self.time_since_update += 1
-        
-        # Convert back to tlbr
-        x, y, a, h = self.kf.x[:4].flatten()
-        w = a * h
-        # Đảm bảo w và h hợp lệ
-        w = max(1, w)
-        h = max(1, h)
-        x1 = x - w / 2
-        y1 = y - h / 2
-        x2 = x + w / 2
-        y2 = y + h / 2
+    def __init__(self, tlbr, score, cls, track_id, frame_id, kf=None):
+        self.score = score
+        self.cls = cls
+        self.track_id = track_id
+        self.frame_id = frame_id
+        self.state = TrackState.New
+        self.is_activated = False
+        self.tracklet_len = 0
+        self.det_idx = -1  # Index của detection khớp ở frame gần nhất
         
-        return np.array([x1, y1, x2, y2], dtype=np.float32)
+        # Kalman Filter - slot trong engine dùng chung (tạo engine riêng nếu dùng độc lập)
+        self.kf = kf if kf is not None else BatchKalmanFilter(capacity=1)
+        self.slot = self.kf.allocate(tlbr)
+
+    @property
+    def tlbr(self):
+        """Bbox hiện tại từ Kalman state"""
+        return self.kf.get_tlbr([self.slot])[0]
+
+    @property
+    def time_since_update(self):
+        return int(self.kf.time_since_update[self.slot])
+    
+    def predict(self):
+        """Predict next state (1 track) - OCSort.update dùng predict batch"""
+        return self.kf.predict([self.slot])[0]
     
     def update(self, tlbr, score):
-        """Update with new detection - Cải thiện để tracking mượt hơn"""
-        # Convert tlbr to [x, y, a, h]
-        x1, y1, x2, y2 = tlbr
-        w = x2 - x1
-        h = y2 - y1
-        x = x1 + w / 2
-        y = y1 + h / 2
-        a = w / (h + 1e-6)
-        
-        measurement = np.array([[x], [y], [a], [h]])
-        self.kf.update(measurement)
-        
-        # Update attributes
+        """Update with new detection (1 track) - OCSort.update dùng update batch"""
+        self.kf.update([self.slot], np.asarray(tlbr).reshape(1, 4))
         self.score = score
-        self.time_since_update = 0
         self.tracklet_len += 1
-        
-        # Get updated tlbr - dùng Kalman prediction để mượt hơn
-        x, y, a, h = self.kf.x[:4].flatten()
-        w = a * h
-        # Đảm bảo w và h hợp lệ
-        w = max(1, w)
-        h = max(1, h)
-        self.tlbr = np.array([x - w/2, y - h/2, x + w/2, y + h/2], dtype=np.float32)
 
 class OCSort:
     """OC-SORT tracker - Better than ByteTrack"""
@@ -130,6 +285,8 @@ class OCSort:
         self.frame_count = 0
         self.track_id_count = 0
         self.tracks = []
+        # Kalman state của TẤT CẢ track - predict/update chạy batch
+        self.kf = BatchKalmanFilter(capacity=64)
     
     def update(self, detections, frame=None):
         """
@@ -141,35 +298,42 @@ class OCSort:
         """
         self.frame_count += 1
         
-        # Get predicted locations from existing tracks
-        trks = np.zeros((len(self.tracks), 5))
-        to_del = []
-        for t, track in enumerate(self.tracks):
-            pos = track.predict()
-            trks[t] = np.append(pos, track.score)
-            if np.any(np.isnan(pos)):
-                to_del.append(t)
+        # Get predicted locations from existing tracks - 1 lần predict batch cho mọi track
+        slots = np.array([track.slot for track in self.tracks], dtype=np.int64)
+        pred = self.kf.predict(slots)
+        scores = np.array([track.score for track in self.tracks], dtype=np.float64)
+        trks = np.concatenate([pred, scores.reshape(-1, 1)], axis=1)
         
         # Remove invalid tracks
-        for t in reversed(to_del):
-            self.tracks.pop(t)
-        
-        # Filter detections by confidence
-        dets = detections[detections[:, 4] >= self.det_thresh]
+        invalid = np.any(np.isnan(pred), axis=1)
+        if invalid.any():
+            for t in np.flatnonzero(invalid):
+                self.kf.release(self.tracks[t].slot)
+            self.tracks = [track for track, bad in zip(self.tracks, invalid) if not bad]
+            slots = slots[~invalid]
+            trks = trks[~invalid]
+        
+        # Filter detections by confidence (giữ index gốc để map track → detection)
+        keep_idx = np.where(detections[:, 4] >= self.det_thresh)[0]
+        dets = detections[keep_idx]
         
         # Association using Hungarian algorithm
         matched, unmatched_dets, unmatched_trks = self.associate_detections_to_trackers(
             dets, trks, self.iou_threshold
         )
         
-        # Update matched tracks
-        for m in matched:
-            track_idx, det_idx = m
-            self.tracks[track_idx].update(dets[det_idx, :4], dets[det_idx, 4])
-            self.tracks[track_idx].cls = int(dets[det_idx, 5])
-            self.tracks[track_idx].frame_id = self.frame_count
-            self.tracks[track_idx].is_activated = True
-            self.tracks[track_idx].state = TrackState.Tracked
+        # Update matched tracks - 1 lần update batch cho tập được match
+        if len(matched) > 0:
+            self.kf.update(slots[matched[:, 0]], dets[matched[:, 1], :4])
+        for track_idx, det_idx in matched:
+            track = self.tracks[track_idx]
+            track.score = dets[det_idx, 4]
+            track.tracklet_len += 1
+            track.cls = int(dets[det_idx, 5])
+            track.frame_id = self.frame_count
+            track.det_idx = int(keep_idx[det_idx])
+            track.is_activated = True
+            track.state = TrackState.Tracked
         
         # Create new tracks for unmatched detections
         for i in unmatched_dets:
@@ -179,30 +343,43 @@ class OCSort:
                 dets[i, 4],
                 int(dets[i, 5]),
                 self.track_id_count,
-                self.frame_count
+                self.frame_count,
+                kf=self.kf
             )
+            track.det_idx = int(keep_idx[i])
             self.tracks.append(track)
         
-        # Remove dead tracks
-        i = len(self.tracks)
-        for track in reversed(self.tracks):
-            i -= 1
-            # Remove if lost for too long
-            if track.time_since_update > self.max_age:
-                self.tracks.pop(i)
+        # Remove dead tracks (lost for too long)
+        if self.tracks:
+            slots = np.array([track.slot for track in self.tracks], dtype=np.int64)
+            age = self.kf.time_since_update[slots]
+            dead = age > self.max_age
+            if dead.any():
+                for t in np.flatnonzero(dead):
+                    self.kf.release(self.tracks[t].slot)
+                self.tracks = [track for track, d in zip(self.tracks, dead) if not d]
+                age = age[~dead]
+        else:
+            age = np.zeros(0, dtype=np.int64)
         
         # Return active tracks (min_hits check)
-        ret = []
-        for track in self.tracks:
-            if track.tracklet_len >= self.min_hits or self.frame_count <= self.min_hits:
-                if track.time_since_update < 1:
-                    ret.append(track)
+        warmup = self.frame_count <= self.min_hits
+        ret = [
+            track for track, a in zip(self.tracks, age)
+            if a < 1 and (warmup or track.tracklet_len >= self.min_hits)
+        ]
         
         return ret
     
     def associate_detections_to_trackers(self, detections, trackers, iou_threshold=0.3):
         """
         Assigns detections to tracked object using Hungarian algorithm
+
+        Gating: chỉ tính IoU cho các cặp bbox CÓ THỂ giao nhau (sorted-interval
+        index), rồi giải Hungarian riêng cho từng connected component.
+        Cặp IoU = 0 không đóng góp gì vào tổng IoU nên kết quả tương đương
+        Hungarian trên full N×M matrix.
+
         Returns: matched, unmatched_detections, unmatched_trackers
         """
         if len(trackers) == 0:
@@ -211,56 +388,90 @@ class OCSort:
         if len(detections) == 0:
             return np.empty((0, 2), dtype=int), np.empty(0, dtype=int), np.arange(len(trackers))
         
-        # Compute IoU matrix
-        iou_matrix = self.iou_batch(detections[:, :4], trackers[:, :4])
-        
-        # Use Hungarian algorithm
-        if min(iou_matrix.shape) > 0:
-            # Convert to cost matrix (1 - IoU)
-            cost_matrix = 1 - iou_matrix
-            row_ind, col_ind = linear_sum_assignment(cost_matrix)
-            matched_indices = np.stack([row_ind, col_ind], axis=1)
+        n_dets = len(detections)
+        n_trks = len(trackers)
+        
+        # 1. Gating: cặp (det, trk) có bbox giao nhau + IoU của riêng các cặp đó
+        det_idx, trk_idx = overlap_pairs(detections[:, :4], trackers[:, :4])
+        ious = iou_pairs(detections[det_idx, :4], trackers[trk_idx, :4])
+        positive = ious > 0
+        det_idx, trk_idx, ious = det_idx[positive], trk_idx[positive], ious[positive]
+        
+        matched_det = []
+        matched_trk = []
+        
+        if len(ious) > 0:
+            # 2. Cặp cô lập (det và trk chỉ có đúng 1 cạnh) → match trực tiếp
+            det_degree = np.bincount(det_idx, minlength=n_dets)
+            trk_degree = np.bincount(trk_idx, minlength=n_trks)
+            isolated = (det_degree[det_idx] == 1) & (trk_degree[trk_idx] == 1)
+            matched_det.append(det_idx[isolated])
+            matched_trk.append(trk_idx[isolated])
+            
+            # 3. Các component còn lại: Hungarian trên ma trận con nhỏ
+            det_idx, trk_idx, ious = det_idx[~isolated], trk_idx[~isolated], ious[~isolated]
+            if len(ious) > 0:
+                graph = coo_matrix(
+                    (np.ones(len(ious)), (det_idx, n_dets + trk_idx)),
+                    shape=(n_dets + n_trks, n_dets + n_trks)
+                )
+                _, labels = connected_components(graph, directed=False)
+                
+                # Local index của từng det/trk trong component của nó (tính 1 lần,
+                # không np.unique trong vòng lặp)
+                det_order, det_start, det_local = self._component_layout(labels[:n_dets])
+                trk_order, trk_start, trk_local = self._component_layout(labels[n_dets:])
+                
+                edge_labels = labels[det_idx]
+                order = np.argsort(edge_labels, kind='stable')
+                bounds = np.flatnonzero(np.diff(edge_labels[order])) + 1
+                for edges in np.split(order, bounds):
+                    label = edge_labels[edges[0]]
+                    comp_dets = det_order[det_start[label]:det_start[label + 1]]
+                    comp_trks = trk_order[trk_start[label]:trk_start[label + 1]]
+                    # Convert to cost matrix (1 - IoU)
+                    cost_matrix = np.ones((len(comp_dets), len(comp_trks)))
+                    cost_matrix[det_local[det_idx[edges]], trk_local[trk_idx[edges]]] = 1 - ious[edges]
+                    row_ind, col_ind = linear_sum_assignment(cost_matrix)
+                    matched_det.append(comp_dets[row_ind])
+                    matched_trk.append(comp_trks[col_ind])
+        
+        if matched_det:
+            matched_det = np.concatenate(matched_det)
+            matched_trk = np.concatenate(matched_trk)
         else:
-            matched_indices = np.empty((0, 2), dtype=int)
+            matched_det = np.empty(0, dtype=int)
+            matched_trk = np.empty(0, dtype=int)
         
-        # Filter matches by IoU threshold - Đơn giản và hiệu quả
-        matches = []
-        for m in matched_indices:
-            if iou_matrix[m[0], m[1]] >= iou_threshold:
-                matches.append([m[1], m[0]])  # [track_idx, det_idx]
+        # Filter matches by IoU threshold
+        if len(matched_det) > 0:
+            keep = iou_pairs(detections[matched_det, :4], trackers[matched_trk, :4]) >= iou_threshold
+            matched_det, matched_trk = matched_det[keep], matched_trk[keep]
         
-        matches = np.array(matches) if len(matches) > 0 else np.empty((0, 2), dtype=int)
+        matches = np.stack([matched_trk, matched_det], axis=1).astype(int)  # [track_idx, det_idx]
         
-        # Get unmatched detections and trackers
-        unmatched_detections = []
-        for d in range(len(detections)):
-            if len(matches) == 0 or d not in matches[:, 1]:
-                unmatched_detections.append(d)
+        # Get unmatched detections and trackers (boolean masks)
+        det_unmatched = np.ones(n_dets, dtype=bool)
+        det_unmatched[matched_det] = False
+        trk_unmatched = np.ones(n_trks, dtype=bool)
+        trk_unmatched[matched_trk] = False
         
-        unmatched_trackers = []
-        for t in range(len(trackers)):
-            if len(matches) == 0 or t not in matches[:, 0]:
-                unmatched_trackers.append(t)
-        
-        return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+        return matches, np.flatnonzero(det_unmatched), np.flatnonzero(trk_unmatched)
     
     @staticmethod
-    def iou_batch(bboxes1, bboxes2):
-        """Compute IoU between two sets of bboxes"""
-        bboxes2 = np.expand_dims(bboxes2, 0)
-        bboxes1 = np.expand_dims(bboxes1, 1)
-        
-        xx1 = np.maximum(bboxes1[..., 0], bboxes2[..., 0])
-        yy1 = np.maximum(bboxes1[..., 1], bboxes2[..., 1])
-        xx2 = np.minimum(bboxes1[..., 2], bboxes2[..., 2])
-        yy2 = np.minimum(bboxes1[..., 3], bboxes2[..., 3])
-        
-        w = np.maximum(0., xx2 - xx1)
-        h = np.maximum(0., yy2 - yy1)
-        
-        wh = w * h
-        o = wh / ((bboxes1[..., 2] - bboxes1[..., 0]) * (bboxes1[..., 3] - bboxes1[..., 1]) +
-                  (bboxes2[..., 2] - bboxes2[..., 0]) * (bboxes2[..., 3] - bboxes2[..., 1]) - wh)
-        
-        return o
+    def _component_layout(node_labels):
+        """
+        Nhóm node theo component label
 
+        Returns:
+            order: node index sắp theo label
+            start: order[start[l]:start[l + 1]] là các node của component l
+            local: vị trí của node trong component của nó
+        """
+        order = np.argsort(node_labels, kind='stable')
+        start = np.searchsorted(node_labels[order], np.arange(node_labels.max() + 2))
+        local = np.empty(len(node_labels), dtype=np.int64)
+        local[order] = np.arange(len(node_labels)) - start[node_labels[order]]
+        return order, start, local
+    
+    iou_batch = staticmethod(iou_batch)
@@ -0,0 +1,263 @@
+# plate_cache.py
+"""
+Plate Cache - Kết quả biển số theo TRACK + lập lịch ALPR
+=========================================================
+
+Trước đây cùng 1 xe bị chạy ALPR ở nhiều nơi: CombinedDetector.detect (mọi xe,
+mọi frame), alpr_proactive_worker (toàn frame mỗi 3 frame), alpr_realtime_worker
+rồi violation_worker lại detect trên vehicle_crop → hàng chục lần ALPR / xe.
+
+NGUYÊN TẮC:
+✅ State machine theo track: waiting → reading → confirmed (hoặc exhausted)
+✅ Chỉ đọc khi crop xe qua PlateQualityGate (đủ lớn, đủ nét, đủ sáng)
+✅ Cộng phiếu qua nhiều frame (ensemble_plate_results), đủ phiếu → confirmed,
+   KHÔNG gọi ALPR cho track đó nữa
+✅ Tối đa max_attempts lần đọc / track, cách nhau ít nhất retry_frames frame,
+   mỗi track tối đa 1 job đang chạy
+✅ Mọi stage (trigger, ALPR realtime, violation) đọc từ cache
+✅ State lưu trong TTLStore → track biến mất thì tự hết hạn, RAM không tăng mãi
+"""
+import threading
+from collections import Counter
+
+from plate_quality import PlateQualityGate, KIND_VEHICLE
+from ttl_store import TTLStore
+
+PLATE_WAITING = 'waiting'      # Chưa đủ chất lượng / chưa đọc
+PLATE_READING = 'reading'      # Đã có kết quả nhưng chưa đủ phiếu
+PLATE_CONFIRMED = 'confirmed'  # Đủ phiếu - dừng ALPR cho track
+PLATE_EXHAUSTED = 'exhausted'  # Hết lượt đọc mà chưa đủ phiếu
+
+
+def ensemble_plate_results(results, min_confidence=0.7, min_votes=2, normalize=str.upper):
+    """Voting mechanism cho ALPR results"""
+    if not results:
+        return None
+
+    votes = Counter()
+    confidence_map = {}
+
+    for r in results:
+        if not r or 'text' not in r:
+            continue
+
+        normalized = normalize(r['text'])
+        if not normalized:
+            continue
+
+        votes[normalized] += 1
+
+        if normalized not in confidence_map:
+            confidence_map[normalized] = []
+        confidence_map[normalized].append(r.get('confidence', 0))
+
+    if not votes:
+        return None
+
+    best_plate, vote_count = votes.most_common(1)[0]
+
+    if vote_count < min_votes:
+        return None
+
+    avg_confidence = sum(confidence_map[best_plate]) / len(confidence_map[best_plate])
+    if avg_confidence < min_confidence:
+        return None
+
+    return {
+        'text': best_plate,
+        'confidence': avg_confidence,
+        'votes': vote_count
+    }
+
+
+class PlateState:
+    """State đọc biển số của 1 track"""
+
+    __slots__ = ('status', 'readings', 'attempts', 'last_attempt_frame', 'pending',
+                 'confirmed', 'best')
+
+    def __init__(self):
+        self.status = PLATE_WAITING
+        self.readings = []             # [{'text', 'confidence'}] các lần đọc hợp lệ
+        self.attempts = 0
+        self.last_attempt_frame = None
+        self.pending = False           # Đang có job ALPR cho track
+        self.confirmed = None          # Kết quả ensemble khi đủ phiếu
+        self.best = {}                 # text -> {'plate', 'confidence', 'bbox', 'crop'} tốt nhất
+
+
+class PlateCache:
+    """
+    Cache biển số theo track_id + quyết định track nào cần chạy ALPR
+    """
+
+    def __init__(self, normalize=str.upper, is_valid=bool, quality_gate=None, min_votes=2,
+                 min_confidence=0.7, max_attempts=10, retry_frames=5, ttl=30.0, capacity=2048):
+        """
+        Args:
+            normalize: Hàm normalize biển số
+            is_valid: Hàm kiểm tra biển số hợp lệ (sau normalize)
+            quality_gate: PlateQualityGate cho crop xe (None = ngưỡng mặc định)
+            min_votes, min_confidence: Ngưỡng ensemble để confirmed
+            max_attempts: Số lần gọi ALPR tối đa / track
+            retry_frames: Khoảng cách tối thiểu (frame) giữa 2 lần đọc của 1 track
+            ttl: State track không được chạm tới quá ttl giây → hết hạn
+            capacity: Số track tối đa trong cache
+        """
+        self.normalize = normalize
+        self.is_valid = is_valid
+        self.quality_gate = quality_gate or PlateQualityGate()
+        self.min_votes = min_votes
+        self.min_confidence = min_confidence
+        self.max_attempts = max_attempts
+        self.retry_frames = retry_frames
+
+        self._states = TTLStore(ttl=ttl, capacity=capacity)
+        self._lock = threading.Lock()
+
+        self.reads_scheduled = 0
+        self.reads_skipped_quality = 0
+        self.reads_skipped_confirmed = 0
+        self.tracks_confirmed = 0
+
+    def _state(self, track_id):
+        state = self._states.get(track_id)
+        if state is None:
+            state = PlateState()
+        self._states.set(track_id, state)  # Tạo mới / gia hạn TTL
+        return state
+
+    def should_read(self, track_id, frame, bbox, frame_id):
+        """
+        Track này có cần chạy ALPR ở frame này không (gọi từ detection stage)
+
+        Nếu True, track được đánh dấu pending - caller PHẢI gọi add_reading()
+        hoặc cancel() khi job xong / bị bỏ.
+
+        Args:
+            frame: ndarray frame gốc
+            bbox: (x1, y1, x2, y2) bbox xe trên frame gốc
+            frame_id: Số thứ tự frame (để giãn cách các lần đọc)
+        """
+        with self._lock:
+            state = self._state(track_id)
+            if state.status in (PLATE_CONFIRMED, PLATE_EXHAUSTED):
+                self.reads_skipped_confirmed += 1
+                return False
+            if state.pending:
+                return False
+            if state.last_attempt_frame is not None and frame_id - state.last_attempt_frame < self.retry_frames:
+                return False
+
+        # Gate chất lượng ngoài lock (kích thước, phơi sáng, Laplacian)
+        h, w = frame.shape[:2]
+        x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+        x2, y2 = min(w, int(bbox[2])), min(h, int(bbox[3]))
+        if self.quality_gate.check(frame[y1:y2, x1:x2], KIND_VEHICLE) is not None:
+            with self._lock:
+                self.reads_skipped_quality += 1
+            return False
+
+        with self._lock:
+            state.pending = True
+            state.attempts += 1
+            state.last_attempt_frame = frame_id
+            self.reads_scheduled += 1
+        return True
+
+    def cancel(self, track_id):
+        """Job ALPR bị bỏ (queue đầy) - hoàn lại lượt đọc"""
+        with self._lock:
+            state = self._states.get(track_id)
+            if state is not None and state.pending:
+                state.pending = False
+                state.attempts -= 1
+
+    def add_reading(self, track_id, plate, confidence, bbox=None, crop=None):
+        """
+        Ghi kết quả 1 lần đọc ALPR của track (plate None = không đọc được)
+
+        Returns:
+            Status mới của track
+        """
+        with self._lock:
+            state = self._state(track_id)
+            state.pending = False
+
+            text = self.normalize(plate) if plate else ''
+            if text and self.is_valid(text):
+                state.readings.append({'text': text, 'confidence': confidence})
+                best = state.best.get(text)
+                if best is None or confidence > best['confidence']:
+                    state.best[text] = {'plate': text, 'confidence': confidence, 'bbox': bbox, 'crop': crop}
+                if state.status == PLATE_WAITING:
+                    state.status = PLATE_READING
+
+                if state.status != PLATE_CONFIRMED:
+                    result = ensemble_plate_results(state.readings, self.min_confidence,
+                                                    self.min_votes, self.normalize)
+                    if result is not None:
+                        state.confirmed = result
+                        state.status = PLATE_CONFIRMED
+                        self.tracks_confirmed += 1
+                        print(f"[PLATE CACHE] ✅ Track {track_id}: {result['text']} "
+                              f"({result['votes']} votes, conf {result['confidence']:.2f}, {state.attempts} ALPR calls)")
+
+            if state.status != PLATE_CONFIRMED and state.attempts >= self.max_attempts:
+                state.status = PLATE_EXHAUSTED
+            return state.status
+
+    def get(self, track_id):
+        """
+        Biển số tốt nhất hiện có của track
+
+        Returns:
+            {'plate', 'confidence', 'votes', 'bbox', 'crop', 'confirmed'} hoặc None
+        """
+        with self._lock:
+            state = self._states.get(track_id)
+            if state is None or not state.readings:
+                return None
+
+            if state.confirmed is not None:
+                text, confidence, votes = (state.confirmed['text'], state.confirmed['confidence'],
+                                           state.confirmed['votes'])
+            else:
+                votes_by_text = Counter(r['text'] for r in state.readings)
+                text, votes = votes_by_text.most_common(1)[0]
+                confidence = state.best[text]['confidence']
+
+            best = state.best[text]
+            return {
+                'plate': text,
+                'confidence': confidence,
+                'votes': votes,
+                'bbox': best['bbox'],
+                'crop': best['crop'],
+                'confirmed': state.status == PLATE_CONFIRMED,
+            }
+
+    def status(self, track_id):
+        with self._lock:
+            state = self._states.get(track_id)
+            return PLATE_WAITING if state is None else state.status
+
+    def release(self, track_id):
+        """Track kết thúc - bỏ state (gọi khi chắc chắn không stage nào còn cần)"""
+        with self._lock:
+            self._states.pop(track_id)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def get_stats(self):
+        """Số lần đọc được lập lịch / bị bỏ do chất lượng / do đã confirmed"""
+        with self._lock:
+            return {
+                'tracks': len(self._states),
+                'reads_scheduled': self.reads_scheduled,
+                'reads_skipped_quality': self.reads_skipped_quality,
+                'reads_skipped_confirmed': self.reads_skipped_confirmed,
+                'tracks_confirmed': self.tracks_confirmed,
+            }
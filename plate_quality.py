@@ -0,0 +1,156 @@
+# plate_quality.py
+"""
+Plate Quality Gate - Loại crop không thể đọc được biển số TRƯỚC khi chạy OCR
+=============================================================================
+
+Mọi entry point ALPR (PlateDetector, EnhancedPlateDetector, alpr_realtime_worker,
+violation_worker) trước đây chạy OCR trên bất kỳ crop nào nhận được, kể cả xe
+ở xa (crop vài chục pixel), xe nhoè do chuyển động, ảnh tối/cháy sáng.
+
+NGUYÊN TẮC:
+✅ 1 scorer dùng chung: kích thước pixel, độ nét (Laplacian variance trên ảnh
+   xám thu nhỏ), phơi sáng (độ sáng trung bình + tỉ lệ pixel cháy/đen),
+   tỉ lệ khung (chỉ với crop biển số)
+✅ 2 loại crop: 'vehicle' (crop xe, trước plate detector) và 'plate'
+   (crop biển số, trước OCR)
+✅ Đếm số crop bị loại theo từng lý do → biết ALPR tiết kiệm được bao nhiêu
+"""
+import threading
+
+import cv2
+import numpy as np
+
+KIND_VEHICLE = 'vehicle'
+KIND_PLATE = 'plate'
+
+REJECT_TOO_SMALL = 'too_small'
+REJECT_BLURRY = 'blurry'
+REJECT_UNDEREXPOSED = 'underexposed'
+REJECT_OVEREXPOSED = 'overexposed'
+REJECT_ASPECT = 'aspect'
+
+REJECT_REASONS = (REJECT_TOO_SMALL, REJECT_BLURRY, REJECT_UNDEREXPOSED, REJECT_OVEREXPOSED, REJECT_ASPECT)
+
+
+def _gray_thumbnail(crop, width):
+    """Ảnh xám thu nhỏ về width (không phóng to) - đo nét / sáng rẻ, ít phụ thuộc độ phân giải"""
+    h, w = crop.shape[:2]
+    if w > width:
+        crop = cv2.resize(crop, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return crop
+
+
+def crop_sharpness(crop, width=128):
+    """Độ nét (Laplacian variance) trên ảnh xám thu nhỏ về width"""
+    return cv2.Laplacian(_gray_thumbnail(crop, width), cv2.CV_64F).var()
+
+
+class PlateQualityGate:
+    """
+    Chấm điểm + quyết định crop có đáng chạy OCR không
+    """
+
+    def __init__(self, min_vehicle_width=96, min_vehicle_height=64, min_vehicle_sharpness=50.0,
+                 min_plate_width=40, min_plate_height=12, min_plate_sharpness=20.0,
+                 min_plate_aspect=1.0, max_plate_aspect=6.5,
+                 min_brightness=25.0, max_brightness=235.0, max_clipped=0.6, thumbnail_width=128):
+        """
+        Args:
+            min_vehicle_width, min_vehicle_height: Kích thước crop xe tối thiểu (pixel)
+            min_vehicle_sharpness: Laplacian variance tối thiểu của crop xe
+            min_plate_width, min_plate_height: Kích thước crop biển số tối thiểu (pixel)
+            min_plate_sharpness: Laplacian variance tối thiểu của crop biển số
+            min_plate_aspect, max_plate_aspect: Rộng / cao của biển số
+                (biển VN: 2 dòng xe máy ~1.4, 2 dòng ô tô ~2.0, 1 dòng ~4.7)
+            min_brightness, max_brightness: Độ sáng trung bình (0-255) chấp nhận được
+            max_clipped: Tỉ lệ pixel đen (<=5) hoặc cháy (>=250) tối đa
+            thumbnail_width: Chiều rộng ảnh thu nhỏ để đo nét / sáng
+        """
+        self.limits = {
+            KIND_VEHICLE: (min_vehicle_width, min_vehicle_height, min_vehicle_sharpness),
+            KIND_PLATE: (min_plate_width, min_plate_height, min_plate_sharpness),
+        }
+        self.min_plate_aspect = min_plate_aspect
+        self.max_plate_aspect = max_plate_aspect
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.thumbnail_width = thumbnail_width
+
+        self._lock = threading.Lock()
+        self.checked = {KIND_VEHICLE: 0, KIND_PLATE: 0}
+        self.rejected = {kind: {reason: 0 for reason in REJECT_REASONS} for kind in self.checked}
+
+    def evaluate(self, crop, kind=KIND_VEHICLE):
+        """
+        Chấm điểm crop (không cập nhật thống kê)
+
+        Returns:
+            dict {'reason': lý do loại hoặc None, 'score': 0..1, 'width', 'height',
+                  'sharpness', 'brightness', 'aspect'}
+        """
+        min_w, min_h, min_sharpness = self.limits[kind]
+        h, w = crop.shape[:2]
+        info = {'reason': None, 'score': 0.0, 'width': w, 'height': h,
+                'sharpness': None, 'brightness': None, 'aspect': w / h if h else 0.0}
+
+        # Kiểm tra rẻ trước: kích thước, tỉ lệ khung (không cần đọc pixel)
+        if w < min_w or h < min_h:
+            info['reason'] = REJECT_TOO_SMALL
+            return info
+        if kind == KIND_PLATE and not self.min_plate_aspect <= info['aspect'] <= self.max_plate_aspect:
+            info['reason'] = REJECT_ASPECT
+            return info
+
+        gray = _gray_thumbnail(crop, self.thumbnail_width)
+        brightness = float(gray.mean())
+        dark = float(np.count_nonzero(gray <= 5)) / gray.size
+        bright = float(np.count_nonzero(gray >= 250)) / gray.size
+        info['brightness'] = brightness
+        if brightness < self.min_brightness or dark > self.max_clipped:
+            info['reason'] = REJECT_UNDEREXPOSED
+            return info
+        if brightness > self.max_brightness or bright > self.max_clipped:
+            info['reason'] = REJECT_OVEREXPOSED
+            return info
+
+        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+        info['sharpness'] = sharpness
+        if sharpness < min_sharpness:
+            info['reason'] = REJECT_BLURRY
+            return info
+
+        # Điểm tổng hợp (để so sánh các crop đã qua gate): mỗi thành phần bão hoà ở 2x ngưỡng
+        size_term = min(1.0, min(w / (2 * min_w), h / (2 * min_h)))
+        sharp_term = min(1.0, sharpness / (2 * min_sharpness)) if min_sharpness > 0 else 1.0
+        exposure_term = 1.0 - abs(brightness - 128.0) / 128.0
+        info['score'] = size_term * sharp_term * max(0.0, exposure_term)
+        return info
+
+    def check(self, crop, kind=KIND_VEHICLE):
+        """
+        Crop có đáng chạy OCR không (có cập nhật thống kê)
+
+        Returns:
+            None nếu đạt, ngược lại là lý do loại (REJECT_*)
+        """
+        reason = self.evaluate(crop, kind)['reason']
+        with self._lock:
+            self.checked[kind] += 1
+            if reason is not None:
+                self.rejected[kind][reason] += 1
+        return reason
+
+    def get_stats(self):
+        """Số crop đã kiểm tra / bị loại theo lý do, cho từng loại crop"""
+        with self._lock:
+            return {
+                kind: {
+                    'checked': self.checked[kind],
+                    'rejected': sum(self.rejected[kind].values()),
+                    'reasons': dict(self.rejected[kind]),
+                }
+                for kind in self.checked
+            }
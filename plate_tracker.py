@@ -0,0 +1,158 @@
+# plate_tracker.py
+"""
+Plate Tracker - Dự đoán bbox biển số từ chuyển động của track xe
+================================================================
+
+Mỗi lần đọc biển số (schedule_plate_read) trước đây chạy lại TỪ ĐẦU cả plate
+detector (yolo-v9) lẫn OCR trên crop xe, dù vài frame trước đã biết biển số
+nằm ở đâu trên xe đó.
+
+NGUYÊN TẮC:
+✅ Lưu vị trí biển số TƯƠNG ĐỐI so với bbox xe (theo tỉ lệ w/h) + template xám nhỏ
+✅ Frame sau: bbox xe hiện tại → bbox biển số dự đoán → matchTemplate
+   (TM_CCOEFF_NORMED) trong vùng tìm kiếm nhỏ quanh dự đoán
+✅ Match đủ tốt → chỉ chạy OCR trên crop biển số (bỏ qua plate detector)
+✅ Match kém / OCR không ra biển số → miss(), lần sau chạy detect đầy đủ
+✅ State theo track trong TTLStore (track biến mất thì tự hết hạn)
+"""
+import threading
+
+import cv2
+
+from ttl_store import TTLStore
+
+
+class PlateTrack:
+    """Vị trí biển số tương đối trên xe + template của 1 track"""
+
+    __slots__ = ('rel_box', 'template', 'misses')
+
+    def __init__(self, rel_box, template):
+        self.rel_box = rel_box      # (rx1, ry1, rx2, ry2) theo tỉ lệ bbox xe
+        self.template = template    # Ảnh xám crop biển số lần gần nhất
+        self.misses = 0
+
+
+def _to_gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+class PlateTracker:
+    """
+    Theo dõi bbox biển số theo track_id (không chạy model nào)
+    """
+
+    def __init__(self, min_score=0.6, search_margin=0.5, max_misses=2, ttl=30.0, capacity=2048):
+        """
+        Args:
+            min_score: Điểm matchTemplate (TM_CCOEFF_NORMED) tối thiểu để tin dự đoán
+            search_margin: Vùng tìm kiếm = bbox dự đoán nới thêm margin * kích thước biển số
+            max_misses: Số lần match/OCR thất bại liên tiếp trước khi bỏ state track
+            ttl: State track không được chạm tới quá ttl giây → hết hạn
+            capacity: Số track tối đa
+        """
+        self.min_score = min_score
+        self.search_margin = search_margin
+        self.max_misses = max_misses
+        self._tracks = TTLStore(ttl=ttl, capacity=capacity)
+        self._lock = threading.Lock()
+
+        self.predicted = 0
+        self.matched = 0
+        self.misses = 0
+
+    def update(self, track_id, frame, vehicle_bbox, plate_bbox):
+        """
+        Ghi vị trí biển số vừa được plate detector (hoặc OCR trên dự đoán) xác nhận
+
+        Args:
+            frame: ndarray frame gốc
+            vehicle_bbox, plate_bbox: (x1, y1, x2, y2) trên frame gốc
+        """
+        vx1, vy1, vx2, vy2 = vehicle_bbox
+        px1, py1, px2, py2 = [int(v) for v in plate_bbox]
+        vw, vh = vx2 - vx1, vy2 - vy1
+        if vw <= 0 or vh <= 0 or px2 <= px1 or py2 <= py1:
+            return
+        crop = frame[max(0, py1):py2, max(0, px1):px2]
+        if crop.size == 0:
+            return
+
+        rel_box = ((px1 - vx1) / vw, (py1 - vy1) / vh, (px2 - vx1) / vw, (py2 - vy1) / vh)
+        with self._lock:
+            self._tracks.set(track_id, PlateTrack(rel_box, _to_gray(crop).copy()))
+
+    def predict(self, track_id, frame, vehicle_bbox):
+        """
+        Bbox biển số trên frame hiện tại (dự đoán từ bbox xe + kiểm tra bằng template)
+
+        Returns:
+            ((x1, y1, x2, y2), score) nếu match đủ tốt, ngược lại None
+        """
+        with self._lock:
+            track = self._tracks.get(track_id)
+        if track is None:
+            return None
+
+        h, w = frame.shape[:2]
+        vx1, vy1, vx2, vy2 = vehicle_bbox
+        vw, vh = vx2 - vx1, vy2 - vy1
+        rx1, ry1, rx2, ry2 = track.rel_box
+        px1, py1 = vx1 + rx1 * vw, vy1 + ry1 * vh
+        pw, ph = int(round((rx2 - rx1) * vw)), int(round((ry2 - ry1) * vh))
+        if pw < 4 or ph < 4:
+            return None
+
+        # Vùng tìm kiếm quanh dự đoán
+        mx, my = int(pw * self.search_margin), int(ph * self.search_margin)
+        sx1, sy1 = max(0, int(px1) - mx), max(0, int(py1) - my)
+        sx2, sy2 = min(w, int(px1) + pw + mx), min(h, int(py1) + ph + my)
+        if sx2 - sx1 < pw or sy2 - sy1 < ph:
+            self.miss(track_id)
+            return None
+
+        # Template theo kích thước biển số hiện tại (xe tiến lại gần → biển to dần)
+        template = cv2.resize(track.template, (pw, ph), interpolation=cv2.INTER_LINEAR)
+        scores = cv2.matchTemplate(_to_gray(frame[sy1:sy2, sx1:sx2]), template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx1, my1) = cv2.minMaxLoc(scores)
+
+        with self._lock:
+            self.predicted += 1
+        if score < self.min_score:
+            self.miss(track_id)
+            return None
+
+        with self._lock:
+            self.matched += 1
+        bbox = (sx1 + mx1, sy1 + my1, sx1 + mx1 + pw, sy1 + my1 + ph)
+        return bbox, float(score)
+
+    def miss(self, track_id):
+        """Dự đoán sai / OCR không ra biển số → quá max_misses thì bỏ state track"""
+        with self._lock:
+            self.misses += 1
+            track = self._tracks.get(track_id)
+            if track is None:
+                return
+            track.misses += 1
+            if track.misses >= self.max_misses:
+                self._tracks.pop(track_id)
+
+    def release(self, track_id):
+        with self._lock:
+            self._tracks.pop(track_id)
+
+    def clear(self):
+        with self._lock:
+            self._tracks.clear()
+
+    def get_stats(self):
+        """Số lần dự đoán / match được (bỏ qua plate detector) / miss"""
+        with self._lock:
+            return {
+                'tracks': len(self._tracks),
+                'predicted': self.predicted,
+                'matched': self.matched,
+                'misses': self.misses,
+                'match_rate': self.matched / self.predicted if self.predicted else 0.0,
+            }
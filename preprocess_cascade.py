@@ -0,0 +1,120 @@
+# preprocess_cascade.py
+"""
+Preprocess Cascade - Thứ tự preprocessing theo hiệu quả / chi phí (học online)
+===============================================================================
+
+EnhancedPlateDetector trước đây khi đọc lần đầu thất bại chạy lại TOÀN BỘ
+Fast-ALPR cho từng phương pháp theo thứ tự cố định, kể cả 'denoise' / 'combined'
+(fastNlMeansDenoisingColored - rất chậm).
+
+NGUYÊN TẮC:
+✅ Mỗi phương pháp có thống kê: số lần thử, số lần đọc được, tổng thời gian
+   (preprocess + phần ALPR của nó)
+✅ Điểm = tỉ lệ thành công / thời gian trung bình (có prior → phương pháp mới
+   vẫn được thử, không chia cho 0)
+✅ plan(): chọn các phương pháp điểm cao nhất vừa đủ budget thời gian
+✅ Thread-safe (ALPR service thread + worker pool cùng ghi)
+"""
+import threading
+
+# Rẻ: chạy 1 batch ngay trong stage gọi. Chậm: chạy trên worker pool
+CHEAP_METHODS = ('clahe', 'sharpen', 'bright', 'contrast')
+SLOW_METHODS = ('denoise', 'combined')
+
+# Thời gian ước lượng ban đầu (giây / phương pháp, gồm ALPR) trước khi có số đo
+DEFAULT_PRIOR_SECONDS = {
+    'clahe': 0.02, 'sharpen': 0.02, 'bright': 0.02, 'contrast': 0.015,
+    'denoise': 0.25, 'combined': 0.3,
+}
+
+
+class MethodStats:
+    """Thống kê của 1 phương pháp preprocessing"""
+
+    __slots__ = ('attempts', 'successes', 'seconds', 'prior_seconds')
+
+    def __init__(self, prior_seconds):
+        self.attempts = 0
+        self.successes = 0
+        self.seconds = 0.0
+        self.prior_seconds = prior_seconds
+
+    @property
+    def success_rate(self):
+        # Laplace prior (1 thành công / 2 lần thử) → phương pháp chưa thử có rate 0.5
+        return (self.successes + 1) / (self.attempts + 2)
+
+    @property
+    def avg_seconds(self):
+        # Prior tính như 1 lần đo
+        return (self.seconds + self.prior_seconds) / (self.attempts + 1)
+
+    @property
+    def score(self):
+        return self.success_rate / max(self.avg_seconds, 1e-6)
+
+
+class PreprocessCascade:
+    """
+    Xếp thứ tự phương pháp preprocessing theo success rate / CPU time đo được
+    """
+
+    def __init__(self, methods=CHEAP_METHODS + SLOW_METHODS, prior_seconds=None):
+        """
+        Args:
+            methods: Các phương pháp được theo dõi
+            prior_seconds: Dict method -> thời gian ước lượng ban đầu (giây)
+        """
+        prior_seconds = prior_seconds or DEFAULT_PRIOR_SECONDS
+        self._stats = {method: MethodStats(prior_seconds.get(method, 0.05)) for method in methods}
+        self._lock = threading.Lock()
+
+    def record(self, method, success, seconds):
+        """Ghi kết quả 1 lần thử phương pháp (success = Fast-ALPR đọc được biển số)"""
+        with self._lock:
+            stats = self._stats.get(method)
+            if stats is None:
+                stats = self._stats[method] = MethodStats(seconds)
+            stats.attempts += 1
+            stats.successes += int(bool(success))
+            stats.seconds += seconds
+
+    def estimated_cost(self, method):
+        with self._lock:
+            return self._stats[method].avg_seconds
+
+    def order(self, methods):
+        """Các phương pháp theo điểm giảm dần"""
+        with self._lock:
+            return sorted(methods, key=lambda m: self._stats[m].score, reverse=True)
+
+    def plan(self, methods, budget):
+        """
+        Các phương pháp điểm cao nhất có tổng thời gian ước lượng <= budget (giây)
+
+        Luôn trả về ít nhất 1 phương pháp (nếu methods không rỗng)
+        """
+        with self._lock:
+            ranked = sorted(methods, key=lambda m: self._stats[m].score, reverse=True)
+            selected, total = [], 0.0
+            for method in ranked:
+                cost = self._stats[method].avg_seconds
+                if selected and total + cost > budget:
+                    continue
+                selected.append(method)
+                total += cost
+            return selected
+
+    def get_stats(self):
+        """Thống kê từng phương pháp: attempts, success_rate, avg_ms, score"""
+        with self._lock:
+            return {
+                method: {
+                    'attempts': stats.attempts,
+                    'successes': stats.successes,
+                    'success_rate': round(stats.success_rate, 3),
+                    'avg_ms': round(stats.avg_seconds * 1000, 1),
+                    'score': round(stats.score, 2),
+                }
+                for method, stats in self._stats.items()
+            }
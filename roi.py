@@ -0,0 +1,129 @@
+# roi.py
+"""
+Road ROI - Vùng quan tâm (polygon) cho từng nguồn video/camera
+===============================================================
+
+Trời, vỉa hè, nhà cửa có thể chiếm nửa khung hình nhưng trước đây
+detection và ALPR proactive vẫn chạy trên toàn bộ frame.
+
+NGUYÊN TẮC:
+✅ Polygon lưu dạng toạ độ chuẩn hoá [0, 1] → dùng được cho frame đã scale
+✅ Detection chỉ nhận vùng bounding rect của ROI, phần ngoài polygon bị tô đen
+✅ Bbox trả về được dịch ngược về toạ độ full frame
+✅ Detection có điểm tiếp đất (đáy giữa bbox) ngoài polygon bị loại TRƯỚC tracking
+
+File cấu hình (JSON), key = tên file video hoặc 'camera', 'default' là fallback:
+    {
+        "default": [[0.0, 0.35], [1.0, 0.35], [1.0, 1.0], [0.0, 1.0]],
+        "camera": [[0.1, 0.4], [0.9, 0.4], [1.0, 1.0], [0.0, 1.0]],
+        "highway.mp4": [[0.2, 0.3], [0.8, 0.3], [1.0, 1.0], [0.0, 1.0]]
+    }
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from source_config import load_source_config, get_source_entry
+
+
+class RoiPolygon:
+    """
+    Polygon ROI với toạ độ chuẩn hoá, cache mask / bounding rect theo shape frame
+    """
+
+    def __init__(self, points):
+        """
+        Args:
+            points: List [[x, y], ...] toạ độ chuẩn hoá [0, 1] (tối thiểu 3 điểm)
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[0] < 3 or points.shape[1] != 2:
+            raise ValueError(f"ROI polygon needs at least 3 [x, y] points, got shape {points.shape}")
+        self.points = np.clip(points, 0.0, 1.0)
+        self._cache = {}  # (h, w) -> (rect, mask)
+        self._lock = threading.Lock()
+
+    def _layout(self, shape):
+        """(x1, y1, x2, y2) bounding rect + mask uint8 (h, w) cho shape frame"""
+        h, w = shape[:2]
+        with self._lock:
+            cached = self._cache.get((h, w))
+            if cached is not None:
+                return cached
+
+            pixel_points = np.round(self.points * [w - 1, h - 1]).astype(np.int32)
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [pixel_points], 255)
+
+            x, y, rw, rh = cv2.boundingRect(pixel_points)
+            rect = (x, y, min(w, x + rw), min(h, y + rh))
+            self._cache[(h, w)] = (rect, mask)
+            return rect, mask
+
+    def rect(self, shape):
+        """Bounding rect (x1, y1, x2, y2) của ROI trong frame có shape này"""
+        return self._layout(shape)[0]
+
+    def crop(self, frame):
+        """
+        Cắt frame theo bounding rect của ROI (view, KHÔNG copy)
+
+        Returns:
+            (crop, (offset_x, offset_y))
+        """
+        x1, y1, x2, y2 = self.rect(frame.shape)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def apply(self, frame):
+        """
+        Cắt frame theo bounding rect VÀ tô đen phần ngoài polygon (input cho detection)
+
+        Returns:
+            (masked_crop, (offset_x, offset_y))
+        """
+        (x1, y1, x2, y2), mask = self._layout(frame.shape)
+        crop = frame[y1:y2, x1:x2]
+        return cv2.bitwise_and(crop, crop, mask=mask[y1:y2, x1:x2]), (x1, y1)
+
+    def contains(self, points, shape):
+        """
+        Args:
+            points: (N, 2) toạ độ pixel (x, y) trong frame có shape này
+            shape: Shape frame
+
+        Returns:
+            (N,) bool - điểm nằm trong polygon
+        """
+        _, mask = self._layout(shape)
+        h, w = mask.shape
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xs = np.clip(points[:, 0].astype(int), 0, w - 1)
+        ys = np.clip(points[:, 1].astype(int), 0, h - 1)
+        return mask[ys, xs] > 0
+
+    def contains_boxes(self, boxes, shape):
+        """Bbox (N, 4) [x1, y1, x2, y2] có điểm tiếp đất (đáy giữa) nằm trong polygon"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        anchors = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3] - 1], axis=1)
+        return self.contains(anchors, shape)
+
+
+def load_roi_config(path):
+    """
+    Đọc file cấu hình ROI
+
+    Returns:
+        Dict {source_key: RoiPolygon}, rỗng nếu không có file
+    """
+    return load_source_config(path, RoiPolygon, 'ROI')
+
+
+def get_source_roi(config, source):
+    """
+    ROI cho 1 nguồn: khớp tên file video (basename) / 'camera', fallback 'default'
+
+    Returns:
+        RoiPolygon hoặc None (toàn frame)
+    """
+    return get_source_entry(config, source)
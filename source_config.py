@@ -0,0 +1,65 @@
+# source_config.py
+"""
+Source Config - File cấu hình JSON theo NGUỒN video/camera
+===========================================================
+
+Dùng chung cho ROI, calibration, speed trap...
+Key = tên file video (basename) hoặc 'camera', 'default' là fallback:
+    {
+        "default": {...},
+        "camera": {...},
+        "highway.mp4": {...}
+    }
+"""
+import json
+import os
+
+
+def load_source_config(path, factory, tag):
+    """
+    Đọc file cấu hình theo nguồn
+
+    Args:
+        path: Đường dẫn file JSON (không tồn tại / không đọc được → {})
+        factory: Hàm tạo object từ giá trị JSON của 1 nguồn
+        tag: Tag log, vd. 'ROI'
+
+    Returns:
+        Dict {source_key: object}, bỏ qua (có log) các entry không hợp lệ
+    """
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[{tag}] ⚠️  Cannot read config {path}: {e}")
+        return {}
+    if not isinstance(raw, dict):
+        print(f"[{tag}] ⚠️  Config {path} must be a JSON object keyed by source")
+        return {}
+
+    config = {}
+    for key, value in raw.items():
+        try:
+            config[key] = factory(value)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"[{tag}] ⚠️  Invalid config for '{key}': {e}")
+    return config
+
+
+def get_source_entry(config, source):
+    """
+    Entry cho 1 nguồn: khớp tên file video (basename) / 'camera', fallback 'default'
+
+    Returns:
+        Object hoặc None nếu không có cấu hình
+    """
+    if not config:
+        return None
+    if source:
+        key = os.path.basename(str(source))
+        if key in config:
+            return config[key]
+    return config.get('default')
@@ -3,96 +3,188 @@
 Speed Tracker tối ưu cho web streaming
 - Tính tốc độ chính xác và mượt
 - Nhẹ, không block thread chính
+- Dùng MEDIA TIMESTAMP của frame (frame_number / fps), KHÔNG dùng time.time()
+  → tốc độ không phụ thuộc tốc độ xử lý (batch / song song / đọc nhanh)
+- Lưu trữ dạng mảng NumPy: mỗi track chiếm 1 SLOT trong ring lịch sử vị trí
+  cố định, update_many() tính tốc độ cho cả frame trong 1 lượt vectorized
+- Có GroundCalibration (homography) → vị trí là toạ độ mặt đất (mét) của điểm
+  tiếp đất, KHÔNG dùng pixel_to_meter
 """
 import time
-import uuid
-from collections import deque
+
+import numpy as np
+
 
 class SpeedTracker:
-    def __init__(self, pixel_to_meter=0.04):
-        self.data = {}   # track_id -> info
+    def __init__(self, pixel_to_meter=0.04, capacity=256, max_history=8, calibration=None):
+        """
+        Args:
+            pixel_to_meter: Hệ số quy đổi pixel -> mét (khi không có calibration)
+            capacity: Số slot ban đầu (tự nhân đôi khi đầy)
+            max_history: Số vị trí gần nhất giữ lại cho mỗi track
+            calibration: GroundCalibration của nguồn (None = dùng pixel_to_meter)
+        """
         self.pixel_to_meter = pixel_to_meter
-        # Lịch sử vị trí để tính tốc độ chính xác hơn
-        self.position_history = {}  # track_id -> deque of (time, position)
+        self.calibration = calibration
         # Tối ưu: Giảm maxlen để nhẹ hơn cho web
-        self.max_history = 8  # Giảm từ 10 xuống 8
-
-    def update(self, track_id, bbox):
-        x1, y1, x2, y2 = bbox
-        # Dùng center point để tính tốc độ
-        cx = (x1 + x2) / 2.0
-        cy = (y1 + y2) / 2.0
-        now = time.time()
-
-        # Xe mới vào khung
-        if track_id not in self.data:
-            self.data[track_id] = {
-                "first_time": now,
-                "first_pos": (cx, cy),
-                "speed": None,
-                "uuid": str(uuid.uuid4())[:8]
-            }
-            # Khởi tạo lịch sử vị trí
-            self.position_history[track_id] = deque(maxlen=self.max_history)  # Giữ 8 điểm gần nhất
-            self.position_history[track_id].append((now, (cx, cy)))
-            return None
+        self.max_history = max_history  # Giảm từ 10 xuống 8
+
+        self.capacity = 0
+        self.times = np.empty((0, max_history))                  # slot -> ring thời gian
+        self.positions = np.empty((0, max_history, 2))          # slot -> ring (x, y) pixel hoặc mét
+        self.counts = np.empty(0, dtype=np.int64)                # Số điểm hợp lệ trong ring
+        self.heads = np.empty(0, dtype=np.int64)                 # Vị trí ghi kế tiếp
+        self.speeds = np.empty(0)                                # km/h, NaN = chưa có
+
+        self.slots = {}   # track_id -> slot
+        self._free = []   # Stack slot trống → cấp phát / thu hồi O(1)
+        self._grow(max(1, capacity))
+
+    def _grow(self, new_capacity):
+        """Mở rộng mảng (nhân đôi) - slot cũ giữ nguyên vị trí"""
+        extra = new_capacity - self.capacity
+        self.times = np.concatenate([self.times, np.zeros((extra, self.max_history))])
+        self.positions = np.concatenate([self.positions, np.zeros((extra, self.max_history, 2))])
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        self.heads = np.concatenate([self.heads, np.zeros(extra, dtype=np.int64)])
+        self.speeds = np.concatenate([self.speeds, np.full(extra, np.nan)])
+        self._free.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def _slot(self, track_id):
+        slot = self.slots.get(track_id)
+        if slot is None:
+            if not self._free:
+                self._grow(self.capacity * 2)
+            slot = self._free.pop()
+            self.slots[track_id] = slot
+        return slot
+
+    def update_many(self, track_ids, bboxes, timestamp=None):
+        """
+        Cập nhật vị trí + tính tốc độ cho TẤT CẢ track của 1 frame
+
+        Args:
+            track_ids: List track_id (không trùng nhau trong 1 frame)
+            bboxes: List/array (N, 4) (x1, y1, x2, y2)
+            timestamp: Media timestamp của frame (giây, = frame_number / fps).
+                       None → time.time() (chỉ để tương thích ngược, phụ thuộc tốc độ xử lý)
+
+        Returns:
+            List tốc độ km/h (None nếu track mới / chưa đủ dữ liệu), cùng thứ tự track_ids
+        """
+        if len(track_ids) == 0:
+            return []
+
+        now = time.time() if timestamp is None else timestamp
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        if self.calibration is not None:
+            # Điểm tiếp đất → mét trên mặt đường (1 phép nhân ma trận cho cả frame)
+            centers = self.calibration.ground_anchors(bboxes)
+            meters_per_unit = 1.0
+        else:
+            # Dùng center point để tính tốc độ
+            centers = self._bbox_centers(bboxes)
+            meters_per_unit = self.pixel_to_meter
+        slots = np.fromiter((self._slot(tid) for tid in track_ids), dtype=np.int64, count=len(track_ids))
+
+        # Điểm gần nhất trước frame này
+        has_prev = self.counts[slots] > 0
+        prev_idx = (self.heads[slots] - 1) % self.max_history
+        prev_pos = self.positions[slots, prev_idx]
+        time_passed = now - self.times[slots, prev_idx]
 
-        item = self.data[track_id]
-        
-        # Thêm vị trí hiện tại vào lịch sử
-        self.position_history[track_id].append((now, (cx, cy)))
-        
         # Tính tốc độ dựa trên 2 điểm gần nhất (chính xác hơn)
-        history = self.position_history[track_id]
-        if len(history) < 2:
+        valid = has_prev & (time_passed > 0)
+        dist = np.hypot(centers[:, 0] - prev_pos[:, 0], centers[:, 1] - prev_pos[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed_kmh = dist * meters_per_unit / time_passed * 3.6
+
+        # Smooth speed: Exponential moving average 75% mới, 25% cũ
+        old_speed = self.speeds[slots]
+        speed_kmh = np.where(np.isnan(old_speed), speed_kmh, 0.75 * speed_kmh + 0.25 * old_speed)
+        self.speeds[slots[valid]] = np.round(speed_kmh[valid], 2)
+
+        # Ghi vị trí hiện tại vào ring (time_passed <= 0 → giữ tốc độ cũ)
+        heads = self.heads[slots]
+        self.times[slots, heads] = now
+        self.positions[slots, heads] = centers
+        self.heads[slots] = (heads + 1) % self.max_history
+        self.counts[slots] = np.minimum(self.counts[slots] + 1, self.max_history)
+
+        speeds = self.speeds[slots]
+        return [None if not prev or np.isnan(speed) else float(speed)
+                for prev, speed in zip(has_prev, speeds)]
+
+    @staticmethod
+    def _bbox_centers(bboxes):
+        return (bboxes[:, :2] + bboxes[:, 2:]) / 2.0
+
+    def to_meters(self, bboxes):
+        """
+        Vị trí (mét) của nhiều bbox: điểm tiếp đất qua homography nếu có calibration,
+        ngược lại center * pixel_to_meter
+
+        Returns:
+            (N, 2) mét
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        if self.calibration is not None:
+            return self.calibration.ground_anchors(bboxes)
+        return self._bbox_centers(bboxes) * self.pixel_to_meter
+
+    def update(self, track_id, bbox, timestamp=None):
+        """
+        Cập nhật 1 track (xem update_many)
+
+        Returns:
+            Tốc độ km/h hoặc None nếu chưa đủ dữ liệu
+        """
+        return self.update_many([track_id], [bbox], timestamp)[0]
+
+    def set_calibration(self, calibration):
+        """Đổi calibration (khi đổi nguồn) - xoá lịch sử vì đơn vị vị trí thay đổi"""
+        self.calibration = calibration
+        for track_id in list(self.slots):
+            self.release(track_id)
+
+    def history(self, track_id):
+        """
+        Lịch sử vị trí của track theo thứ tự thời gian (pixel, hoặc mét nếu có calibration)
+
+        Returns:
+            (times (K,), positions (K, 2)) hoặc None nếu track không tồn tại
+        """
+        slot = self.slots.get(track_id)
+        if slot is None:
             return None
-        
-        # Lấy 2 điểm cuối cùng
-        (t1, (x1_pos, y1_pos)) = history[-2]
-        (t2, (x2_pos, y2_pos)) = history[-1]
-        
-        # Tính khoảng cách pixel
-        pixel_dist = ((x2_pos - x1_pos) ** 2 + (y2_pos - y1_pos) ** 2) ** 0.5
-        time_passed = t2 - t1
-        
-        if time_passed <= 0:
-            # Nếu không có thời gian, dùng phương pháp cũ
-            pixel_dist = ((cx - item["first_pos"][0]) ** 2 + (cy - item["first_pos"][1]) ** 2) ** 0.5
-            time_passed = now - item["first_time"]
-            if time_passed <= 0:
-                return item.get("speed")
-        else:
-            # Cập nhật first_pos để tính tốc độ trung bình
-            item["first_pos"] = (cx, cy)
-            item["first_time"] = now
-        
-        # Chuyển đổi sang mét và tính tốc độ
-        meter_dist = pixel_dist * self.pixel_to_meter
-        speed_ms = meter_dist / time_passed  # m/s
-        speed_kmh = speed_ms * 3.6
-        
-        # Smooth speed với moving average (tối ưu cho web)
-        if item["speed"] is not None:
-            # Exponential moving average: 75% mới, 25% cũ (ổn định hơn cho web)
-            speed_kmh = 0.75 * speed_kmh + 0.25 * item["speed"]
-        
-        item["speed"] = round(speed_kmh, 2)
-        
-        # Cleanup: Xóa dữ liệu cũ để tiết kiệm memory (tối ưu cho web)
-        # Giữ lại track nếu còn trong frame (có trong position_history)
-        return item["speed"]
-    
+        count = self.counts[slot]
+        order = (self.heads[slot] - count + np.arange(count)) % self.max_history
+        return self.times[slot, order].copy(), self.positions[slot, order].copy()
+
+    def get_speed(self, track_id):
+        """Tốc độ hiện tại của track (km/h), None nếu chưa có"""
+        slot = self.slots.get(track_id)
+        if slot is None or np.isnan(self.speeds[slot]):
+            return None
+        return float(self.speeds[slot])
+
+    def release(self, track_id):
+        """Thu hồi slot của track đã kết thúc - O(1)"""
+        slot = self.slots.pop(track_id, None)
+        if slot is None:
+            return
+        self.counts[slot] = 0
+        self.heads[slot] = 0
+        self.speeds[slot] = np.nan
+        self._free.append(slot)
+
     def cleanup_old_tracks(self, active_track_ids):
         """
         Xóa dữ liệu của các track không còn active (tối ưu memory cho web)
         """
-        tracks_to_remove = []
-        for track_id in self.data.keys():
-            if track_id not in active_track_ids:
-                tracks_to_remove.append(track_id)
-        
-        for track_id in tracks_to_remove:
-            if track_id in self.data:
-                del self.data[track_id]
-            if track_id in self.position_history:
-                del self.position_history[track_id]
+        for track_id in [tid for tid in self.slots if tid not in active_track_ids]:
+            self.release(track_id)
+
+    def __len__(self):
+        return len(self.slots)
@@ -0,0 +1,179 @@
+# speed_trap.py
+"""
+Speed Trap - Đo tốc độ bằng 2 vạch ảo
+======================================
+
+Thay vì tốc độ tức thời từng frame (2 điểm gần nhất + EMA, nhạy với bbox rung),
+người dùng vẽ 2 vạch cách nhau 1 khoảng đã biết (mét):
+
+    speed = distance_m / |t_cross_b - t_cross_a|
+
+NGUYÊN TẮC:
+✅ Chỉ cần test giao cắt đoạn thẳng (vị trí frame trước -> frame này) với 2 vạch
+✅ Nội suy sub-frame: thời điểm cắt = t_prev + u * (t_now - t_prev)
+✅ Dùng media timestamp → không phụ thuộc tốc độ xử lý
+✅ Detection có thể giới hạn trong dải quanh 2 vạch (band_roi)
+
+Toạ độ vạch chuẩn hoá [0, 1] như ROI. File cấu hình theo nguồn (source_config):
+    {
+        "camera": {
+            "line_a": [[0.10, 0.55], [0.90, 0.55]],
+            "line_b": [[0.05, 0.80], [0.95, 0.80]],
+            "distance_m": 15.0
+        }
+    }
+"""
+import numpy as np
+
+from roi import RoiPolygon
+from source_config import load_source_config, get_source_entry
+
+
+def segment_crossings(p, q, a, b):
+    """
+    Giao cắt của N đoạn p[i]->q[i] với 1 đoạn a->b (vectorized)
+
+    Returns:
+        crossed: (N,) bool
+        u: (N,) vị trí giao điểm trên p->q (0 = p, 1 = q)
+    """
+    r = q - p
+    s = b - a
+    denom = r[:, 0] * s[1] - r[:, 1] * s[0]
+    ap = a - p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = (ap[:, 0] * s[1] - ap[:, 1] * s[0]) / denom
+        v = (ap[:, 0] * r[:, 1] - ap[:, 1] * r[:, 0]) / denom
+    crossed = (denom != 0) & (u >= 0) & (u <= 1) & (v >= 0) & (v <= 1)
+    return crossed, u
+
+
+class SpeedTrap:
+    """
+    Đo tốc độ theo thời điểm track cắt vạch A và vạch B
+    """
+
+    def __init__(self, line_a, line_b, distance_m, band_margin=0.05, max_gap=2.0):
+        """
+        Args:
+            line_a, line_b: [[x1, y1], [x2, y2]] toạ độ chuẩn hoá
+            distance_m: Khoảng cách thực giữa 2 vạch (mét)
+            band_margin: Lề (chuẩn hoá) của dải detection quanh 2 vạch
+            max_gap: Bỏ state của track không xuất hiện quá max_gap giây (media time)
+        """
+        self.line_a = np.asarray(line_a, dtype=np.float64)
+        self.line_b = np.asarray(line_b, dtype=np.float64)
+        if self.line_a.shape != (2, 2) or self.line_b.shape != (2, 2):
+            raise ValueError("Speed trap lines need 2 [x, y] points each")
+        if distance_m <= 0:
+            raise ValueError(f"distance_m must be > 0, got {distance_m}")
+
+        self.distance_m = float(distance_m)
+        self.band_margin = band_margin
+        self.max_gap = max_gap
+        # track_id -> [prev_x, prev_y, prev_t, t_cross_a, t_cross_b, speed, last_seen]
+        self.tracks = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['line_a'], data['line_b'], data['distance_m'],
+                   band_margin=data.get('band_margin', 0.05))
+
+    def update_many(self, track_ids, bboxes, timestamp, frame_shape):
+        """
+        Cập nhật vị trí (điểm tiếp đất) của các track trong 1 frame
+
+        Args:
+            track_ids: List track_id
+            bboxes: (N, 4) bbox pixel của frame gốc
+            timestamp: Media timestamp của frame (giây)
+            frame_shape: Shape frame gốc (để chuẩn hoá toạ độ)
+
+        Returns:
+            List tốc độ km/h (None nếu track chưa cắt đủ 2 vạch), cùng thứ tự track_ids
+        """
+        if len(track_ids) == 0:
+            return []
+
+        h, w = frame_shape[:2]
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        points = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2.0 / w, bboxes[:, 3] / h], axis=1)
+
+        states = [self.tracks.get(tid) for tid in track_ids]
+        has_prev = np.array([state is not None for state in states])
+        prev = np.array([state[:3] if state is not None else [np.nan] * 3 for state in states])
+
+        dt = timestamp - prev[:, 2]
+        moving = has_prev & (dt > 0)
+        cross_a, u_a = segment_crossings(prev[:, :2], points, *self.line_a)
+        cross_b, u_b = segment_crossings(prev[:, :2], points, *self.line_b)
+        # Nội suy sub-frame thời điểm cắt vạch
+        t_a = prev[:, 2] + u_a * dt
+        t_b = prev[:, 2] + u_b * dt
+
+        speeds = []
+        for i, track_id in enumerate(track_ids):
+            state = states[i]
+            if state is None:
+                state = [0.0, 0.0, 0.0, np.nan, np.nan, np.nan, 0.0]
+                self.tracks[track_id] = state
+
+            if moving[i]:
+                if cross_a[i] and np.isnan(state[3]):
+                    state[3] = t_a[i]
+                if cross_b[i] and np.isnan(state[4]):
+                    state[4] = t_b[i]
+                if np.isnan(state[5]) and not np.isnan(state[3]) and not np.isnan(state[4]):
+                    elapsed = abs(state[4] - state[3])
+                    if elapsed > 0:
+                        state[5] = round(self.distance_m / elapsed * 3.6, 2)
+
+            if not has_prev[i] or moving[i]:
+                state[0], state[1], state[2] = points[i, 0], points[i, 1], timestamp
+            state[6] = timestamp
+            speeds.append(None if np.isnan(state[5]) else float(state[5]))
+
+        return speeds
+
+    def get_speed(self, track_id):
+        """Tốc độ đo được của track (km/h), None nếu chưa cắt đủ 2 vạch"""
+        state = self.tracks.get(track_id)
+        if state is None or np.isnan(state[5]):
+            return None
+        return float(state[5])
+
+    def release(self, track_id):
+        """Bỏ state của track đã bị tracker xoá"""
+        self.tracks.pop(track_id, None)
+
+    def cleanup(self, timestamp):
+        """Bỏ state của track không xuất hiện quá max_gap giây"""
+        for track_id in [tid for tid, state in self.tracks.items()
+                         if timestamp - state[6] > self.max_gap or timestamp < state[6]]:
+            del self.tracks[track_id]
+
+    def reset(self):
+        """Xoá state tất cả track (khi bắt đầu nguồn mới)"""
+        self.tracks.clear()
+
+    def band_roi(self):
+        """ROI dải quanh 2 vạch (bounding box của 4 đầu mút + lề) để giới hạn detection"""
+        points = np.concatenate([self.line_a, self.line_b])
+        x1, y1 = np.clip(points.min(axis=0) - self.band_margin, 0.0, 1.0)
+        x2, y2 = np.clip(points.max(axis=0) + self.band_margin, 0.0, 1.0)
+        return RoiPolygon([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+
+
+def load_speed_trap_config(path):
+    """
+    Đọc file cấu hình speed trap
+
+    Returns:
+        Dict {source_key: SpeedTrap}, rỗng nếu không có file
+    """
+    return load_source_config(path, SpeedTrap.from_dict, 'SPEED TRAP')
+
+
+def get_source_speed_trap(config, source):
+    """SpeedTrap cho 1 nguồn (None = không có vạch)"""
+    return get_source_entry(config, source)
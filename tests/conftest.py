@@ -0,0 +1,6 @@
+# tests/conftest.py
+"""Các module của project nằm ở thư mục gốc (flat layout) → thêm vào sys.path"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
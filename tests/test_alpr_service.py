@@ -0,0 +1,76 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from alpr_service import AlprService, AlprServiceStopped, PRIORITY_BACKGROUND, PRIORITY_VIOLATION
+
+
+class FakePlateDetector:
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.batches = []
+
+    def detect_batch(self, images):
+        if self.gate is not None:
+            self.gate.wait()
+        self.batches.append(len(images))
+        return [[{'plate': f'51A{int(img.mean()):05d}', 'confidence': 0.9}] for img in images]
+
+    def recognize_batch(self, crops, scores):
+        return [[{'plate': 'OCR', 'confidence': score}] for score in scores]
+
+
+def _image(value):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def test_detect_and_ocr_only_jobs():
+    service = AlprService(FakePlateDetector())
+    service.start()
+    try:
+        assert service.detect(_image(12), timeout=2.0) == [{'plate': '51A00012', 'confidence': 0.9}]
+        future = service.submit(_image(0), ocr_only=True, score=0.7)
+        assert future.result(timeout=2.0) == [{'plate': 'OCR', 'confidence': 0.7}]
+    finally:
+        service.stop()
+    assert service.get_stats()['ocr_only'] == 1
+
+
+def test_detect_times_out_instead_of_blocking():
+    gate = threading.Event()
+    service = AlprService(FakePlateDetector(gate), max_wait_ms=0)
+    service.start()
+    try:
+        busy = service.submit(_image(1), priority=PRIORITY_VIOLATION)
+        with pytest.raises(TimeoutError):
+            service.detect(_image(2), priority=PRIORITY_BACKGROUND, timeout=0.2)
+    finally:
+        gate.set()
+        service.stop()
+    assert busy.result(timeout=2.0)[0]['plate'] == '51A00001'
+
+
+def test_stop_fails_pending_jobs():
+    gate = threading.Event()
+    service = AlprService(FakePlateDetector(gate), max_batch=1, max_wait_ms=0)
+    service.start()
+    running = service.submit(_image(1))
+    while service.get_stats()['pending']:  # Service thread đã lấy job đầu, đang chạy
+        time.sleep(0.01)
+    pending = [service.submit(_image(v)) for v in (2, 3)]
+
+    stopper = threading.Thread(target=service.stop)
+    stopper.start()
+    while service._running:
+        time.sleep(0.01)
+    gate.set()
+    stopper.join(timeout=5.0)
+
+    assert running.result(timeout=2.0)
+    for future in pending:
+        with pytest.raises(AlprServiceStopped):
+            future.result(timeout=2.0)
+    with pytest.raises(AlprServiceStopped):
+        service.submit(_image(4))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('filterpy')
+
+from byte_tracker import BYTETracker, Track, _reference_associate
+
+
+def _sequence(rng, n_objects=6, n_frames=40, noise=1.5):
+    """Các xe chuyển động thẳng đều, không chồng lấn → mỗi xe phải giữ 1 track_id"""
+    starts = np.stack([np.arange(n_objects) * 300.0 + 50.0, rng.uniform(50, 600, n_objects)], axis=1)
+    velocity = rng.uniform(-6, 6, (n_objects, 2))
+    size = rng.uniform(60, 140, (n_objects, 2))
+    frames = []
+    for f in range(n_frames):
+        xy = starts + velocity * f
+        boxes = np.concatenate([xy, xy + size], axis=1) + rng.normal(0, noise, (n_objects, 4))
+        frames.append(np.concatenate([boxes, np.full((n_objects, 1), 0.9), np.full((n_objects, 1), 2.0)], axis=1))
+    return frames
+
+
+def test_associate_matches_reference():
+    rng = np.random.default_rng(42)
+    tracker = BYTETracker()
+    for n in (0, 1, 5, 20, 60):
+        xy = rng.uniform(0, 1800, (n, 2))
+        track_boxes = np.concatenate([xy, xy + rng.uniform(40, 160, (n, 2))], axis=1)
+        dets = np.concatenate([
+            track_boxes + rng.normal(0, 6, track_boxes.shape),
+            rng.uniform(0.3, 1.0, (n, 1)),
+            np.full((n, 1), 2.0),
+        ], axis=1)
+        rng.shuffle(dets)
+        tracks = [Track(b, 1.0, 2, i, 0) for i, b in enumerate(track_boxes)]
+        assert tracker.associate(tracks, dets) == _reference_associate(track_boxes, dets, tracker.match_thresh)
+
+
+def test_update_keeps_ids_and_boxes_over_sequence():
+    rng = np.random.default_rng(0)
+    tracker = BYTETracker(track_thresh=0.25, match_thresh=0.4)
+    for dets in _sequence(rng):
+        tracks = tracker.update(dets.copy(), None)
+        # Mỗi detection → đúng 1 track, không trùng lặp
+        assert sorted(t.track_id for t in tracks) == list(range(1, len(dets) + 1))
+        for t in tracks:
+            assert t.det_idx == t.track_id - 1
+            assert np.abs(t.tlbr - dets[t.det_idx, :4]).max() < 10.0
+    assert tracker.track_id == len(dets)
+
+
+def test_lost_track_is_reactivated():
+    rng = np.random.default_rng(1)
+    frames = _sequence(rng, n_objects=3, n_frames=20, noise=0.5)
+    tracker = BYTETracker(track_thresh=0.25, match_thresh=0.3)
+    for f, dets in enumerate(frames):
+        if f in (8, 9):
+            dets = dets[1:]  # Xe 1 mất detection 2 frame
+        tracks = tracker.update(dets.copy(), None)
+        ids = sorted(t.track_id for t in tracks)
+        assert ids == ([2, 3] if f in (8, 9) else [1, 2, 3])
+    assert tracker.track_id == 3
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('fast_alpr')
+
+from fast_alpr import ALPR
+from fast_alpr.base import BaseDetector, BoundingBox, DetectionResult
+from fast_alpr.default_ocr import DefaultOCR
+
+import detector as detector_module
+from detector import PlateDetector, plate_memory
+
+PLATE_SLOTS = 9
+
+
+class FakeDetector(BaseDetector):
+    """Plate detector trả về các bbox cố định (có bbox vượt biên ảnh để kiểm tra clamp)"""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def predict(self, frame):
+        return [DetectionResult('plate', 0.9, BoundingBox(*box)) for box in self.boxes]
+
+
+class FakeRecognizer:
+    """
+    Giống LicensePlateRecognizer của fast-plate-ocr 1.0.x: nhận 1 ảnh hoặc list ảnh xám,
+    text pad '_' tới PLATE_SLOTS, confidence (N, PLATE_SLOTS)
+    """
+
+    config = type('Config', (), {'image_color_mode': 'grayscale'})()
+
+    def run(self, source, return_confidence=False):
+        images = source if isinstance(source, list) else [source]
+        texts, probs = [], []
+        for img in images:
+            assert img.ndim == 2, "OCR model expects grayscale input"
+            text = f"{int(img.mean()):03d}AB{img.shape[1] % 10}"
+            texts.append(text.ljust(PLATE_SLOTS, '_'))
+            probs.append(np.linspace(0.5, 1.0, PLATE_SLOTS) * (0.5 + img.std() / 255))
+        return (texts, np.array(probs)) if return_confidence else texts
+
+
+def _fake_ocr():
+    ocr = DefaultOCR.__new__(DefaultOCR)
+    ocr.ocr_model = FakeRecognizer()
+    return ocr
+
+
+def _sample_image():
+    rng = np.random.default_rng(7)
+    img = np.full((240, 320, 3), 90, dtype=np.uint8)
+    img[40:80, 20:140] = rng.integers(0, 255, (40, 120, 3), dtype=np.uint8)
+    img[150:200, 200:320] = rng.integers(30, 200, (50, 120, 3), dtype=np.uint8)
+    return img
+
+
+@pytest.fixture
+def plate_detector(monkeypatch):
+    alpr = ALPR(detector=FakeDetector([(20, 40, 140, 80), (200, 150, 400, 200)]), ocr=_fake_ocr())
+    monkeypatch.setattr(detector_module, 'get_model', lambda name, factory, device=None, **kw: alpr)
+    plate_memory.clear()
+    return PlateDetector(device='cpu')
+
+
+def test_detect_batch_matches_alpr_predict(plate_detector):
+    img = _sample_image()
+    expected = plate_detector._parse_results(plate_detector.alpr.predict(img))
+    plate_memory.clear()
+    actual = plate_detector.detect_batch([img])[0]
+
+    assert plate_detector._batch_ocr
+    assert len(actual) == 2
+    assert actual == expected
+    assert all('_' not in plate['plate'] for plate in actual)
+
+
+def test_per_crop_fallback_keeps_quality_gate(plate_detector):
+    img = _sample_image()
+    img[150:200, 200:320] = 90  # Biển số thứ 2 phẳng → quality gate loại
+    batch = plate_detector.detect_batch([img])[0]
+    plate_memory.clear()
+
+    plate_detector._batch_ocr = False
+    fallback = plate_detector.detect_batch([img])[0]
+
+    assert len(batch) == 1
+    assert fallback == batch
+
+
+def test_recognize_batch_strips_padding(plate_detector):
+    crop = _sample_image()[40:80, 20:140]
+    [plates] = plate_detector.recognize_batch([crop], [0.8])
+    expected = plate_detector.alpr.ocr.predict(crop)
+    assert [p['plate'] for p in plates] == [expected.text]
+    assert plates[0]['bbox'] == (0, 0, 120, 40)
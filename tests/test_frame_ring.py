@@ -0,0 +1,91 @@
+# tests/test_frame_ring.py
+import pytest
+
+from frame_ring import FrameRing
+
+
+def fill(ring, n):
+    return [ring.append({'frame_id': i}) for i in range(n)]
+
+
+def test_append_returns_monotonic_seq():
+    ring = FrameRing(capacity=3)
+    assert fill(ring, 5) == [0, 1, 2, 3, 4]
+    assert ring.head_seq == 4
+    assert ring.oldest_seq == 2
+
+
+def test_wrap_overwrites_oldest():
+    ring = FrameRing(capacity=3)
+    fill(ring, 5)
+    assert ring.get(0) is None
+    assert ring.get(1) is None
+    assert [f['frame_id'] for f in ring.get_range(0, 10)] == [2, 3, 4]
+    assert ring.latest()['frame_id'] == 4
+
+
+def test_len_counts_frames_and_resets_on_clear():
+    ring = FrameRing(capacity=3)
+    assert len(ring) == 0
+    fill(ring, 2)
+    assert len(ring) == 2
+    fill(ring, 5)
+    assert len(ring) == 3
+    ring.clear()
+    assert len(ring) == 0
+    assert ring.latest() is None
+    ring.append({'frame_id': 'x'})
+    assert len(ring) == 1
+
+
+def test_open_track_starts_at_given_seq():
+    ring = FrameRing(capacity=10)
+    seqs = fill(ring, 6)
+    # Detection chạy trễ: track xuất hiện ở frame seq=2 trong khi head đã ở 5
+    ring.open_track('t1', seqs[2])
+    assert ring.track_range('t1') == (2, 5)
+    ring.open_track('t2')
+    assert ring.track_range('t2') == (5, 5)
+
+
+def test_track_range_follows_head_until_closed():
+    ring = FrameRing(capacity=10)
+    fill(ring, 3)
+    ring.open_track('t', 1)
+    ring.append({'frame_id': 3})
+    assert ring.track_range('t') == (1, 3)
+    ring.open_track('t', 3)
+    ring.close_track('t')
+    ring.append({'frame_id': 4})
+    assert ring.track_range('t') == (1, 3)
+    assert [f['frame_id'] for f in ring.track_frames('t')] == [1, 2, 3]
+    # Xuất hiện lại → mở lại range, giữ first_seq
+    ring.open_track('t', 4)
+    assert ring.track_range('t') == (1, 4)
+
+
+def test_close_track_ends_at_last_seen_seq():
+    ring = FrameRing(capacity=10)
+    seqs = fill(ring, 8)
+    ring.open_track('t', seqs[1])
+    ring.open_track('t', seqs[3])
+    # Detection xử lý frame 4 (track lost) trong khi reader đã đọc tới frame 7
+    ring.close_track('t')
+    assert ring.track_range('t') == (1, 3)
+    assert [f['frame_id'] for f in ring.track_frames('t')] == [1, 2, 3]
+
+
+def test_track_frames_skip_overwritten():
+    ring = FrameRing(capacity=3)
+    fill(ring, 2)
+    ring.open_track('t', 0)
+    fill(ring, 3)
+    assert [f['seq'] for f in ring.track_frames('t')] == [2, 3, 4]
+    ring.remove_track('t')
+    assert ring.track_range('t') is None
+    assert ring.track_frames('t') == []
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        FrameRing(capacity=0)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from motion_gate import MotionGate
+
+
+def test_static_frames_skipped_until_forced():
+    gate = MotionGate(force_every=3)
+    frame = np.full((120, 320, 3), 80, dtype=np.uint8)
+    assert [gate.should_detect(frame) for _ in range(7)] == [True, False, False, True, False, False, True]
+    stats = gate.get_stats()
+    assert stats['frames_checked'] == 7
+    assert stats['frames_skipped'] == 4
+    assert stats['frames_forced'] == 2
+
+
+def test_reset_clears_reference_and_counters():
+    gate = MotionGate(force_every=0)
+    frame = np.zeros((120, 320, 3), dtype=np.uint8)
+    gate.should_detect(frame)
+    assert not gate.should_detect(frame)
+
+    gate.reset()
+    assert gate.get_stats() == {'frames_checked': 0, 'frames_skipped': 0, 'frames_motion': 0,
+                                'frames_forced': 0, 'skip_ratio': 0.0}
+    assert gate.should_detect(frame)
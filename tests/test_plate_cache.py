@@ -0,0 +1,64 @@
+import numpy as np
+
+from plate_cache import PLATE_CONFIRMED, PLATE_EXHAUSTED, PLATE_WAITING, PlateCache
+
+BBOX = (20, 20, 220, 140)
+
+
+def _frame():
+    """Crop xe đủ lớn, đủ nét, đủ sáng để qua quality gate"""
+    rng = np.random.default_rng(3)
+    return rng.integers(40, 215, (200, 260, 3), dtype=np.uint8)
+
+
+def test_should_read_spacing_and_pending():
+    cache = PlateCache(retry_frames=5)
+    frame = _frame()
+    assert cache.should_read(1, frame, BBOX, frame_id=10)
+    assert not cache.should_read(1, frame, BBOX, frame_id=20)  # Job đang chạy
+
+    cache.add_reading(1, None, 0.0)  # Không đọc được
+    assert not cache.should_read(1, frame, BBOX, frame_id=12)  # Chưa đủ retry_frames
+    assert cache.should_read(1, frame, BBOX, frame_id=15)
+    assert cache.get_stats()['reads_scheduled'] == 2
+
+
+def test_should_read_rejects_low_quality_crop():
+    cache = PlateCache()
+    flat = np.full((200, 260, 3), 120, dtype=np.uint8)
+    assert not cache.should_read(1, flat, BBOX, frame_id=1)
+    assert not cache.should_read(2, _frame(), (0, 0, 30, 20), frame_id=1)  # Quá nhỏ
+    assert cache.get_stats()['reads_skipped_quality'] == 2
+
+
+def test_confirmed_track_stops_reading():
+    cache = PlateCache(min_votes=2, retry_frames=1)
+    frame = _frame()
+    for frame_id in (1, 2):
+        assert cache.should_read(1, frame, BBOX, frame_id)
+        cache.add_reading(1, '51a12345', 0.9)
+    assert cache.status(1) == PLATE_CONFIRMED
+    assert cache.get(1)['plate'] == '51A12345' and cache.get(1)['confirmed']
+    assert not cache.should_read(1, frame, BBOX, frame_id=3)
+
+
+def test_cancel_refunds_attempt():
+    cache = PlateCache(max_attempts=1, retry_frames=0)
+    frame = _frame()
+    assert cache.should_read(1, frame, BBOX, frame_id=1)
+    cache.cancel(1)  # Queue đầy → job bị bỏ
+    assert cache.should_read(1, frame, BBOX, frame_id=1)
+    assert cache.add_reading(1, None, 0.0) == PLATE_EXHAUSTED
+    assert not cache.should_read(1, frame, BBOX, frame_id=2)
+
+
+def test_release_forgets_track():
+    cache = PlateCache(min_votes=1, min_confidence=0.5)
+    cache.add_reading(1, '51A12345', 0.9)
+    assert cache.status(1) == PLATE_CONFIRMED
+
+    cache.release(1)
+    assert cache.get(1) is None
+    assert cache.status(1) == PLATE_WAITING
+    # ID dùng lại bởi xe khác → đọc lại từ đầu
+    assert cache.should_read(1, _frame(), BBOX, frame_id=1)
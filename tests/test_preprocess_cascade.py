@@ -0,0 +1,38 @@
+import pytest
+
+from preprocess_cascade import CHEAP_METHODS, SLOW_METHODS, PreprocessCascade
+
+
+def test_plan_uses_priors_within_budget():
+    cascade = PreprocessCascade()
+    # Chưa có số đo: cùng success rate → xếp theo prior (contrast rẻ nhất)
+    assert cascade.plan(CHEAP_METHODS, 0.1) == ['contrast', 'clahe', 'sharpen', 'bright']
+    assert cascade.plan(CHEAP_METHODS, 0.04) == ['contrast', 'clahe']
+    assert cascade.plan(CHEAP_METHODS + SLOW_METHODS, 0.3) == ['contrast', 'clahe', 'sharpen', 'bright']
+    assert cascade.plan(CHEAP_METHODS + SLOW_METHODS, 0.35) == ['contrast', 'clahe', 'sharpen', 'bright', 'denoise']
+
+
+def test_plan_always_returns_one_method():
+    cascade = PreprocessCascade()
+    assert cascade.plan(SLOW_METHODS, 0.0) == ['denoise']
+    assert cascade.plan([], 1.0) == []
+
+
+def test_plan_prefers_measured_success_per_second():
+    cascade = PreprocessCascade()
+    for _ in range(10):
+        cascade.record('contrast', False, 0.015)
+        cascade.record('bright', True, 0.02)
+    assert cascade.order(CHEAP_METHODS)[0] == 'bright'
+    assert cascade.plan(CHEAP_METHODS, 0.02) == ['bright']
+
+    stats = cascade.get_stats()
+    assert stats['bright']['attempts'] == 10 and stats['bright']['successes'] == 10
+    assert stats['contrast']['avg_ms'] == pytest.approx(15.0)
+
+
+def test_record_unknown_method_uses_first_measurement_as_prior():
+    cascade = PreprocessCascade(methods=('clahe',))
+    cascade.record('gamma', True, 0.01)
+    assert cascade.estimated_cost('gamma') == pytest.approx(0.01)
+    assert 'gamma' in cascade.plan(('clahe', 'gamma'), 1.0)
@@ -0,0 +1,20 @@
+from source_config import get_source_entry, load_source_config
+
+
+def test_load_skips_invalid_entries(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text('{"default": 1.5, "camera": "x", "highway.mp4": 2}', encoding='utf-8')
+    config = load_source_config(str(path), float, 'TEST')
+    assert config == {'default': 1.5, 'highway.mp4': 2.0}
+    assert get_source_entry(config, '/uploads/highway.mp4') == 2.0
+    assert get_source_entry(config, 'camera') == 1.5
+
+
+def test_load_returns_empty_on_unreadable_file(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text('{"default": ', encoding='utf-8')
+    assert load_source_config(str(path), float, 'TEST') == {}
+    path.write_text('[1, 2]', encoding='utf-8')
+    assert load_source_config(str(path), float, 'TEST') == {}
+    assert load_source_config(str(tmp_path), float, 'TEST') == {}  # Thư mục → OSError
+    assert load_source_config(str(tmp_path / 'missing.json'), float, 'TEST') == {}
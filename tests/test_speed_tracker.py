@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from speed_tracker import SpeedTracker
+
+
+def _bbox(x, y=0.0):
+    return (x, y, x + 10.0, y + 10.0)
+
+
+def test_update_many_matches_update():
+    batch = SpeedTracker(pixel_to_meter=0.1, capacity=2)
+    single = SpeedTracker(pixel_to_meter=0.1, capacity=2)
+    rng = np.random.default_rng(5)
+    for f in range(12):
+        t = f / 10.0
+        ids = [1, 2, 3, 4] if f < 6 else [2, 4, 5]
+        boxes = [_bbox(*rng.uniform(0, 500, 2)) for _ in ids]
+        expected = [single.update(tid, box, t) for tid, box in zip(ids, boxes)]
+        assert batch.update_many(ids, boxes, t) == expected
+    assert batch.capacity >= 5  # Tự nhân đôi khi hết slot
+
+
+def test_speed_ema_and_history():
+    tracker = SpeedTracker(pixel_to_meter=0.1, max_history=4)
+    assert tracker.update(1, _bbox(0.0), 0.0) is None
+    assert tracker.update(1, _bbox(50.0), 0.5) == pytest.approx(36.0)  # 5 m / 0.5 s
+    assert tracker.update(1, _bbox(150.0), 1.0) == pytest.approx(0.75 * 72.0 + 0.25 * 36.0)
+    # Timestamp không tăng → giữ tốc độ cũ
+    assert tracker.update(1, _bbox(300.0), 1.0) == pytest.approx(63.0)
+
+    for f in range(3, 6):
+        tracker.update(1, _bbox(150.0 + f), f / 2.0)
+    times, positions = tracker.history(1)  # Ring giữ 4 điểm cuối theo thứ tự thời gian
+    assert times.tolist() == [1.0, 1.5, 2.0, 2.5]
+    assert positions[:, 0].tolist() == [305.0, 158.0, 159.0, 160.0]
+
+
+def test_release_reuses_slot_with_fresh_state():
+    tracker = SpeedTracker(pixel_to_meter=0.1, capacity=1)
+    tracker.update(1, _bbox(0.0), 0.0)
+    tracker.update(1, _bbox(50.0), 0.5)
+    slot = tracker.slots[1]
+
+    tracker.release(1)
+    assert tracker.get_speed(1) is None and len(tracker) == 0
+    assert tracker.update(2, _bbox(400.0), 1.0) is None  # Slot cũ, không mang tốc độ/vị trí track 1
+    assert tracker.slots[2] == slot
+
+    tracker.cleanup_old_tracks({3})
+    assert tracker.history(2) is None
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from speed_trap import SpeedTrap, segment_crossings
+
+
+def test_segment_crossings():
+    p = np.array([[0.5, 0.0], [0.5, 0.0], [0.0, 0.2], [0.2, 0.0]])
+    q = np.array([[0.5, 1.0], [0.5, 0.4], [1.0, 0.2], [0.2, 1.0]])
+    crossed, u = segment_crossings(p, q, np.array([0.0, 0.5]), np.array([1.0, 0.5]))
+    assert crossed.tolist() == [True, False, False, True]
+    assert u[0] == pytest.approx(0.5) and u[3] == pytest.approx(0.5)
+
+
+def test_segment_crossings_endpoint_and_nan():
+    p = np.array([[0.5, 0.0], [np.nan, np.nan]])
+    q = np.array([[0.5, 0.5], [0.5, 1.0]])
+    crossed, u = segment_crossings(p, q, np.array([0.0, 0.5]), np.array([1.0, 0.5]))
+    assert crossed.tolist() == [True, False]
+    assert u[0] == pytest.approx(1.0)
+
+
+def test_speed_from_two_lines_with_subframe_interpolation():
+    trap = SpeedTrap([[0.0, 0.4], [1.0, 0.4]], [[0.0, 0.6], [1.0, 0.6]], distance_m=10.0)
+    shape = (1000, 1000)
+    speeds = []
+    for f in range(12):
+        t = f * 0.1
+        bottom = 300 + 30 * f  # 0.3 → 0.63, cắt A ở t=1/3 s, cắt B ở t=1.0 s
+        speeds.append(trap.update_many([5], [[480, bottom - 100, 520, bottom]], t, shape)[0])
+    assert speeds[9] is None
+    assert speeds[10] == pytest.approx(10.0 / (2.0 / 3.0) * 3.6, rel=1e-3)
+    assert trap.get_speed(5) == speeds[-1]
@@ -0,0 +1,24 @@
+from track_events import TRACK_LOST, TRACK_REMOVED, TRACK_STARTED, TrackLifecycle
+
+
+def test_lost_then_removed_events():
+    lifecycle = TrackLifecycle()
+    received = []
+    lifecycle.subscribe(lambda event, track_id: received.append((event, track_id)))
+
+    assert lifecycle.observe([1, 2], alive_ids={1, 2}) == [(TRACK_STARTED, 1), (TRACK_STARTED, 2)]
+    assert lifecycle.observe([1], alive_ids={1, 2}) == [(TRACK_LOST, 2)]
+    assert lifecycle.observe([1], alive_ids={1}) == [(TRACK_REMOVED, 2)]
+    assert received[-1] == (TRACK_REMOVED, 2)
+
+
+def test_reset_drops_state_without_removed_events():
+    lifecycle = TrackLifecycle()
+    received = []
+    lifecycle.subscribe(lambda event, track_id: received.append((event, track_id)))
+    lifecycle.observe([1, 2])
+
+    lifecycle.reset()
+    assert received == [(TRACK_STARTED, 1), (TRACK_STARTED, 2)]
+    # Nguồn mới dùng lại ID 1 → track mới, không có event removed cho ID cũ
+    assert lifecycle.observe([1], alive_ids={1}) == [(TRACK_STARTED, 1)]
@@ -0,0 +1,75 @@
+from track_table import TrackTable
+
+
+def _detection(track_id, plate=None, speed=None):
+    return {'track_id': track_id, 'vehicle_bbox': (0, 0, 10, 10), 'vehicle_class': 'car',
+            'plate': plate, 'speed': speed}
+
+
+def test_clear_starts_fresh_records_for_reused_ids():
+    table = TrackTable()
+    table.observe(_detection(1, plate='51A12345', speed=72.0), frame_id=1, now=10.0)
+    table.start_violation(1, frame_id=1, violation_timestamp=10.0, now=10.0, speed_confidence=0.9)
+    table.publish(1)
+
+    table.clear()
+    assert len(table) == 0
+    assert table.lookup(1) is None
+
+    record = table.observe(_detection(1), frame_id=1, now=0.5)
+    assert record.plate is None
+    assert record.speed is None
+    assert not record.has_violation
+    assert record.first_seen == 0.5
+
+
+def test_observe_reuses_record_until_removed():
+    table = TrackTable()
+    first = table.observe(_detection(1, plate='51A12345', speed=60.0), frame_id=1, now=1.0)
+    again = table.observe(_detection(1, speed=62.0), frame_id=2, now=1.1)
+    assert again is first
+    assert again.plate == '51A12345' and again.speed == 62.0 and again.first_seen == 1.0
+
+    # Không vi phạm → remove() xoá record, ID dùng lại = record mới
+    table.remove(1)
+    assert table.get(1) is None
+    assert table.observe(_detection(1), frame_id=3, now=2.0) is not first
+
+
+def test_removed_track_with_violation_is_kept_then_recreated():
+    table = TrackTable()
+    table.observe(_detection(1, plate='51A12345'), frame_id=1, now=1.0)
+    record = table.start_violation(1, frame_id=1, violation_timestamp=1.0, now=1.0)
+    table.add_violation_frames(1, ['f1', 'f2'], now=1.1)
+
+    table.remove(1)
+    assert table.get(1) is record and record.removed
+    table.publish(2)
+    assert table.lookup(1).frames == ('f1', 'f2')
+    assert table.visible() == []
+
+    # Tracker dùng lại ID → record mới, clip vi phạm của xe cũ không bị ghi đè
+    fresh = table.observe(_detection(1), frame_id=3, now=2.0)
+    assert fresh is not record and not fresh.has_violation and fresh.plate is None
+
+
+def test_expire_drops_stale_clips_and_tracks():
+    table = TrackTable()
+    table.observe(_detection(1), frame_id=1, now=0.0)
+    table.start_violation(1, frame_id=1, violation_timestamp=0.0, now=0.0)
+    table.observe(_detection(2), frame_id=1, now=0.0)
+    table.observe(_detection(3), frame_id=1, now=0.0)
+    table.start_violation(3, frame_id=1, violation_timestamp=0.0, now=0.0)
+    table.remove(3)
+
+    # Track 1 vẫn được thấy nhưng clip quá violation_timeout → bỏ clip, giữ record
+    table.observe(_detection(1), frame_id=2, now=6.0)
+    table.observe(_detection(2), frame_id=2, now=6.0)
+    assert table.expire(now=6.0, track_timeout=10.0, violation_timeout=5.0) == [3]
+    assert not table.get(1).has_violation
+    assert table.get(2) is not None
+
+    # Track 2 không xuất hiện quá track_timeout → xoá
+    table.observe(_detection(1), frame_id=3, now=15.0)
+    assert table.expire(now=16.5, track_timeout=10.0, violation_timeout=5.0) == [2]
+    assert len(table) == 1
@@ -0,0 +1,70 @@
+import pytest
+
+from ttl_store import TTLStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_expiry_and_reset_ttl():
+    clock = FakeClock()
+    store = TTLStore(ttl=10, clock=clock)
+    store.set('a', 1)
+    store.set('b', 2, ttl=30)
+
+    clock.now += 5
+    store.set('a', 11)  # Set lại → hạn dùng tính lại từ bây giờ
+    clock.now += 6
+    assert store.get('a') == 11
+    assert store.get('b') == 2
+
+    clock.now += 10
+    assert 'a' not in store
+    assert store.get('b') == 2
+    clock.now += 10
+    assert len(store) == 0
+    assert store.get_stats()['expired'] == 2
+
+
+def test_lru_eviction_keeps_recently_used():
+    store = TTLStore(ttl=60, capacity=2, clock=FakeClock())
+    store.set('a', 1)
+    store.set('b', 2)
+    assert store.get('a') == 1  # 'b' thành key ít dùng nhất
+    store.set('c', 3)
+    assert 'b' not in store
+    assert store.get('a') == 1 and store.get('c') == 3
+    assert store.get_stats()['evicted'] == 1
+
+
+def test_stats_pop_and_clear():
+    clock = FakeClock()
+    store = TTLStore(ttl=5, capacity=8, clock=clock)
+    store.set('a', 1)
+    assert store.get('a') == 1
+    assert store.get('missing', 'x') == 'x'
+    assert store.pop('a') == 1
+    assert store.pop('a', 'gone') == 'gone'
+
+    # Key bị pop không được tính là hết hạn khi entry cũ tới đỉnh heap
+    clock.now += 10
+    stats = store.get_stats()
+    assert (stats['hits'], stats['misses'], stats['expired'], stats['size']) == (1, 1, 0, 0)
+
+    for i in range(200):
+        store.set(i % 4, i)
+    assert store.get_stats()['heap_size'] <= 2 * len(store) + 64
+    store.clear()
+    assert len(store) == 0 and store.get_stats()['heap_size'] == 0 and store._seq == 0
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        TTLStore(ttl=0)
+    with pytest.raises(ValueError):
+        TTLStore(ttl=1, capacity=0)
@@ -0,0 +1,49 @@
+from collections import deque
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_ring import FrameRing
+from video_reader import OfflineVideoReader
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    if not writer.isOpened():
+        pytest.skip('MJPG writer not available')
+    for i in range(5):
+        writer.write(np.full((48, 64, 3), i * 40, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+class StopAfter(deque):
+    """detection_queue dừng reader sau N frame"""
+
+    def __init__(self, reader_box, count):
+        super().__init__(maxlen=100)
+        self.reader_box = reader_box
+        self.count = count
+
+    def append(self, item):
+        super().append(item)
+        if len(self) >= self.count:
+            self.reader_box[0].running = False
+
+
+def test_loop_keeps_timestamps_monotonic(video_path):
+    reader_box = []
+    detection_queue = StopAfter(reader_box, 12)  # 2 vòng + 2 frame
+    reader = OfflineVideoReader(video_path, detection_queue, FrameRing(capacity=50))
+    reader_box.append(reader)
+    reader.open_video()
+    reader.running = True
+    reader.video_reader_thread()
+    reader.cap.release()
+
+    timestamps = [item['timestamp'] for item in detection_queue]
+    assert len(timestamps) == 12
+    np.testing.assert_allclose(np.diff(timestamps), 0.1)
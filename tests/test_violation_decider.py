@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from violation_decider import ViolationDecider, theil_sen_velocity
+
+
+def test_theil_sen_exact_line():
+    times = np.arange(10, dtype=np.float64) * 0.1
+    positions = np.stack([3.0 + 12.0 * times, 1.0 - 5.0 * times], axis=1)
+    velocity, residuals = theil_sen_velocity(times, positions)
+    np.testing.assert_allclose(velocity, [12.0, -5.0])
+    np.testing.assert_allclose(residuals, 0.0, atol=1e-9)
+
+
+def test_theil_sen_ignores_outliers():
+    times = np.arange(12, dtype=np.float64) * 0.1
+    positions = np.stack([10.0 * times, np.zeros_like(times)], axis=1)
+    positions[[3, 8]] += [[4.0, 3.0], [-5.0, 2.0]]  # Bbox nhảy
+    velocity, residuals = theil_sen_velocity(times, positions)
+    np.testing.assert_allclose(velocity, [10.0, 0.0], atol=0.5)
+    assert np.count_nonzero(residuals > 1.0) == 2
+
+
+def test_theil_sen_degenerate_times():
+    velocity, residuals = theil_sen_velocity(np.ones(4), np.random.default_rng(0).normal(size=(4, 2)))
+    assert velocity.tolist() == [0.0, 0.0]
+    assert residuals.shape == (4,)
+
+
+def test_decides_once_by_distance():
+    decider = ViolationDecider(min_distance_m=8.0, min_points=5)
+    decisions = []
+    for f in range(30):
+        t = f / 10.0
+        decisions += decider.update([7], [[15.0 * t, 0.0]], t, speed_limit=40, payloads=['frame'])
+    assert len(decisions) == 1
+    decision = decisions[0]
+    assert decision['reason'] == 'distance'
+    assert decision['speed'] == pytest.approx(54.0)
+    assert decision['violation'] and decision['payload'] == 'frame'
+
+
+def test_track_end_decision_and_state_cleanup():
+    decider = ViolationDecider(min_distance_m=100.0, min_points=5)
+    for f in range(6):
+        decider.update([1], [[5.0 * f / 10.0, 0.0]], f / 10.0, speed_limit=40)
+    decision = decider.finish(1, speed_limit=40)
+    assert decision['reason'] == 'track_end'
+    assert decision['speed'] == pytest.approx(18.0) and not decision['violation']
+    assert 1 not in decider.trajectories and decider.finish(1, speed_limit=40) is None
+
+
+def test_occluded_track_is_not_decided_twice():
+    decider = ViolationDecider(min_distance_m=100.0, min_points=5, end_gap=1.0)
+    decisions = []
+    for f in range(6):
+        decisions += decider.update([1], [[20.0 * f / 10.0, 0.0]], f / 10.0, speed_limit=40)
+    # Bị che khuất > end_gap → quyết định track_end
+    decisions += decider.update([2], [[0.0, 5.0]], 2.0, speed_limit=40)
+    assert [d['track_id'] for d in decisions] == [1] and decisions[0]['reason'] == 'track_end'
+    assert 1 not in decider.trajectories
+
+    # Xuất hiện lại với cùng track_id → không quyết định lần 2
+    for f in range(21, 40):
+        t = f / 10.0
+        assert not [d for d in decider.update([1], [[20.0 * t, 0.0]], t, speed_limit=40) if d['track_id'] == 1]
+    assert decider.finish(1, speed_limit=40) is None
+    assert 1 not in decider.decided
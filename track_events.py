@@ -0,0 +1,111 @@
+# track_events.py
+"""
+Track Lifecycle Events - Giải phóng state theo track NGAY khi track kết thúc
+=============================================================================
+
+Trước đây state của track nằm rải rác (violation_frame_buffer, FrameRing,
+recording_tracks, active_tracks, SpeedTracker...) và chỉ được dọn bởi
+cleanup_old_buffers() polling mỗi 2s với TRACK_TIMEOUT = 10s.
+
+Tracker phát 3 event, mỗi store tự subscribe:
+- track_started : track mới xuất hiện lần đầu
+- track_lost    : track không được match ở frame này (có thể quay lại)
+- track_removed : tracker đã xoá track (không bao giờ quay lại) → giải phóng
+"""
+import threading
+
+TRACK_STARTED = 'track_started'
+TRACK_LOST = 'track_lost'
+TRACK_REMOVED = 'track_removed'
+
+
+class TrackLifecycle:
+    """
+    Suy ra event từ tập track đang tracked / còn sống sau mỗi lần tracker update
+    """
+
+    def __init__(self, max_lost_frames=30):
+        """
+        Args:
+            max_lost_frames: Khi tracker không cho biết track nào còn sống
+                             (YOLO built-in), track lost quá N frame = removed
+        """
+        self.max_lost_frames = max_lost_frames
+        self._states = {}       # track_id -> TRACK_STARTED (tracked) / TRACK_LOST
+        self._lost_frames = {}  # track_id -> số frame liên tiếp bị lost
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+        Đăng ký callback(event, track_id) - gọi đồng bộ trên thread chạy tracker
+
+        Callback nên nhẹ (chỉ xoá/đóng state), lỗi trong callback không làm
+        ảnh hưởng subscriber khác.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def observe(self, tracked_ids, alive_ids=None):
+        """
+        Cập nhật sau 1 frame tracking và phát event
+
+        Args:
+            tracked_ids: Track được match ở frame này
+            alive_ids: Track còn tồn tại trong tracker (tracked + lost),
+                       None → suy ra bằng max_lost_frames
+
+        Returns:
+            List (event, track_id) đã phát
+        """
+        tracked_ids = set(tracked_ids)
+        events = []
+
+        for track_id in tracked_ids:
+            if track_id not in self._states:
+                events.append((TRACK_STARTED, track_id))
+            self._states[track_id] = TRACK_STARTED
+            self._lost_frames.pop(track_id, None)
+
+        for track_id in [tid for tid in self._states if tid not in tracked_ids]:
+            lost_frames = self._lost_frames.get(track_id, 0) + 1
+            if alive_ids is not None:
+                removed = track_id not in alive_ids
+            else:
+                removed = lost_frames > self.max_lost_frames
+
+            if removed:
+                del self._states[track_id]
+                self._lost_frames.pop(track_id, None)
+                events.append((TRACK_REMOVED, track_id))
+                continue
+
+            self._lost_frames[track_id] = lost_frames
+            if self._states[track_id] != TRACK_LOST:
+                self._states[track_id] = TRACK_LOST
+                events.append((TRACK_LOST, track_id))
+
+        self._dispatch(events)
+        return events
+
+    def reset(self):
+        """
+        Đổi nguồn: bỏ state, KHÔNG phát track_removed
+
+        Track ID của nguồn mới bắt đầu lại từ 1 → event removed cho ID cũ sẽ
+        giải phóng nhầm track mới cùng ID. Các store tự clear khi đổi nguồn.
+        """
+        self._states.clear()
+        self._lost_frames.clear()
+
+    def _dispatch(self, events):
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event, track_id in events:
+            for callback in subscribers:
+                try:
+                    callback(event, track_id)
+                except Exception as e:
+                    print(f"[TRACK EVENTS] ⚠️  Subscriber error on {event} track {track_id}: {e}")
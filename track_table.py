@@ -0,0 +1,197 @@
+# track_table.py
+"""
+Track Table - 1 bảng state cho mọi track (thay các dict rời trong app.py)
+=========================================================================
+
+Trước đây state của 1 track nằm ở nhiều dict/set module-level của app.py
+(active_tracks, current_detections, violation_frame_buffer, recording_tracks,
+sent_violation_tracks...), mỗi cái tự lookup, tự cleanup và bị nhiều thread
+sửa/đọc không lock → phải copy phòng thủ, dễ lỗi "dict changed size during iteration".
+
+NGUYÊN TẮC:
+✅ 1 record / track (__slots__): bbox, tốc độ, biển số, vi phạm, frame vi phạm, timestamps
+✅ CHỈ detection stage ghi (single writer) → không cần lock khi ghi
+✅ Stage khác (ALPR, best frame, violation saver, SSE) đọc snapshot bất biến
+✅ publish() thay reference snapshot 1 lần (atomic) → reader luôn thấy trạng thái nhất quán
+"""
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+# Bản chụp bất biến của 1 track (frames là tuple FrameHandle, KHÔNG copy ndarray)
+TrackSnapshot = namedtuple('TrackSnapshot', [
+    'track_id', 'bbox', 'vehicle_class', 'plate', 'speed', 'speed_confidence',
+    'frame_id', 'first_seen', 'last_seen', 'frames', 'violation_frame',
+    'violation_timestamp', 'recording_start', 'removed',
+])
+
+_EMPTY = MappingProxyType({})
+
+
+class TrackRecord:
+    """State của 1 track - chỉ detection stage sửa"""
+
+    __slots__ = (
+        'track_id', 'bbox', 'vehicle_class', 'plate', 'speed', 'speed_confidence',
+        'frame_id', 'first_seen', 'last_seen', 'frames', 'last_update',
+        'violation_frame', 'violation_timestamp', 'recording_start', 'removed',
+    )
+
+    def __init__(self, track_id, now):
+        self.track_id = track_id
+        self.bbox = None
+        self.vehicle_class = None
+        self.plate = None
+        self.speed = None
+        self.speed_confidence = None
+        self.frame_id = None
+        self.first_seen = now
+        self.last_seen = now
+        self.frames = None            # deque FrameHandle của clip vi phạm (None = chưa vi phạm)
+        self.last_update = now        # Lần cuối frames được thêm
+        self.violation_frame = None
+        self.violation_timestamp = None
+        self.recording_start = None
+        self.removed = False          # Tracker đã xoá track, record giữ lại cho vi phạm đang chờ lưu
+
+    @property
+    def has_violation(self):
+        return self.frames is not None
+
+    def snapshot(self):
+        return TrackSnapshot(
+            self.track_id, self.bbox, self.vehicle_class, self.plate, self.speed,
+            self.speed_confidence, self.frame_id, self.first_seen, self.last_seen,
+            tuple(self.frames) if self.frames is not None else (),
+            self.violation_frame, self.violation_timestamp, self.recording_start,
+            self.removed,
+        )
+
+
+class TrackTable:
+    """
+    Bảng track: detection stage ghi, các stage khác đọc snapshot()
+    """
+
+    def __init__(self, max_violation_frames=150):
+        """
+        Args:
+            max_violation_frames: Số FrameHandle tối đa cho clip vi phạm của 1 track
+        """
+        self.max_violation_frames = max_violation_frames
+        self.records = {}            # track_id -> TrackRecord (chỉ writer truy cập)
+        self._published = (None, _EMPTY)  # (frame_id, track_id -> TrackSnapshot) cho reader
+
+    # ------------------------------------------------------------------
+    # WRITER (detection stage)
+    # ------------------------------------------------------------------
+    def get(self, track_id):
+        return self.records.get(track_id)
+
+    def observe(self, detection, frame_id, now):
+        """
+        Ghi detection của track trong frame hiện tại
+
+        Returns:
+            TrackRecord của track (tạo mới nếu chưa có)
+        """
+        track_id = detection['track_id']
+        record = self.records.get(track_id)
+        if record is None or record.removed:
+            record = TrackRecord(track_id, now)
+            self.records[track_id] = record
+
+        record.bbox = detection['vehicle_bbox']
+        record.vehicle_class = detection['vehicle_class']
+        if detection.get('plate'):
+            record.plate = detection['plate']
+        record.speed = detection.get('speed')
+        record.frame_id = frame_id
+        record.last_seen = now
+        return record
+
+    def start_violation(self, track_id, frame_id, violation_timestamp, now, speed_confidence=None):
+        """Đánh dấu vi phạm + bắt đầu ghi clip (frames) cho track"""
+        record = self.records.get(track_id)
+        if record is None:
+            record = TrackRecord(track_id, now)
+            self.records[track_id] = record
+        if record.frames is None:
+            record.frames = deque(maxlen=self.max_violation_frames)
+            record.recording_start = now
+        record.violation_frame = frame_id
+        record.violation_timestamp = violation_timestamp
+        record.speed_confidence = speed_confidence
+        record.last_update = now
+        return record
+
+    def add_violation_frames(self, track_id, frames, now):
+        """Thêm FrameHandle vào clip vi phạm của track (KHÔNG copy ndarray)"""
+        record = self.records.get(track_id)
+        if record is None or record.frames is None:
+            return
+        record.frames.extend(frames)
+        record.last_update = now
+
+    def remove(self, track_id):
+        """
+        Tracker đã xoá track: xoá record, trừ khi có vi phạm đang chờ lưu
+        (best frame / violation saver còn đọc clip → expire() xoá theo timeout)
+        """
+        record = self.records.get(track_id)
+        if record is None:
+            return
+        if record.has_violation:
+            record.removed = True
+        else:
+            del self.records[track_id]
+
+    def expire(self, now, track_timeout, violation_timeout):
+        """
+        Dọn record quá hạn (fallback khi không có event track_removed)
+
+        Args:
+            track_timeout: Track không xuất hiện quá N giây → xoá
+            violation_timeout: Clip vi phạm không được cập nhật quá N giây → bỏ clip
+
+        Returns:
+            List track_id đã bị xoá khỏi bảng
+        """
+        expired = []
+        for track_id, record in list(self.records.items()):
+            if record.has_violation and now - record.last_update > violation_timeout:
+                record.frames = None
+                record.violation_frame = None
+                record.violation_timestamp = None
+                record.recording_start = None
+            if (record.removed and not record.has_violation) or now - record.last_seen > track_timeout:
+                del self.records[track_id]
+                expired.append(track_id)
+        return expired
+
+    def clear(self):
+        self.records.clear()
+        self.publish(None)
+
+    def publish(self, frame_id):
+        """Chụp bảng thành snapshot bất biến cho reader (gọi 1 lần / frame)"""
+        snapshot = {track_id: record.snapshot() for track_id, record in self.records.items()}
+        self._published = (frame_id, MappingProxyType(snapshot))
+
+    # ------------------------------------------------------------------
+    # READER (mọi thread)
+    # ------------------------------------------------------------------
+    def snapshot(self):
+        """Mapping track_id -> TrackSnapshot của lần publish() gần nhất"""
+        return self._published[1]
+
+    def lookup(self, track_id):
+        """TrackSnapshot của track (None nếu không có)"""
+        return self._published[1].get(track_id)
+
+    def visible(self):
+        """Các track xuất hiện trong frame được publish gần nhất"""
+        frame_id, snapshot = self._published
+        return [track for track in snapshot.values() if track.frame_id == frame_id and not track.removed]
+
+    def __len__(self):
+        return len(self.records)
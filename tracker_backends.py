@@ -0,0 +1,192 @@
+# tracker_backends.py
+"""
+Tracker Backends - Tách TRACKING khỏi DETECTION
+================================================
+
+CombinedDetector chỉ chạy detection thuần, rồi đưa mảng
+[x1, y1, x2, y2, score, cls] vào 1 tracker backend:
+
+- 'ocsort'      : OC-SORT của project (mặc định)
+- 'bytetrack'   : ByteTrack của project
+- 'ultralytics' : Tracker built-in của YOLO (yolo.track persist=True)
+
+Backend 'ocsort'/'bytetrack' không gắn state vào model → detection có thể
+batch / chạy song song, tracking chỉ là 1 bước tuần tự rẻ.
+"""
+import numpy as np
+
+try:
+    from oc_sort import OCSort
+    OCSORT_AVAILABLE = True
+except Exception as e:
+    OCSORT_AVAILABLE = False
+    print(f"⚠️  OC-SORT import failed: {e}")
+
+try:
+    from byte_tracker import BYTETracker
+    BYTETRACK_AVAILABLE = True
+except Exception as e:
+    BYTETRACK_AVAILABLE = False
+    print(f"⚠️  ByteTrack import failed: {e}")
+
+
+TRACKER_BACKENDS = ('ocsort', 'bytetrack', 'ultralytics')
+
+
+class TrackerBackend:
+    """
+    Interface chung cho tracker backend
+
+    Attributes:
+        name: Tên backend
+        uses_model_tracking: True nếu tracking nằm trong model (yolo.track)
+    """
+
+    name = None
+    uses_model_tracking = False
+
+    def update(self, dets):
+        """
+        Args:
+            dets: numpy array (N, 6) [x1, y1, x2, y2, score, cls] của 1 frame
+
+        Returns:
+            Dict {detection index: track_id} cho các track đang active
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """Xóa toàn bộ track (khi đổi video/camera)"""
+        raise NotImplementedError
+
+    def alive_track_ids(self):
+        """Track còn tồn tại trong tracker (tracked + lost), None nếu không biết"""
+        return None
+
+
+class OCSortBackend(TrackerBackend):
+    name = 'ocsort'
+
+    def __init__(self, det_thresh=0.25, iou_threshold=0.3, min_hits=1, max_age=30):
+        self._kwargs = dict(det_thresh=det_thresh, iou_threshold=iou_threshold,
+                            min_hits=min_hits, max_age=max_age)
+        self.tracker = OCSort(**self._kwargs)
+
+    def update(self, dets):
+        tracks = self.tracker.update(dets)
+        return {track.det_idx: track.track_id for track in tracks}
+
+    def reset(self):
+        self.tracker = OCSort(**self._kwargs)
+
+    def alive_track_ids(self):
+        return {track.track_id for track in self.tracker.tracks}
+
+
+class ByteTrackBackend(TrackerBackend):
+    name = 'bytetrack'
+
+    def __init__(self, frame_rate=30, track_thresh=0.25, track_buffer=30, match_thresh=0.4):
+        self._kwargs = dict(frame_rate=frame_rate, track_thresh=track_thresh,
+                            track_buffer=track_buffer, match_thresh=match_thresh)
+        self.tracker = BYTETracker(**self._kwargs)
+
+    def update(self, dets):
+        tracks = self.tracker.update(dets, None)
+        return {track.det_idx: track.track_id for track in tracks}
+
+    def reset(self):
+        self.tracker = BYTETracker(**self._kwargs)
+
+    def alive_track_ids(self):
+        return {track.track_id for track in self.tracker.tracks}
+
+
+class UltralyticsBackend(TrackerBackend):
+    """
+    Tracker built-in của YOLO - state nằm trong model (yolo.track persist=True),
+    KHÔNG batch được. Model phải là instance riêng (không lấy từ model registry)
+    """
+
+    name = 'ultralytics'
+    uses_model_tracking = True
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def bind(self, model):
+        """Gắn YOLO model chứa tracker"""
+        self.model = model
+
+    def track(self, frame, **kwargs):
+        """Detection + tracking trong model (persist=True giữ track giữa các frame)"""
+        return self.model.track(frame, persist=True, **kwargs)
+
+    def update(self, dets):
+        """
+        Args:
+            dets: result.boxes.data của track() - (N, 7) [x1, y1, x2, y2, id, score, cls].
+                (N, 6) = chưa có track nào được xác nhận
+
+        Returns:
+            Dict {detection index: track_id}
+        """
+        if dets is None or len(dets) == 0 or dets.shape[1] < 7:
+            return {}
+        return {i: int(track_id) for i, track_id in enumerate(dets[:, 4])}
+
+    def _trackers(self):
+        predictor = getattr(self.model, 'predictor', None)
+        return getattr(predictor, 'trackers', None) or []
+
+    def reset(self):
+        """Xoá tracker trong predictor → track ID bắt đầu lại ở nguồn mới"""
+        predictor = getattr(self.model, 'predictor', None)
+        if predictor is None or not hasattr(predictor, 'trackers'):
+            return
+        for tracker in predictor.trackers:
+            if hasattr(tracker, 'reset'):
+                tracker.reset()  # BYTETracker/BOTSORT: xoá track + reset bộ đếm ID
+        if not all(hasattr(tracker, 'reset') for tracker in predictor.trackers):
+            # Phiên bản không có reset() → bỏ trackers, track() kế tiếp tạo lại
+            del predictor.trackers
+
+    def alive_track_ids(self):
+        trackers = self._trackers()
+        if not trackers:
+            return None
+        return {track.track_id for tracker in trackers
+                for track in list(tracker.tracked_stracks) + list(tracker.lost_stracks)}
+
+
+def create_tracker_backend(name='ocsort', **kwargs):
+    """
+    Tạo tracker backend theo tên (fallback: ocsort → bytetrack → ultralytics)
+
+    Args:
+        name: 'ocsort', 'bytetrack' hoặc 'ultralytics'
+        **kwargs: Tham số truyền cho tracker
+
+    Backend 'ultralytics' cần bind(model) trước khi dùng
+    """
+    name = (name or 'ocsort').lower()
+    if name not in TRACKER_BACKENDS:
+        raise ValueError(f"Unknown tracker backend: {name} (choose from {TRACKER_BACKENDS})")
+
+    if name == 'ocsort' and not OCSORT_AVAILABLE:
+        print("⚠️  OC-SORT not available, falling back to ByteTrack")
+        name = 'bytetrack'
+    if name == 'bytetrack' and not BYTETRACK_AVAILABLE:
+        print("⚠️  ByteTrack not available, falling back to YOLO built-in tracker")
+        name = 'ultralytics'
+
+    if name == 'ocsort':
+        return OCSortBackend(**kwargs)
+    if name == 'bytetrack':
+        return ByteTrackBackend(**kwargs)
+    return UltralyticsBackend()
+
+
+def empty_detections():
+    """Mảng detections rỗng (0, 6) để tracker vẫn age các track cũ"""
+    return np.empty((0, 6), dtype=np.float32)
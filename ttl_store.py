@@ -0,0 +1,130 @@
+# ttl_store.py
+"""
+TTL Store - Dict có hạn dùng (TTL) + giới hạn số phần tử (LRU)
+===============================================================
+
+Các dict cooldown / bộ nhớ biển số (last_violation_time, plate_memory...)
+chỉ thêm chứ không bao giờ xoá → process chạy nhiều ngày thì RAM tăng mãi.
+
+NGUYÊN TẮC:
+✅ Mỗi key có hạn dùng (expires_at), hết hạn = coi như không tồn tại
+✅ Heap theo thời điểm hết hạn → set O(log n), mỗi key hết hạn dọn O(log n)
+   (heappop); entry cũ (key set lại / pop) bỏ qua khi tới đỉnh, heap quá lớn thì dựng lại
+✅ Vượt capacity → bỏ key ít dùng nhất (LRU, OrderedDict)
+✅ Thread-safe, có thống kê size / hit / miss / expired / evicted
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLStore:
+    """
+    Mapping key -> value với TTL và capacity cố định
+    """
+
+    def __init__(self, ttl, capacity=1024, clock=time.time):
+        """
+        Args:
+            ttl: Hạn dùng mặc định của 1 key (giây)
+            capacity: Số key tối đa (vượt → bỏ key ít dùng nhất)
+            clock: Hàm thời gian (mặc định time.time)
+        """
+        if ttl <= 0 or capacity <= 0:
+            raise ValueError(f"ttl and capacity must be > 0, got ttl={ttl}, capacity={capacity}")
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+
+        self._data = OrderedDict()  # key -> (value, expires_at), cuối = dùng gần nhất
+        self._heap = []             # (expires_at, seq, key) - entry cũ bỏ qua khi pop
+        self._seq = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _expire(self, now):
+        """Bỏ các key đã hết hạn (đỉnh heap), entry cũ của key đã set lại thì bỏ qua"""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(heap)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+                self.expired += 1
+
+    def _compact(self):
+        """Heap chứa quá nhiều entry cũ (key bị set lại nhiều lần) → dựng lại"""
+        if len(self._heap) > 2 * len(self._data) + 64:
+            self._heap = [(expires_at, seq, key) for seq, (key, (_, expires_at))
+                          in enumerate(self._data.items())]
+            heapq.heapify(self._heap)
+            self._seq = len(self._heap)
+
+    def get(self, key, default=None):
+        """Value của key (chưa hết hạn), đánh dấu key vừa được dùng"""
+        with self._lock:
+            self._expire(self.clock())
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Ghi key với hạn dùng ttl (None = ttl mặc định), tính lại hạn nếu key đã có"""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            expires_at = now + (self.ttl if ttl is None else ttl)
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            heapq.heappush(self._heap, (expires_at, self._seq, key))
+            self._seq += 1
+
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evicted += 1
+            self._compact()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            self._compact()
+            return default if entry is None else entry[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            self._expire(self.clock())
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self.clock())
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._heap.clear()
+            self._seq = 0
+
+    def get_stats(self):
+        """Thống kê size / hit / miss / key hết hạn / key bị bỏ do vượt capacity"""
+        with self._lock:
+            self._expire(self.clock())
+            return {
+                'size': len(self._data),
+                'capacity': self.capacity,
+                'heap_size': len(self._heap),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
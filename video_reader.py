@@ -9,6 +9,7 @@ NGUYÊN TẮC:
 ✅ FPS chỉ để tính timestamp, KHÔNG để delay
 ✅ Mọi frame được đọc đúng thứ tự
 ✅ Timestamp = frame_number / fps (KHÔNG dùng time.time())
+✅ Loop video: timestamp cộng dồn thời lượng các vòng trước (không quay về 0)
 ✅ Video reader CỰC NHẸ - chỉ đọc và push
 
 ❌ KHÔNG time.sleep()
@@ -24,6 +25,9 @@ from collections import deque
 import time
 import queue
 
+from frame_ring import FrameRing
+from frame_store import FrameStore
+
 
 class OfflineVideoReader:
     """
@@ -34,15 +38,18 @@ class OfflineVideoReader:
     """
 
     def __init__(self, video_path, detection_queue, original_frame_buffer,
-                 detection_frequency=1, detection_scale=1.0, cap_lock=None):
+                 detection_frequency=1, detection_scale=1.0, cap_lock=None, frame_store=None,
+                 motion_gate=None):
         """
         Args:
             video_path: Đường dẫn file video
             detection_queue: Queue để push frame cho detection worker
-            original_frame_buffer: Dict buffer lưu frame gốc
+            original_frame_buffer: FrameRing lưu frame gốc (dùng chung cho mọi track)
             detection_frequency: Mỗi N frame thì push vào detection_queue
             detection_scale: Scale để resize frame cho detection (0.5 = 50%)
             cap_lock: Lock để thread-safe (nếu có)
+            frame_store: FrameStore cấp handle cho frame gốc (tạo mới nếu None)
+            motion_gate: MotionGate bỏ qua detection cho frame đứng yên (None = tắt)
         """
         self.video_path = video_path
         self.detection_queue = detection_queue
@@ -50,6 +57,8 @@ class OfflineVideoReader:
         self.detection_frequency = detection_frequency
         self.detection_scale = detection_scale
         self.cap_lock = cap_lock if cap_lock else threading.Lock()
+        self.frame_store = frame_store if frame_store is not None else FrameStore()
+        self.motion_gate = motion_gate
 
         self.cap = None
         self.fps = 30.0
@@ -57,6 +66,9 @@ class OfflineVideoReader:
         self.running = False
         self.thread = None
         self.loop = True  # Mặc định loop video
+        # Thời lượng các vòng loop trước - tracker/SpeedTracker/SpeedTrap/ViolationDecider
+        # cần media timestamp tăng đơn điệu, timestamp quay về 0 = dt âm
+        self.timestamp_offset = 0.0
 
     def open_video(self):
         """Mở video và lấy thông tin"""
@@ -87,10 +99,10 @@ class OfflineVideoReader:
         """
         Tính timestamp CHÍNH XÁC từ frame number và FPS
 
-        ✅ ĐÚNG: timestamp = frame_number / fps
+        ✅ ĐÚNG: timestamp = timestamp_offset + frame_number / fps
         ❌ SAI: timestamp = time.time()
         """
-        return frame_number / self.fps
+        return self.timestamp_offset + frame_number / self.fps
 
     def reset(self):
         """Reset video về đầu để loop"""
@@ -117,15 +129,16 @@ class OfflineVideoReader:
             else:
                 return False, None, 0
 
-    def video_reader_thread(self, stream_queue_clean=None, alpr_proactive_queue=None, alpr_frequency=3, active_tracks=None, active_tracks_lock=None):
+    def video_reader_thread(self, stream_queue_clean=None, alpr_proactive_queue=None, alpr_frequency=3):
         """
-        THREAD ĐỌC VIDEO OFFLINE - DUAL-STREAM ARCHITECTURE + DIRECT FRAME BUFFERING
+        THREAD ĐỌC VIDEO OFFLINE - DUAL-STREAM ARCHITECTURE + SHARED FRAME RING
         
         Push frame vào nhiều queue:
         - stream_queue_clean: Mọi frame (web stream mượt)
         - alpr_proactive_queue: Mỗi N frame (ALPR proactive)
         - detection_queue: Mỗi detection_frequency frame (detection)
-        - original_frame_buffer[track_id]: MỌI frame cho TẤT CẢ active tracks (NEW)
+        - original_frame_buffer: MỌI frame vào 1 FrameRing duy nhất
+          (track chỉ giữ [first_seq, last_seq] → chi phí không phụ thuộc số track)
         """
         print("[VIDEO READER] 🚀 Thread started - Reading at MAXIMUM speed")
         print(f"[VIDEO READER] Detection frequency: every {self.detection_frequency} frame(s)")
@@ -134,14 +147,13 @@ class OfflineVideoReader:
             print("[VIDEO READER] ✅ Stream queue enabled (smooth web stream)")
         if alpr_proactive_queue:
             print(f"[VIDEO READER] ✅ ALPR proactive queue enabled (every {alpr_frequency} frames)")
-        if active_tracks is not None:
-            print("[VIDEO READER] ✅ Active tracks buffering enabled (direct frame buffer)")
+        print(f"[VIDEO READER] ✅ Shared frame ring enabled (capacity: {self.original_frame_buffer.capacity})")
+        if self.motion_gate is not None:
+            print(f"[VIDEO READER] ✅ Motion gate enabled (forced detection every {self.motion_gate.force_every} frames)")
 
         frame_count = 0
         frames_pushed_to_detection = 0
-
-        if 'global' not in self.original_frame_buffer:
-            self.original_frame_buffer['global'] = deque(maxlen=150)
+        timestamp = None  # Timestamp frame cuối của vòng hiện tại
 
         while self.running:
             ret, frame, frame_number = self.read_frame()
@@ -154,6 +166,12 @@ class OfflineVideoReader:
                 if self.loop:
                     print(f"[VIDEO READER] 🔄 Looping video...")
                     self.reset()  # Reset về đầu video
+                    if timestamp is not None:
+                        # Vòng mới nối tiếp vòng cũ: frame đầu = frame cuối + 1/fps
+                        self.timestamp_offset = timestamp
+                        timestamp = None
+                    if self.motion_gate is not None:
+                        self.motion_gate.reset()
                     frame_count = 0
                     frames_pushed_to_detection = 0
                     continue
@@ -162,25 +180,18 @@ class OfflineVideoReader:
 
             frame_count += 1
             timestamp = self.calculate_timestamp(frame_number)
-            original_frame = frame.copy()
+            # Đăng ký frame vào store 1 lần - các stage chỉ truyền handle, KHÔNG copy
+            original_frame = self.frame_store.put(frame)
 
             frame_data = {
-                'frame': original_frame,
+                'frame': original_frame,  # FrameHandle
                 'frame_id': frame_count,
                 'timestamp': timestamp,
                 'frame_number': frame_number  # NEW: Store frame_number for debugging
             }
 
-            # Save to global (existing)
-            self.original_frame_buffer['global'].append(frame_data)
-
-            # NEW: Save to ALL active track buffers (đảm bảo frames liên tục, không skip)
-            if active_tracks_lock:
-                with active_tracks_lock:
-                    for track_id in list(active_tracks.keys()):
-                        if track_id not in self.original_frame_buffer:
-                            self.original_frame_buffer[track_id] = deque(maxlen=150)
-                        self.original_frame_buffer[track_id].append(frame_data.copy())
+            # Lưu 1 lần vào ring chung - track ranges tự động bao phủ frame mới
+            seq = self.original_frame_buffer.append(frame_data)
 
             # 1. Push vào stream_queue_clean (MỌI FRAME - web stream mượt)
             if stream_queue_clean is not None:
@@ -197,15 +208,16 @@ class OfflineVideoReader:
             if alpr_proactive_queue is not None and frame_count % alpr_frequency == 0:
                 try:
                     alpr_proactive_queue.put({
-                        'frame': original_frame.copy(),
+                        'frame': original_frame,
                         'frame_id': frame_count,
                         'timestamp': timestamp
                     }, block=False)
                 except queue.Full:
                     pass
 
-            # 3. Push vào detection_queue (MỖI DETECTION_FREQUENCY FRAME)
-            if frame_count % self.detection_frequency == 0:
+            # 3. Push vào detection_queue (MỖI DETECTION_FREQUENCY FRAME, CÓ CHUYỂN ĐỘNG)
+            if frame_count % self.detection_frequency == 0 and (
+                    self.motion_gate is None or self.motion_gate.should_detect(frame)):
                 if self.detection_scale < 1.0:
                     h, w = frame.shape[:2]
                     detect_w = int(w * self.detection_scale)
@@ -218,9 +230,10 @@ class OfflineVideoReader:
                     if len(self.detection_queue) < self.detection_queue.maxlen:
                         self.detection_queue.append({
                             'frame': detect_frame,
-                            'original': original_frame,
+                            'original': original_frame,  # FrameHandle
                             'frame_id': frame_count,
                             'frame_number': frame_number,  # ACTUAL frame position in source video
+                            'seq': seq,  # Vị trí frame trong FrameRing
                             'timestamp': timestamp
                         })
                         frames_pushed_to_detection += 1
@@ -232,9 +245,13 @@ class OfflineVideoReader:
         print(f"[VIDEO READER] 🏁 Thread stopped")
         print(f"[VIDEO READER] Total frames read: {frame_count}")
         print(f"[VIDEO READER] Total frames sent to detection: {frames_pushed_to_detection}")
+        if self.motion_gate is not None:
+            stats = self.motion_gate.get_stats()
+            print(f"[VIDEO READER] Motion gate: skipped {stats['frames_skipped']}/{stats['frames_checked']} "
+                  f"static frames ({stats['frames_forced']} forced)")
 
-    def start(self, stream_queue_clean=None, alpr_proactive_queue=None, alpr_frequency=3, active_tracks=None, active_tracks_lock=None):
-        """Khởi động video reader thread với dual-stream support + direct frame buffering"""
+    def start(self, stream_queue_clean=None, alpr_proactive_queue=None, alpr_frequency=3):
+        """Khởi động video reader thread với dual-stream support + shared frame ring"""
         if self.running:
             print("[VIDEO READER] ⚠️  Already running")
             return
@@ -246,9 +263,7 @@ class OfflineVideoReader:
             kwargs={
                 'stream_queue_clean': stream_queue_clean,
                 'alpr_proactive_queue': alpr_proactive_queue,
-                'alpr_frequency': alpr_frequency,
-                'active_tracks': active_tracks,
-                'active_tracks_lock': active_tracks_lock
+                'alpr_frequency': alpr_frequency
             },
             daemon=True
         )
@@ -298,7 +313,7 @@ def video_reader_thread(video_path, detection_queue, original_frame_buffer,
     Args:
         video_path: Đường dẫn file video
         detection_queue: Queue để push frame cho detection worker (deque)
-        original_frame_buffer: Dict buffer lưu frame gốc
+        original_frame_buffer: FrameRing lưu frame gốc
         detection_frequency: Mỗi N frame thì push vào detection (default=1)
         detection_scale: Scale để resize frame cho detection (default=1.0)
         camera_running_flag: Dict/object có attribute 'value' để kiểm tra running state
@@ -307,7 +322,7 @@ def video_reader_thread(video_path, detection_queue, original_frame_buffer,
     Format dữ liệu frame:
         {
             "frame": numpy.ndarray,      # Frame đã resize cho detection
-            "original": numpy.ndarray,   # Frame gốc full size
+            "original": FrameHandle,     # Handle tới frame gốc full size
             "frame_id": int,             # Số thứ tự frame
             "timestamp": float           # Timestamp = frame_id / fps
         }
@@ -355,7 +370,7 @@ if __name__ == "__main__":
 
     # Setup
     detection_queue = deque(maxlen=30)
-    original_frame_buffer = {}
+    original_frame_buffer = FrameRing(capacity=150)
 
     video_path = "test_video.mp4"  # Thay bằng video của bạn
 
@@ -378,7 +393,7 @@ if __name__ == "__main__":
     while reader.running:
         time.sleep(1.0)
         queue_size = len(detection_queue)
-        buffer_size = len(original_frame_buffer.get('global', []))
+        buffer_size = len(original_frame_buffer)
         elapsed = time.time() - start_time
 
         print(f"[MONITOR] Time: {elapsed:.1f}s | Queue: {queue_size} | Buffer: {buffer_size}")
@@ -0,0 +1,181 @@
+# violation_decider.py
+"""
+Violation Decider - Quyết định vi phạm TRỄ bằng fit quỹ đạo
+============================================================
+
+Chế độ cũ: chỉ cần 1 mẫu tốc độ (đã EMA) vượt speed_limit là kích hoạt toàn
+bộ chuỗi vi phạm (ALPR, copy frame, tạo clip). Bbox rung → báo sai → tốn tài nguyên.
+
+NGUYÊN TẮC:
+✅ Mỗi track chỉ lưu quỹ đạo gọn (t, x, y) tính bằng mét, tối đa max_points điểm
+✅ Quyết định khi track đi đủ min_distance_m HOẶC khi track kết thúc
+✅ Tốc độ = fit robust vị trí theo thời gian (Theil-Sen: median các slope từng cặp điểm)
+✅ Confidence = tỉ lệ điểm inlier quanh đường fit x độ đủ dữ liệu
+✅ Mỗi track quyết định ĐÚNG 1 lần → chuỗi vi phạm chạy 1 lần / 1 xe vi phạm thật
+"""
+from collections import deque
+
+import numpy as np
+
+
+def theil_sen_velocity(times, positions):
+    """
+    Vận tốc robust (m/s) từ quỹ đạo
+
+    Args:
+        times: (N,) giây
+        positions: (N, 2) mét
+
+    Returns:
+        (velocity (2,), residuals (N,)) - residual = khoảng cách điểm tới đường fit (mét)
+    """
+    i, j = np.triu_indices(len(times), k=1)
+    dt = times[j] - times[i]
+    valid = dt > 0
+    if not np.any(valid):
+        return np.zeros(2), np.zeros(len(times))
+
+    slopes = (positions[j[valid]] - positions[i[valid]]) / dt[valid, None]
+    velocity = np.median(slopes, axis=0)
+    intercept = np.median(positions - times[:, None] * velocity, axis=0)
+    residuals = np.linalg.norm(positions - (times[:, None] * velocity + intercept), axis=1)
+    return velocity, residuals
+
+
+class ViolationDecider:
+    """
+    Gom quỹ đạo từng track và quyết định vi phạm 1 lần / track
+    """
+
+    def __init__(self, min_distance_m=8.0, min_points=5, end_gap=1.0, max_points=64,
+                 inlier_tolerance_m=0.75, min_confidence=0.5):
+        """
+        Args:
+            min_distance_m: Quãng đường tối thiểu (mét) trước khi quyết định sớm
+            min_points: Số điểm tối thiểu để fit
+            end_gap: Track không xuất hiện quá end_gap giây (media time) = kết thúc
+            max_points: Số điểm quỹ đạo tối đa giữ lại mỗi track
+            inlier_tolerance_m: Residual tối đa để 1 điểm được coi là inlier
+            min_confidence: Confidence tối thiểu để kết luận vi phạm
+        """
+        self.min_distance_m = min_distance_m
+        self.min_points = min_points
+        self.end_gap = end_gap
+        self.max_points = max_points
+        self.inlier_tolerance_m = inlier_tolerance_m
+        self.min_confidence = min_confidence
+
+        self.trajectories = {}  # track_id -> deque[(t, x, y)]
+        self.last_seen = {}     # track_id -> (timestamp, payload) của lần xuất hiện cuối
+        self.decided = set()    # track đã quyết định - bỏ qua tới khi track biến mất
+
+    def fit(self, track_id):
+        """
+        Fit quỹ đạo của track
+
+        Returns:
+            (speed_kmh, confidence) hoặc (None, 0.0) nếu chưa đủ điểm
+        """
+        trajectory = self.trajectories.get(track_id)
+        if trajectory is None or len(trajectory) < self.min_points:
+            return None, 0.0
+
+        data = np.asarray(trajectory, dtype=np.float64)
+        velocity, residuals = theil_sen_velocity(data[:, 0], data[:, 1:])
+        inlier_ratio = float(np.mean(residuals <= self.inlier_tolerance_m))
+        coverage = min(1.0, len(data) / (2.0 * self.min_points))
+        speed_kmh = float(np.hypot(*velocity) * 3.6)
+        return round(speed_kmh, 2), round(inlier_ratio * coverage, 3)
+
+    def _decision(self, track_id, speed_limit, payload, reason):
+        speed, confidence = self.fit(track_id)
+        self.decided.add(track_id)
+        return {
+            'track_id': track_id,
+            'speed': speed,
+            'confidence': confidence,
+            'violation': speed is not None and speed > speed_limit and confidence >= self.min_confidence,
+            'reason': reason,
+            'payload': payload,
+        }
+
+    def update(self, track_ids, positions_m, timestamp, speed_limit, payloads=None):
+        """
+        Thêm vị trí của các track trong 1 frame và trả về các quyết định mới
+
+        Args:
+            track_ids: List track_id
+            positions_m: (N, 2) vị trí mét (SpeedTracker.to_meters)
+            timestamp: Media timestamp của frame (giây)
+            speed_limit: Giới hạn tốc độ hiện tại (km/h)
+            payloads: List dữ liệu kèm theo mỗi track (detection, frame handle...)
+                      - được trả lại trong quyết định để chạy chuỗi vi phạm
+
+        Returns:
+            List dict {'track_id', 'speed', 'confidence', 'violation', 'reason', 'payload'}
+        """
+        decisions = []
+        payloads = payloads if payloads is not None else [None] * len(track_ids)
+
+        for track_id, (x, y), payload in zip(track_ids, np.asarray(positions_m).reshape(-1, 2), payloads):
+            self.last_seen[track_id] = (timestamp, payload)
+            if track_id in self.decided:
+                continue
+
+            trajectory = self.trajectories.get(track_id)
+            if trajectory is None:
+                trajectory = deque(maxlen=self.max_points)
+                self.trajectories[track_id] = trajectory
+            trajectory.append((timestamp, float(x), float(y)))
+
+            # Quyết định sớm khi đã đi đủ xa (xe vẫn còn trong khung hình)
+            _, x0, y0 = trajectory[0]
+            if len(trajectory) >= self.min_points and np.hypot(x - x0, y - y0) >= self.min_distance_m:
+                decisions.append(self._decision(track_id, speed_limit, payload, 'distance'))
+
+        decisions.extend(self._finish_ended(timestamp, speed_limit))
+        return decisions
+
+    def _finish_ended(self, timestamp, speed_limit):
+        """Quyết định cho các track đã quá end_gap, đóng quỹ đạo của chúng"""
+        decisions = []
+        ended = [tid for tid, (seen, _) in self.last_seen.items()
+                 if timestamp - seen > self.end_gap or timestamp < seen]
+        for track_id in ended:
+            decision = self._close(track_id, speed_limit)
+            if decision is not None:
+                decisions.append(decision)
+        return decisions
+
+    def _close(self, track_id, speed_limit):
+        """
+        Quyết định nếu chưa quyết định và bỏ quỹ đạo - GIỮ decided vì track
+        có thể chỉ bị che khuất rồi xuất hiện lại (chưa có event track_removed)
+        """
+        seen = self.last_seen.pop(track_id, None)
+        decision = None
+        if seen is not None and track_id not in self.decided:
+            decision = self._decision(track_id, speed_limit, seen[1], 'track_end')
+            if decision['speed'] is None:
+                self.decided.discard(track_id)  # Chưa đủ điểm → chưa tính là đã quyết định
+                decision = None
+        self.trajectories.pop(track_id, None)
+        return decision
+
+    def finish(self, track_id, speed_limit):
+        """
+        Track kết thúc (event track_removed): quyết định nếu chưa quyết định,
+        xoá toàn bộ state của track
+
+        Returns:
+            Dict quyết định hoặc None (đã quyết định / chưa đủ điểm)
+        """
+        decision = self._close(track_id, speed_limit)
+        self.decided.discard(track_id)
+        return decision
+
+    def reset(self):
+        """Xoá toàn bộ quỹ đạo (khi đổi nguồn)"""
+        self.trajectories.clear()
+        self.last_seen.clear()
+        self.decided.clear()